@@ -1,15 +1,11 @@
 import hashlib
-import sqlite3
+from Core.database import get_user_password_hash
 
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
 def authenticate_user(username, password):
-    conn = sqlite3.connect('devops_assistant.db')
-    c = conn.cursor()
-    c.execute("SELECT password FROM users WHERE username = ?", (username,))
-    result = c.fetchone()
-    conn.close()
-    if result and result[0] == hash_password(password):
+    stored = get_user_password_hash(username)
+    if stored and stored == hash_password(password):
         return True
-    return False
\ No newline at end of file
+    return False
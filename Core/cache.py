@@ -0,0 +1,102 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from Core.database import get_cached_response, save_cached_response, evict_cached_responses
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DEFAULT_MEMORY_ENTRIES = 512  # Responses kept in the in-process LRU
+DEFAULT_PERSISTENT_ENTRIES = 10000  # Responses kept in SQLite
+DEFAULT_CACHE_TTL = 7 * 24 * 3600  # Seconds before a cached response is regenerated
+EVICTION_INTERVAL = 100  # Persistent eviction runs once every N writes
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """Fold case, punctuation and whitespace so trivially different phrasings share a key."""
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", question.casefold())).strip()
+
+
+def make_cache_key(question: str, model_name: str, prompt_version: str) -> str:
+    """Build the cache key from the normalized question, model name and prompt-template version."""
+    raw = "\x1f".join((normalize_question(question), model_name or "", prompt_version))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier cache for model responses.
+
+    An in-memory LRU sits in front of the ``response_cache`` SQLite table, so
+    restarts and other Streamlit worker processes still get warm hits. Both tiers
+    expire entries after ``ttl`` seconds and are bounded in size.
+    """
+
+    def __init__(self, max_memory_entries: int = DEFAULT_MEMORY_ENTRIES,
+                 max_persistent_entries: int = DEFAULT_PERSISTENT_ENTRIES,
+                 ttl: float = DEFAULT_CACHE_TTL):
+        self.max_memory_entries = max_memory_entries
+        self.max_persistent_entries = max_persistent_entries
+        self.ttl = ttl
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, question: str, model_name: str, prompt_version: str) -> Optional[str]:
+        key = make_cache_key(question, model_name, prompt_version)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                response, stored_at = entry
+                if time.time() - stored_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return response
+                del self._memory[key]
+        try:
+            cached = get_cached_response(key, ttl=self.ttl)
+        except Exception as e:
+            logger.warning(f"Persistent cache lookup failed: {e}")
+            cached = None
+        with self._lock:
+            if cached is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            response, created_at = cached
+            # Keep the row's age so a promoted entry expires when the persistent one does.
+            self._remember(key, response, created_at)
+        return response
+
+    def set(self, question: str, model_name: str, prompt_version: str, response: str) -> None:
+        key = make_cache_key(question, model_name, prompt_version)
+        with self._lock:
+            self._remember(key, response)
+            self._writes += 1
+            evict = self._writes % EVICTION_INTERVAL == 0
+        try:
+            save_cached_response(key, question, model_name, prompt_version, response)
+            if evict:
+                evict_cached_responses(self.max_persistent_entries, self.ttl)
+        except Exception as e:
+            logger.warning(f"Persistent cache write failed: {e}")
+
+    def clear_memory(self) -> None:
+        with self._lock:
+            self._memory.clear()
+
+    def _remember(self, key: str, response: str, stored_at: Optional[float] = None) -> None:
+        self._memory[key] = (response, time.time() if stored_at is None else stored_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
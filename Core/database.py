@@ -1,40 +1,473 @@
+import atexit
+import logging
+import queue
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 
+from Core.metrics import observe
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'devops_assistant.db'
+POOL_SIZE = 8  # Connections shared by all threads of the process
+HISTORY_BATCH_SIZE = 500  # History rows written per transaction
+HISTORY_FLUSH_INTERVAL = 0.5  # Seconds the writer waits to fill a batch
+HISTORY_QUEUE_SIZE = 10000  # Pending history rows before save_command_history blocks
+DEFAULT_HISTORY_PAGE_SIZE = 50
+CACHE_STATS_BUCKET = 3600  # Seconds per cache hit rate bucket
+DEFAULT_SUMMARY_ROWS = 10  # Rows returned by the history summary queries
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA mmap_size=268435456",
+)
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version.
+MIGRATIONS = [
+    [
+        '''CREATE TABLE IF NOT EXISTS command_history
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            question TEXT,
+            response TEXT,
+            timestamp DATETIME)''',
+        '''CREATE TABLE IF NOT EXISTS response_cache
+           (cache_key TEXT PRIMARY KEY,
+            question TEXT,
+            model TEXT,
+            prompt_version TEXT,
+            response TEXT,
+            created_at REAL,
+            last_hit REAL,
+            hits INTEGER DEFAULT 0)''',
+        "CREATE INDEX IF NOT EXISTS idx_response_cache_last_hit ON response_cache (last_hit)",
+        '''CREATE TABLE IF NOT EXISTS semantic_cache
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            question TEXT,
+            model TEXT,
+            prompt_version TEXT,
+            embedder TEXT,
+            embedding BLOB,
+            response TEXT,
+            created_at REAL)''',
+        '''CREATE TABLE IF NOT EXISTS users
+           (username TEXT PRIMARY KEY,
+            password TEXT)''',
+    ],
+    [
+        "CREATE INDEX IF NOT EXISTS idx_command_history_question ON command_history (question, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_command_history_timestamp ON command_history (timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_response_cache_created_at ON response_cache (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_semantic_cache_created_at ON semantic_cache (created_at)",
+    ],
+    [
+        # Full-text index over questions and responses, kept in step with command_history by triggers.
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS command_history_fts USING fts5
+           (question, response, content='command_history', content_rowid='id', tokenize='porter unicode61')''',
+        "INSERT INTO command_history_fts (command_history_fts) VALUES ('rebuild')",
+        # Summary tables, updated with every write so the history page never scans command_history.
+        '''CREATE TABLE IF NOT EXISTS history_question_stats
+           (question_key TEXT PRIMARY KEY,
+            question TEXT,
+            asks INTEGER NOT NULL,
+            last_asked DATETIME)''',
+        "CREATE INDEX IF NOT EXISTS idx_history_question_stats_asks ON history_question_stats (asks DESC)",
+        '''INSERT INTO history_question_stats (question_key, question, asks, last_asked)
+           SELECT lower(trim(question)), question, count(*), max(timestamp) FROM command_history
+           GROUP BY lower(trim(question))''',
+        '''CREATE TRIGGER IF NOT EXISTS command_history_after_insert AFTER INSERT ON command_history BEGIN
+               INSERT INTO command_history_fts (rowid, question, response) VALUES (new.id, new.question, new.response);
+               INSERT INTO history_question_stats (question_key, question, asks, last_asked)
+               VALUES (lower(trim(new.question)), new.question, 1, new.timestamp)
+               ON CONFLICT (question_key) DO UPDATE SET
+                   asks = asks + 1, question = excluded.question, last_asked = excluded.last_asked;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS command_history_after_delete AFTER DELETE ON command_history BEGIN
+               INSERT INTO command_history_fts (command_history_fts, rowid, question, response)
+               VALUES ('delete', old.id, old.question, old.response);
+               UPDATE history_question_stats SET asks = asks - 1 WHERE question_key = lower(trim(old.question));
+               DELETE FROM history_question_stats WHERE question_key = lower(trim(old.question)) AND asks <= 0;
+           END''',
+        '''CREATE TABLE IF NOT EXISTS cache_stats
+           (bucket INTEGER,
+            tier TEXT,
+            hits INTEGER NOT NULL,
+            misses INTEGER NOT NULL,
+            PRIMARY KEY (bucket, tier))''',
+        '''CREATE TABLE IF NOT EXISTS command_stats
+           (command TEXT PRIMARY KEY,
+            runs INTEGER NOT NULL,
+            failures INTEGER NOT NULL,
+            total_seconds REAL NOT NULL,
+            max_seconds REAL NOT NULL,
+            last_run REAL)''',
+        "CREATE INDEX IF NOT EXISTS idx_command_stats_mean ON command_stats (total_seconds / runs DESC)",
+    ],
+    [
+        # Host telemetry, one row per chunk of samples: float64 timestamps and a float32 matrix, both raw bytes.
+        """CREATE TABLE IF NOT EXISTS telemetry_chunks
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            host TEXT,
+            fields TEXT,
+            started_at REAL,
+            ended_at REAL,
+            timestamps BLOB,
+            samples BLOB)""",
+        "CREATE INDEX IF NOT EXISTS idx_telemetry_chunks_host ON telemetry_chunks (host, ended_at)",
+        "CREATE INDEX IF NOT EXISTS idx_telemetry_chunks_ended_at ON telemetry_chunks (ended_at)",
+    ],
+]
+
+HISTORY_INSERT = "INSERT INTO command_history (question, response, timestamp) VALUES (?, ?, ?)"
+CACHE_STATS_UPSERT = (
+    "INSERT INTO cache_stats (bucket, tier, hits, misses) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (bucket, tier) DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses"
+)
+CACHE_HIT_UPDATE = "UPDATE response_cache SET last_hit = max(last_hit, ?), hits = hits + 1 WHERE cache_key = ?"
+COMMAND_STATS_UPSERT = (
+    "INSERT INTO command_stats (command, runs, failures, total_seconds, max_seconds, last_run) "
+    "VALUES (?, 1, ?, ?, ?, ?) "
+    "ON CONFLICT (command) DO UPDATE SET runs = runs + 1, failures = failures + excluded.failures, "
+    "total_seconds = total_seconds + excluded.total_seconds, "
+    "max_seconds = max(max_seconds, excluded.max_seconds), last_run = excluded.last_run"
+)
+
+
+class ConnectionPool:
+    """Thread-safe pool of SQLite connections configured for WAL and concurrent readers."""
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._slots = threading.Semaphore(size)
+        self._lock = threading.Lock()
+        self._all = []
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        with self._lock:
+            self._all.append(conn)
+        return conn
+
+    @contextmanager
+    def connection(self, write=True):
+        """
+        Borrow a connection. Writers run in a ``BEGIN IMMEDIATE`` transaction committed on
+        success, so they queue on busy_timeout instead of failing on a lock upgrade; readers
+        run in autocommit mode and never block writers under WAL.
+        """
+        started = time.perf_counter()
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            try:
+                if write:
+                    conn.execute("BEGIN IMMEDIATE")
+                yield conn
+                if write:
+                    conn.execute("COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            finally:
+                self._idle.put_nowait(conn)
+        finally:
+            self._slots.release()
+            observe("sqlite", time.perf_counter() - started, op="write" if write else "read")
+
+    def close(self):
+        with self._lock:
+            for conn in self._all:
+                try:
+                    conn.close()
+                except Exception as e:
+                    logger.debug(f"Error while closing SQLite connection: {e}")
+            self._all.clear()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool, creating it and migrating the schema on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = ConnectionPool(DB_PATH)
+                migrate(pool)
+                _pool = pool
+    return _pool
+
+
+def close_pool():
+    """Flush pending history writes and close all pooled connections (e.g. before switching DB_PATH)."""
+    global _pool
+    flush_history()
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def migrate(pool):
+    with pool.connection() as conn:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {number}")
+            logger.info(f"Applied database migration {number}")
+
+
 # Initialize SQLite database
 def init_db():
-    conn = sqlite3.connect('devops_assistant.db')
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS command_history
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                  question TEXT, 
-                  response TEXT, 
-                  timestamp DATETIME)''')
-    conn.commit()
-    conn.close()
-
-init_db()
-
-def save_command_history(question, response):
-    conn = sqlite3.connect('devops_assistant.db')
-    c = conn.cursor()
-    c.execute("INSERT INTO command_history (question, response, timestamp) VALUES (?, ?, ?)",
-              (question, response, datetime.now()))
-    conn.commit()
-    conn.close()
-
-def get_cached_response(question):
-    conn = sqlite3.connect('devops_assistant.db')
-    c = conn.cursor()
-    c.execute("SELECT response FROM command_history WHERE question = ? ORDER BY timestamp DESC LIMIT 1", (question,))
-    result = c.fetchone()
-    conn.close()
-    return result[0] if result else None
+    get_pool()
+
+
+class HistoryWriter:
+    """
+    Background thread that batches command history inserts, and the statistics rows
+    that go with them, into few transactions.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=HISTORY_QUEUE_SIZE)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, statement, row, block=True):
+        """
+        Queue ``row`` for ``statement``; with ``block=False`` return False instead of
+        waiting when the queue is full.
+        """
+        self._ensure_started()
+        try:
+            self._queue.put((statement, row), block=block)
+        except queue.Full:
+            return False
+        return True
+
+    def flush(self):
+        """Block until every submitted row has been written."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+                    self._thread.start()
 
-def get_command_history():
-    conn = sqlite3.connect('devops_assistant.db')
-    c = conn.cursor()
-    c.execute("SELECT * FROM command_history ORDER BY timestamp DESC")
-    history = c.fetchall()
-    conn.close()
-    return history
\ No newline at end of file
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + HISTORY_FLUSH_INTERVAL
+            while len(batch) < HISTORY_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=max(remaining, 0)) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            rows_by_statement = {}
+            for statement, row in batch:
+                rows_by_statement.setdefault(statement, []).append(row)
+            try:
+                with get_pool().connection() as conn:
+                    for statement, rows in rows_by_statement.items():
+                        conn.executemany(statement, rows)
+            except Exception as e:
+                logger.error(f"Failed to write {len(batch)} command history rows: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+
+_history_writer = HistoryWriter()
+atexit.register(lambda: _history_writer.flush())
+
+
+def save_command_history(question, response, block=True):
+    """
+    Queue a history row; it is written asynchronously in a batch.
+
+    When the writer is ``HISTORY_QUEUE_SIZE`` rows behind, this blocks until there is
+    room, or returns False right away if ``block`` is False.
+    """
+    return _history_writer.submit(HISTORY_INSERT, (question, response, datetime.now()), block=block)
+
+def record_cache_lookup(tier, hit):
+    """Count a cache lookup in the hourly hit rate table. Dropped, never waited on, when the writer is behind."""
+    bucket = int(time.time() // CACHE_STATS_BUCKET * CACHE_STATS_BUCKET)
+    if not _history_writer.submit(CACHE_STATS_UPSERT, (bucket, tier, int(hit), int(not hit)), block=False):
+        logger.debug("History writer is behind; dropped a cache statistics row.")
+
+def record_command_run(command, seconds, failed=False):
+    """Add one run of ``command`` to the command statistics. Dropped, never waited on, when the writer is behind."""
+    row = (command, int(failed), seconds, seconds, time.time())
+    if not _history_writer.submit(COMMAND_STATS_UPSERT, row, block=False):
+        logger.debug("History writer is behind; dropped a command statistics row.")
+
+def flush_history():
+    _history_writer.flush()
+
+def get_cached_response(cache_key, ttl=None):
+    """
+    Return ``(response, created_at)`` for ``cache_key``, or None if there is none or it is
+    older than ``ttl`` seconds.
+
+    The hit is counted through the history writer, so a lookup never waits for the write
+    lock; expired rows are left to ``evict_cached_responses``.
+    """
+    with get_pool().connection(write=False) as conn:
+        result = conn.execute("SELECT response, created_at FROM response_cache WHERE cache_key = ?",
+                              (cache_key,)).fetchone()
+    if result is None or (ttl is not None and time.time() - result[1] > ttl):
+        return None
+    if not _history_writer.submit(CACHE_HIT_UPDATE, (time.time(), cache_key), block=False):
+        logger.debug("History writer is behind; dropped a cache hit update.")
+    return result[0], result[1]
+
+def save_cached_response(cache_key, question, model, prompt_version, response):
+    now = time.time()
+    with get_pool().connection() as conn:
+        conn.execute("INSERT OR REPLACE INTO response_cache "
+                     "(cache_key, question, model, prompt_version, response, created_at, last_hit, hits) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                     (cache_key, question, model, prompt_version, response, now, now))
+
+def evict_cached_responses(max_entries=None, ttl=None):
+    """Drop expired entries and keep at most ``max_entries`` most recently hit ones."""
+    with get_pool().connection() as conn:
+        if ttl is not None:
+            conn.execute("DELETE FROM response_cache WHERE created_at < ?", (time.time() - ttl,))
+        if max_entries is not None:
+            conn.execute("DELETE FROM response_cache WHERE cache_key NOT IN "
+                         "(SELECT cache_key FROM response_cache ORDER BY last_hit DESC LIMIT ?)", (max_entries,))
+
+def get_command_history(limit=DEFAULT_HISTORY_PAGE_SIZE, before_id=None):
+    """
+    Return one page of history rows ``(id, question, response, timestamp)``, newest first.
+
+    Pass the id of the last row of a page as ``before_id`` to get the next page. Paging
+    walks the primary key, so every page costs the same no matter how deep it is.
+    """
+    with get_pool().connection(write=False) as conn:
+        if before_id is None:
+            cursor = conn.execute("SELECT id, question, response, timestamp FROM command_history "
+                                  "ORDER BY id DESC LIMIT ?", (limit,))
+        else:
+            cursor = conn.execute("SELECT id, question, response, timestamp FROM command_history "
+                                  "WHERE id < ? ORDER BY id DESC LIMIT ?", (before_id, limit))
+        return cursor.fetchall()
+
+def _fts_query(text):
+    """
+    Turn free text into an FTS5 query: every word must match, as a quoted string so
+    characters such as ``-`` or ``:`` are not read as query syntax, and the last word
+    also matches as a prefix while it is being typed.
+    """
+    words = ['"' + word.replace('"', '""') + '"' for word in text.split()]
+    if not words:
+        return None
+    words[-1] += "*"
+    return " ".join(words)
+
+def search_command_history(query, limit=DEFAULT_HISTORY_PAGE_SIZE, before_id=None):
+    """
+    Return one page of history rows ``(id, question, response, timestamp)`` whose question
+    or response contains every word of ``query``, newest first.
+
+    Uses the full-text index and pages by id like ``get_command_history``; an empty
+    query returns the plain history page.
+    """
+    match = _fts_query(query or "")
+    if match is None:
+        return get_command_history(limit, before_id)
+    with get_pool().connection(write=False) as conn:
+        return conn.execute("SELECT h.id, h.question, h.response, h.timestamp FROM command_history_fts "
+                            "JOIN command_history h ON h.id = command_history_fts.rowid "
+                            "WHERE command_history_fts MATCH ? AND command_history_fts.rowid < ? "
+                            "ORDER BY command_history_fts.rowid DESC LIMIT ?",
+                            (match, before_id if before_id is not None else 2 ** 63 - 1, limit)).fetchall()
+
+def get_frequent_questions(limit=DEFAULT_SUMMARY_ROWS):
+    """Return ``(question, asks, last_asked)`` for the most often asked questions (compared case-insensitively)."""
+    with get_pool().connection(write=False) as conn:
+        return conn.execute("SELECT question, asks, last_asked FROM history_question_stats "
+                            "ORDER BY asks DESC LIMIT ?", (limit,)).fetchall()
+
+def get_cache_hit_rates(since=None):
+    """Return ``(bucket, tier, hits, misses)`` per hour and cache tier, oldest first, optionally from ``since`` (epoch seconds)."""
+    with get_pool().connection(write=False) as conn:
+        return conn.execute("SELECT bucket, tier, hits, misses FROM cache_stats WHERE bucket >= ? "
+                            "ORDER BY bucket, tier", (since or 0,)).fetchall()
+
+def get_slowest_commands(limit=DEFAULT_SUMMARY_ROWS):
+    """Return ``(command, runs, failures, mean_seconds, max_seconds, last_run)``, slowest on average first."""
+    with get_pool().connection(write=False) as conn:
+        return conn.execute("SELECT command, runs, failures, total_seconds / runs, max_seconds, last_run "
+                            "FROM command_stats ORDER BY total_seconds / runs DESC LIMIT ?", (limit,)).fetchall()
+
+def save_telemetry_chunk(host, fields, started_at, ended_at, timestamps, samples):
+    """
+    Store a chunk of telemetry samples taken between ``started_at`` and ``ended_at``:
+    ``timestamps`` as float64 bytes and ``samples`` as float32 bytes, one row of
+    ``fields`` per timestamp.
+    """
+    with get_pool().connection() as conn:
+        conn.execute("INSERT INTO telemetry_chunks (host, fields, started_at, ended_at, timestamps, samples) "
+                     "VALUES (?, ?, ?, ?, ?, ?)",
+                     (host, ",".join(fields), started_at, ended_at, timestamps, samples))
+
+def load_telemetry_chunks(host, since=0):
+    """Return ``(fields, timestamps, samples)`` for every chunk of ``host`` that ends after ``since``, oldest first."""
+    with get_pool().connection(write=False) as conn:
+        rows = conn.execute("SELECT fields, timestamps, samples FROM telemetry_chunks "
+                            "WHERE host = ? AND ended_at >= ? ORDER BY ended_at", (host, since)).fetchall()
+    return [(fields.split(","), timestamps, samples) for fields, timestamps, samples in rows]
+
+def evict_telemetry(before):
+    """Drop telemetry chunks of every host that ended before ``before`` (epoch seconds)."""
+    with get_pool().connection() as conn:
+        conn.execute("DELETE FROM telemetry_chunks WHERE ended_at < ?", (before,))
+
+def save_semantic_entry(question, model, prompt_version, embedder, embedding, response):
+    """Store a question embedding (raw float32 bytes) and its response for the semantic cache."""
+    with get_pool().connection() as conn:
+        conn.execute("INSERT INTO semantic_cache (question, model, prompt_version, embedder, embedding, response, created_at) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     (question, model, prompt_version, embedder, embedding, response, time.time()))
+
+def evict_semantic_entries(max_entries=None, ttl=None):
+    """Drop semantic cache entries older than ``ttl`` seconds and keep at most ``max_entries`` newest ones."""
+    with get_pool().connection() as conn:
+        if ttl is not None:
+            conn.execute("DELETE FROM semantic_cache WHERE created_at < ?", (time.time() - ttl,))
+        if max_entries is not None:
+            conn.execute("DELETE FROM semantic_cache WHERE id NOT IN "
+                         "(SELECT id FROM semantic_cache ORDER BY created_at DESC LIMIT ?)", (max_entries,))
+
+def load_semantic_entries(min_created_at=0):
+    with get_pool().connection(write=False) as conn:
+        return conn.execute("SELECT question, model, prompt_version, embedder, embedding, response, created_at FROM semantic_cache "
+                            "WHERE created_at >= ? ORDER BY id", (min_created_at,)).fetchall()
+
+def get_user_password_hash(username):
+    with get_pool().connection(write=False) as conn:
+        result = conn.execute("SELECT password FROM users WHERE username = ?", (username,)).fetchone()
+    return result[0] if result else None
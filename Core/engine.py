@@ -0,0 +1,486 @@
+import asyncio
+import contextvars
+import logging
+import queue
+import sys
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from Core.exceptions import CommandExecutionError, EngineOverloadedError, InvalidResponseError
+from Core.ssh_pool import PooledSSHSession, SSHLike, borrow_channel
+from Core.planner import plan_command_batches
+from Core.parser import StreamingFenceParser
+from Core.database import save_command_history
+from Core.metrics import span, observe, inc
+from Core.func import (
+    CHANNEL_POLL_INTERVAL,
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_COMMAND_TIMEOUT,
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_MAX_OUTPUT_BYTES,
+    RETRY_PROMPT_PREFIX,
+    build_prompt,
+    ChannelReader,
+    CommandRun,
+    cached_command_result,
+    check_command_allowed,
+    replay_cached_output,
+    extract_commands,
+    _cache_response,
+    _generate_bash_commands,
+    _lookup_cached_response,
+    _run_in_shell,
+)
+from Core.shell_session import ShellSession
+
+if TYPE_CHECKING:
+    import paramiko
+    from langchain_ollama import OllamaLLM
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DEFAULT_MAX_IN_FLIGHT = 64  # Requests executing at once across all sessions
+DEFAULT_MAX_QUEUED = 256  # Requests waiting for a slot before new ones are rejected
+DEFAULT_BLOCKING_WORKERS = 32  # Threads for calls without an async API (SQLite, embeddings, channel setup)
+RELAY_POLL_INTERVAL = 0.05  # Seconds between checks for relayed callbacks in the sync facade
+DEFAULT_CHANNELS_PER_CLIENT = 8  # Concurrent channels opened on a plain (unpooled) SSHClient
+
+
+async def _wait_readable(channel, timeout: float) -> None:
+    """Wait until ``channel`` has stdout/stderr data or closes, without holding a thread."""
+    loop = asyncio.get_running_loop()
+    ready = loop.create_future()
+    try:
+        # paramiko signals new data on either stream through a pipe exposed as fileno().
+        fd = channel.fileno()
+        loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+    except NotImplementedError:
+        # Proactor loops (Windows) have no add_reader; fall back to short sleeps.
+        await asyncio.sleep(min(timeout, RELAY_POLL_INTERVAL))
+        return
+    try:
+        await asyncio.wait_for(ready, timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        loop.remove_reader(fd)
+
+
+# Held weakly, so slots go away with their event loop or plain SSHClient instead of piling up.
+_pool_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[tuple, asyncio.Semaphore]]" = \
+    weakref.WeakKeyDictionary()
+_client_slots: "weakref.WeakKeyDictionary[paramiko.SSHClient, weakref.WeakKeyDictionary]" = weakref.WeakKeyDictionary()
+
+
+def _channel_slots_for(ssh: SSHLike) -> asyncio.Semaphore:
+    """
+    Per-connection limit matching what the SSH pool can hand out at once.
+
+    Waiting here instead of in the pool's blocking checkout keeps worker threads free
+    for the requests that do hold a channel.
+    """
+    loop = asyncio.get_running_loop()
+    if isinstance(ssh, PooledSSHSession):
+        by_key = _pool_slots.setdefault(loop, {})
+        slots = by_key.get(ssh.key)
+        if slots is None:
+            slots = by_key[ssh.key] = asyncio.Semaphore(ssh.pool.max_sessions_per_host * ssh.pool.channels_per_session)
+        return slots
+    by_loop = _client_slots.setdefault(ssh, weakref.WeakKeyDictionary())
+    slots = by_loop.get(loop)
+    if slots is None:
+        slots = by_loop[loop] = asyncio.Semaphore(DEFAULT_CHANNELS_PER_CLIENT)
+    return slots
+
+
+@asynccontextmanager
+async def _aborrow_channel(ssh: SSHLike) -> AsyncIterator["paramiko.Channel"]:
+    async with _channel_slots_for(ssh):
+        # Pool checkout, channel open and close (with the pool's keepalive probe) are blocking
+        # round trips; only they run on a worker thread.
+        manager = borrow_channel(ssh)
+        channel = await asyncio.to_thread(manager.__enter__)
+        try:
+            yield channel
+        except BaseException:
+            if not await asyncio.to_thread(manager.__exit__, *sys.exc_info()):
+                raise
+        else:
+            await asyncio.to_thread(manager.__exit__, None, None, None)
+
+
+async def astream_ssh_command(ssh: SSHLike, command: str, timeout: float = DEFAULT_COMMAND_TIMEOUT,
+                              max_bytes: int = DEFAULT_MAX_OUTPUT_BYTES,
+                              chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Async counterpart of ``stream_ssh_command``, yielding the same chunks.
+
+    The channel is read from the event loop as data arrives, so a long-running command
+    costs no thread while it waits. Cancelling the consuming task closes the channel.
+
+    Raises:
+        CommandExecutionError: If the command is rejected or the channel fails.
+    """
+    check_command_allowed(command)
+
+    deadline = time.monotonic() + timeout
+    started = time.perf_counter()
+    reader = None
+    try:
+        async with _aborrow_channel(ssh) as channel:
+            await asyncio.to_thread(channel.exec_command, command)
+            observe("ssh_channel_open", time.perf_counter() - started)
+            channel.setblocking(0)
+            reader = ChannelReader(channel, command, timeout, deadline, max_bytes, chunk_size)
+            while True:
+                for chunk in reader.read():
+                    yield chunk
+                wait_time = reader.wait_time()
+                if wait_time is None:
+                    break
+                if wait_time:
+                    await _wait_readable(channel, wait_time)
+            for chunk in reader.drain():
+                yield chunk
+    except CommandExecutionError:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to execute command: {command}\nError: {e}")
+        raise CommandExecutionError(f"Command execution failed: {e}")
+    finally:
+        observe("ssh_command", time.perf_counter() - started)
+        if reader is not None:
+            reader.record()
+
+    yield reader.exit_chunk()
+
+
+async def aexecute_ssh_command(ssh: SSHLike, command: str, timeout: float = DEFAULT_COMMAND_TIMEOUT,
+                               max_bytes: int = DEFAULT_MAX_OUTPUT_BYTES,
+                               on_output: Optional[Callable[[str, str], None]] = None,
+                               refresh: bool = False) -> Dict[str, Any]:
+    """
+    Async counterpart of ``execute_ssh_command``, sharing its ``result_cache``.
+
+    The result cache and the SQLite command stats are touched on worker threads, so
+    the shared loop never blocks on their locks or on disk.
+    """
+    cached = None if refresh else await asyncio.to_thread(cached_command_result, command, ssh)
+    if cached is not None:
+        replay_cached_output(cached, on_output)
+        return cached
+    run = CommandRun(ssh, command, on_output)
+    await asyncio.to_thread(run.begin)
+    chunks = astream_ssh_command(ssh, command, timeout=timeout, max_bytes=max_bytes)
+    try:
+        async for chunk in chunks:
+            run.add(chunk)
+        result = run.complete()
+    finally:
+        await chunks.aclose()
+        await asyncio.to_thread(run.finish)
+    logger.info(f"Command executed: {command}\nResult: {result}")
+    return result
+
+
+async def _arun_command(ssh: SSHLike, command: str,
+                        on_output: Optional[Callable[[str, str], None]] = None,
+                        timeout: float = DEFAULT_COMMAND_TIMEOUT, refresh: bool = False) -> Dict[str, Any]:
+    logger.info(f"Executing on remote server: {command}")
+    try:
+        return await aexecute_ssh_command(ssh, command, timeout=timeout, on_output=on_output, refresh=refresh)
+    except CommandExecutionError as e:
+        logger.error(f"Command execution failed: {e}")
+        return {"command": command, "error": str(e)}
+
+
+async def aextract_and_execute_commands(response: str, ssh: SSHLike,
+                                        on_output: Optional[Callable[[str, str, str], None]] = None,
+                                        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                                        timeout: float = DEFAULT_COMMAND_TIMEOUT,
+                                        refresh: bool = False,
+                                        shell: Optional[ShellSession] = None) -> List[Dict[str, Any]]:
+    """
+    Async counterpart of ``extract_and_execute_commands``.
+
+    Batches from ``plan_command_batches`` run as concurrent tasks instead of threads;
+    stateful commands still run alone and in order. Commands for an interactive
+    ``shell`` run in order on a worker thread, since the shell reads one at a time.
+    """
+    commands = extract_commands(response)
+    if shell is not None:
+        shell_results = []
+        for command in commands:
+            stream_to = (lambda stream, data, cmd=command: on_output(cmd, stream, data)) if on_output else None
+            shell_results.append(await asyncio.to_thread(_run_in_shell, shell, command, stream_to, timeout))
+        return shell_results
+    results: List[Optional[Dict[str, Any]]] = [None] * len(commands)
+    slots = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def run(index: int) -> None:
+        stream_to = None
+        if on_output:
+            stream_to = lambda stream, data, cmd=commands[index]: on_output(cmd, stream, data)
+        async with slots:
+            results[index] = await _arun_command(ssh, commands[index], stream_to, timeout, refresh)
+
+    for batch in plan_command_batches(commands):
+        if len(batch) == 1 or max_concurrency <= 1:
+            for index in batch:
+                await run(index)
+        else:
+            await asyncio.gather(*(run(index) for index in batch))
+    return results
+
+
+async def _agenerate_bash_commands(model: "OllamaLLM", prompt: str,
+                                   on_partial: Optional[Callable[[str], None]] = None) -> List[str]:
+    """Async counterpart of ``_generate_bash_commands``; models without ``astream`` run on a worker thread."""
+    if not hasattr(model, "astream"):
+        return await asyncio.to_thread(_generate_bash_commands, model, prompt, on_partial)
+
+    parser = StreamingFenceParser()
+    with span("llm_generate", streaming=True) as generation:
+        started = time.perf_counter()
+        generation["tokens"] = 0
+        tokens = model.astream(prompt)
+        try:
+            async for token in tokens:
+                if not generation["tokens"]:
+                    observe("llm_first_token", time.perf_counter() - started)
+                generation["tokens"] += 1
+                parser.feed(token)
+                if parser.malformed:
+                    logger.warning("Model response is not in the expected format, aborting generation.")
+                    break
+                if parser.has_block:
+                    break
+                if on_partial and parser.partial:
+                    on_partial(parser.partial)
+        finally:
+            # Closing the stream closes the HTTP response, which stops generation on the server.
+            await tokens.aclose()
+    logger.info(f"Response from the model: {parser.text}")
+    if on_partial and parser.blocks:
+        on_partial("\n".join(parser.blocks))
+    return parser.blocks
+
+
+async def asave_command_history(question: str, response: str) -> None:
+    """Queue a history row without blocking the loop; waits on a worker thread only when the writer is behind."""
+    if not save_command_history(question, response, block=False):
+        await asyncio.to_thread(save_command_history, question, response)
+
+
+async def aask_question_to_model(model: "OllamaLLM", question: str,
+                                 on_partial: Optional[Callable[[str], None]] = None) -> Optional[str]:
+    """
+    Async counterpart of ``ask_question_to_model``, sharing its caches and prompt.
+
+    Raises:
+        InvalidResponseError: If the model fails to respond or no valid commands are found.
+    """
+    if not model:
+        logger.error("No model is connected. Please connect to a model first.")
+        raise InvalidResponseError("No model connected.")
+
+    with span("ask_question"):
+        cached = await asyncio.to_thread(_lookup_cached_response, model, question)
+        if cached is not None:
+            return cached
+
+        enhanced_prompt = build_prompt(question)
+        try:
+            bash_commands = await _agenerate_bash_commands(model, enhanced_prompt, on_partial)
+            if not bash_commands:
+                logger.warning("No valid Bash commands found in the response. Regenerating...")
+                inc("llm_retries")
+                bash_commands = await _agenerate_bash_commands(model, RETRY_PROMPT_PREFIX + enhanced_prompt,
+                                                               on_partial)
+                if not bash_commands:
+                    raise InvalidResponseError("No valid Bash commands generated.")
+
+            filtered_response = "```bash\n" + "\n".join(bash_commands) + "\n```"
+            await asyncio.to_thread(_cache_response, model, question, filtered_response)
+            try:
+                await asave_command_history(question, filtered_response)
+            except Exception as e:
+                logger.warning(f"Failed to save command history: {e}")
+            return filtered_response
+        except Exception as e:
+            logger.error(f"Failed to get a response from the model: {e}")
+            raise InvalidResponseError(f"Model response failed: {e}")
+
+
+class AsyncEngine:
+    """
+    Runs request coroutines on one event loop shared by every session in the process.
+
+    At most ``max_in_flight`` requests execute at once and up to ``max_queued`` more wait
+    for a slot; beyond that ``submit`` fails fast with ``EngineOverloadedError``. The loop
+    runs in a daemon thread started on first use.
+    """
+
+    def __init__(self, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT, max_queued: int = DEFAULT_MAX_QUEUED,
+                 blocking_workers: int = DEFAULT_BLOCKING_WORKERS):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.blocking_workers = blocking_workers
+        self.in_flight = 0
+        self.queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    loop.set_default_executor(ThreadPoolExecutor(max_workers=self.blocking_workers,
+                                                                 thread_name_prefix="engine-blocking"))
+                    started = threading.Event()
+                    self._thread = threading.Thread(target=self._run_loop, args=(loop, started),
+                                                    name="engine-loop", daemon=True)
+                    self._thread.start()
+                    started.wait()
+                    self._loop = loop
+        return self._loop
+
+    def _run_loop(self, loop: asyncio.AbstractEventLoop, started: threading.Event) -> None:
+        asyncio.set_event_loop(loop)
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        loop.call_soon(started.set)
+        loop.run_forever()
+
+    async def _admit(self, coro: Awaitable, context: contextvars.Context) -> Any:
+        if self._slots.locked() and self.queued >= self.max_queued:
+            coro.close()
+            self.rejected += 1
+            raise EngineOverloadedError(f"Too many pending requests ({self.queued} queued); try again shortly.")
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        except asyncio.CancelledError:
+            coro.close()
+            self.cancelled += 1
+            raise
+        finally:
+            self.queued -= 1
+        self.in_flight += 1
+        try:
+            # The request runs in the submitter's context so its spans join the submitter's trace.
+            return await context.run(asyncio.ensure_future, coro)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self._slots.release()
+
+    def submit(self, coro: Awaitable) -> Future:
+        """Schedule ``coro`` on the engine loop; cancelling the returned future cancels the request."""
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(self._admit(coro, contextvars.copy_context()), loop)
+
+    def call(self, make_coro: Callable[..., Awaitable], *callbacks: Optional[Callable],
+             timeout: Optional[float] = None) -> Any:
+        """
+        Run ``make_coro(*callbacks)`` on the engine and block until it finishes.
+
+        The coroutine receives wrappers of ``callbacks`` that only queue their calls; the
+        calls themselves run on this thread, since Streamlit can only render from the
+        script thread. If this thread is interrupted (e.g. a Streamlit rerun) or
+        ``timeout`` passes, the request is cancelled on the loop.
+
+        Raises:
+            TimeoutError: If the request does not finish within ``timeout`` seconds.
+        """
+        calls: "queue.SimpleQueue[tuple]" = queue.SimpleQueue()
+
+        def relay(callback):
+            if callback is None:
+                return None
+            return lambda *args: calls.put((callback, args))
+
+        future = self.submit(make_coro(*(relay(callback) for callback in callbacks)))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            while True:
+                try:
+                    callback, args = calls.get(timeout=RELAY_POLL_INTERVAL)
+                    callback(*args)
+                    continue
+                except queue.Empty:
+                    pass
+                if future.done():
+                    break
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError(f"Request did not finish within {timeout} seconds.")
+        except BaseException:
+            future.cancel()
+            raise
+        while not calls.empty():
+            callback, args = calls.get_nowait()
+            callback(*args)
+        return future.result()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "cancelled": self.cancelled,
+        }
+
+    def close(self) -> None:
+        """Cancel outstanding requests and stop the loop."""
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+
+        async def shutdown():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            loop.stop()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), loop)
+        self._thread.join()
+        loop.close()
+
+
+# Shared by every Streamlit session in this process.
+default_engine = AsyncEngine()
+
+
+# Sync facade: same signatures as the Core.func functions, executed on the shared loop.
+def ask_question_to_model(model: "OllamaLLM", question: str,
+                          on_partial: Optional[Callable[[str], None]] = None,
+                          timeout: Optional[float] = None) -> Optional[str]:
+    return default_engine.call(lambda partial: aask_question_to_model(model, question, partial),
+                               on_partial, timeout=timeout)
+
+
+def extract_and_execute_commands(response: str, ssh: SSHLike,
+                                 on_output: Optional[Callable[[str, str, str], None]] = None,
+                                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                                 timeout: float = DEFAULT_COMMAND_TIMEOUT, refresh: bool = False,
+                                 shell: Optional[ShellSession] = None) -> List[Dict[str, Any]]:
+    return default_engine.call(
+        lambda output: aextract_and_execute_commands(response, ssh, output, max_concurrency, timeout, refresh, shell),
+        on_output,
+    )
@@ -0,0 +1,21 @@
+# Custom Exceptions
+class SSHConnectionError(Exception):
+    pass
+
+class ModelConnectionError(Exception):
+    pass
+
+class CommandExecutionError(Exception):
+    pass
+
+class InvalidResponseError(Exception):
+    pass
+
+class EngineOverloadedError(Exception):
+    pass
+
+class FileTransferError(Exception):
+    pass
+
+class InvalidHostListError(Exception):
+    pass
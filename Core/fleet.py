@@ -0,0 +1,187 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Dict, Iterator, List, Optional
+
+from Core.exceptions import InvalidHostListError
+from Core.func import (
+    DEFAULT_COMMAND_TIMEOUT,
+    connect_to_server,
+    extract_and_execute_commands,
+)
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DEFAULT_FLEET_WORKERS = 16  # Hosts processed at once
+DEFAULT_HOST_TIMEOUT = 120  # Seconds allowed per host (connect + all commands)
+
+STATUS_SUCCESS = "success"
+STATUS_FAILED = "failed"
+STATUS_TIMEOUT = "timeout"
+
+
+def parse_host_list(text: str, default_username: Optional[str] = None, default_port: int = 22) -> List[Dict[str, Any]]:
+    """
+    Parses a host list or inventory file into host entries.
+
+    Accepts one host per line or comma separated, in the form ``[user@]host[:port]``.
+    Blank lines, ``#`` comments and ``[group]`` headers of INI-style inventories are
+    ignored, as are trailing ``key=value`` inventory variables except ``ansible_host``,
+    ``ansible_port`` and ``ansible_user``. ``[group:vars]`` and ``[group:children]``
+    sections list variables and group names, not hosts, and are skipped.
+
+    Args:
+        text (str): The host list or inventory file contents.
+        default_username (str): Username used when a host does not specify one.
+        default_port (int): Port used when a host does not specify one.
+
+    Returns:
+        list: Unique host entries ``{"host", "port", "username"}`` in input order.
+
+    Raises:
+        InvalidHostListError: If a line has an invalid port; the message lists every bad line.
+    """
+    hosts = []
+    seen = set()
+    invalid = []
+    in_host_section = True
+    for line in text.replace(",", "\n").splitlines():
+        line = line.split("#", 1)[0].strip()
+        if line.startswith("[") and line.endswith("]"):
+            in_host_section = not line[1:-1].strip().endswith((":vars", ":children"))
+            continue
+        if not line or not in_host_section:
+            continue
+        name, *variables = line.split()
+        options = dict(v.split("=", 1) for v in variables if "=" in v)
+        username = default_username
+        if "@" in name:
+            username, name = name.rsplit("@", 1)
+        port_text = options.get("ansible_port")
+        if name.count(":") == 1:
+            name, host_port = name.split(":")
+            port_text = port_text or host_port
+        port = _parse_port(port_text, default_port)
+        if port is None or not name:
+            invalid.append(line)
+            continue
+        name = options.get("ansible_host", name)
+        username = options.get("ansible_user", username)
+        key = (name, port, username)
+        if key not in seen:
+            seen.add(key)
+            hosts.append({"host": name, "port": port, "username": username})
+    if invalid:
+        raise InvalidHostListError(f"Invalid host entries (expected [user@]host[:port]): {'; '.join(invalid)}")
+    return hosts
+
+
+def _parse_port(text: Optional[str], default: int) -> Optional[int]:
+    """The port in ``text``, ``default`` when there is none, or None when it is not a valid port."""
+    if text is None:
+        return default
+    if not text.isdigit() or not 0 < int(text) < 65536:
+        return None
+    return int(text)
+
+
+def load_inventory(path: str, default_username: Optional[str] = None, default_port: int = 22) -> List[Dict[str, Any]]:
+    """Reads a host list or INI-style inventory file. See ``parse_host_list``."""
+    with open(path) as f:
+        return parse_host_list(f.read(), default_username, default_port)
+
+
+def host_label(host: Dict[str, Any]) -> str:
+    label = f"{host['username']}@{host['host']}" if host.get("username") else host["host"]
+    return label if host.get("port", 22) == 22 else f"{label}:{host['port']}"
+
+
+def _run_on_host(host: Dict[str, Any], response: str, password: str, timeout: float,
+                 refresh: bool = False) -> Dict[str, Any]:
+    start = time.monotonic()
+    try:
+        ssh = connect_to_server(host["host"], host["username"], password, port=host.get("port", 22))
+        results = extract_and_execute_commands(response, ssh, timeout=timeout, refresh=refresh)
+    except Exception as e:
+        logger.error(f"Fleet execution failed on {host_label(host)}: {e}")
+        return {"host": host_label(host), "status": STATUS_FAILED, "results": [], "error": str(e),
+                "elapsed": time.monotonic() - start}
+    # stderr output alone (warnings, progress) is not a failure; results of commands that
+    # could not run at all carry an error but no exit status.
+    ok = all(r.get("exit_status") == 0 for r in results)
+    timed_out = any(r.get("timed_out") for r in results)
+    status = STATUS_TIMEOUT if timed_out else STATUS_SUCCESS if ok else STATUS_FAILED
+    error = "One or more commands timed out." if timed_out else None
+    return {"host": host_label(host), "status": status, "results": results,
+            "error": error, "elapsed": time.monotonic() - start}
+
+
+def iter_fleet_results(hosts: List[Dict[str, Any]], response: str, password: str,
+                       max_workers: int = DEFAULT_FLEET_WORKERS,
+                       host_timeout: float = DEFAULT_HOST_TIMEOUT, refresh: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Runs the commands of a model response on every host and yields per-host results as they finish.
+
+    Hosts run on a bounded thread pool. A host that has not finished within
+    ``host_timeout`` seconds of starting is reported with status ``timeout`` and
+    not waited for any longer.
+
+    Args:
+        hosts (list): Host entries from ``parse_host_list``.
+        response (str): The model response containing the commands.
+        password (str): The SSH password shared by the fleet.
+        max_workers (int): Maximum number of hosts processed concurrently.
+        host_timeout (float): Per-host time limit in seconds.
+        refresh (bool): Run read-only commands again instead of reusing cached results.
+
+    Yields:
+        dict: ``{"host", "status", "results", "error", "elapsed"}`` for each host, in completion order.
+    """
+    if not hosts:
+        return
+    command_timeout = min(DEFAULT_COMMAND_TIMEOUT, host_timeout)
+    started: Dict[Any, float] = {}
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(hosts)))
+
+    def run(host):
+        started[id(host)] = time.monotonic()
+        return _run_on_host(host, response, password, command_timeout, refresh)
+
+    futures = {executor.submit(run, host): host for host in hosts}
+    pending = set(futures)
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+            now = time.monotonic()
+            for future in list(pending):
+                host = futures[future]
+                begun = started.get(id(host))
+                if begun is not None and now - begun > host_timeout:
+                    pending.discard(future)
+                    future.cancel()
+                    logger.warning(f"Fleet execution timed out on {host_label(host)}")
+                    yield {"host": host_label(host), "status": STATUS_TIMEOUT, "results": [],
+                           "error": f"Timed out after {host_timeout} seconds.", "elapsed": now - begun}
+    finally:
+        # Do not block on hosts that timed out; their threads finish on their own.
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def run_on_fleet(hosts: List[Dict[str, Any]], response: str, password: str,
+                 max_workers: int = DEFAULT_FLEET_WORKERS,
+                 host_timeout: float = DEFAULT_HOST_TIMEOUT, refresh: bool = False) -> List[Dict[str, Any]]:
+    """Runs ``iter_fleet_results`` to completion and returns the results in host order."""
+    order = {host_label(host): i for i, host in enumerate(hosts)}
+    results = list(iter_fleet_results(hosts, response, password, max_workers, host_timeout, refresh))
+    return sorted(results, key=lambda r: order.get(r["host"], len(order)))
+
+
+def summarize_fleet(host_results: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Counts hosts per status: ``{"total", "success", "failed", "timeout"}``."""
+    summary = {"total": len(host_results), STATUS_SUCCESS: 0, STATUS_FAILED: 0, STATUS_TIMEOUT: 0}
+    for result in host_results:
+        summary[result["status"]] += 1
+    return summary
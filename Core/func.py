@@ -1,40 +1,66 @@
-from langchain_ollama import OllamaLLM
 import re
-import paramiko
 import logging
-from typing import Optional, List, Dict, Any
-import json
-import requests
+import codecs
+import select
+import time
+import queue
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import TYPE_CHECKING, Optional, List, Dict, Any, Callable, Iterator, Union
+from Core.exceptions import (
+    SSHConnectionError,
+    ModelConnectionError,
+    CommandExecutionError,
+    InvalidResponseError,
+)
+from Core.ssh_pool import ssh_pool, PooledSSHSession, SSHLike, borrow_channel
+from Core.planner import plan_command_batches
+from Core.parser import StreamingFenceParser, BASH_LANGUAGE, fenced_blocks, split_commands
+from Core.safety import command_filter
+from Core.result_cache import normalize_command, result_cache
+from Core.shell_session import ShellSession
+from Core.cache import ResponseCache
+from Core.semantic_cache import SemanticCache, OllamaEmbedder
+from Core.llm_router import LLMRouter, parse_ollama_urls, DEFAULT_FIRST_TOKEN_TIMEOUT, DEFAULT_HEDGE_AFTER
+from Core.database import save_command_history, record_cache_lookup, record_command_run
+from Core.metrics import span, timed, observe, inc
+
+if TYPE_CHECKING:
+    import paramiko
+    from langchain_ollama import OllamaLLM
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
-paramiko.common.logging.basicConfig(level=paramiko.common.DEBUG)
 
 # Constants
 DEFAULT_OLLAMA_URL = "http://localhost:11434"
 DEFAULT_MODEL = "llama3.2"
 DEFAULT_SSH_TIMEOUT = 10  # Timeout for SSH connections in seconds
-command_cache = {}
-
-# Custom Exceptions
-class SSHConnectionError(Exception):
-    pass
-
-class ModelConnectionError(Exception):
-    pass
-
-class CommandExecutionError(Exception):
-    pass
-
-class InvalidResponseError(Exception):
-    pass
-
-
-def connect_to_server(ip: str, username: str, password: str, timeout: int = DEFAULT_SSH_TIMEOUT, port: int = 22) -> paramiko.SSHClient:
+DEFAULT_COMMAND_TIMEOUT = 60  # Wall-clock limit for a single remote command in seconds
+DEFAULT_MAX_OUTPUT_BYTES = 5 * 1024 * 1024  # Output kept per command (stdout + stderr)
+DEFAULT_CHUNK_SIZE = 32768  # Bytes read from a channel per recv call
+CHANNEL_POLL_INTERVAL = 0.5  # Upper bound on a single wait for channel data
+DEFAULT_MAX_CONCURRENCY = 4  # Independent commands run in parallel per response
+PROMPT_VERSION = "1"  # Bump whenever the prompt template changes so cached responses are regenerated
+RETRY_PROMPT_PREFIX = "Your previous response did not contain valid Bash commands. Please try again.\n"
+
+# Shared by every session in this process; backed by SQLite so other workers and restarts stay warm.
+response_cache = ResponseCache()
+# Catches reworded questions; uses an Ollama embedding model on the same server unless an embedder is set.
+semantic_cache = SemanticCache()
+_embedders: Dict[str, Optional[OllamaEmbedder]] = {}
+_PROMPT_MARKER = re.compile(r"^\$[ \t]+")
+
+
+def connect_to_server(ip: str, username: str, password: str, timeout: int = DEFAULT_SSH_TIMEOUT, port: int = 22) -> PooledSSHSession:
     """
     Connect to the server via SSH with error handling and timeout.
 
+    The connection is registered with the process-wide ``ssh_pool``, so repeated
+    connects (reruns, other browser sessions) reuse an already authenticated
+    transport instead of paying for a new handshake.
+
     Args:
         ip (str): The IP address of the server.
         username (str): The username for SSH login.
@@ -42,77 +68,145 @@ def connect_to_server(ip: str, username: str, password: str, timeout: int = DEFA
         timeout (int): SSH connection timeout in seconds.
 
     Returns:
-        paramiko.SSHClient: The SSH connection object.
+        PooledSSHSession: A handle for borrowing channels from the pool.
 
     Raises:
         SSHConnectionError: If the connection fails.
     """
-    # ssh = paramiko.SSHClient()
-    # ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    # try:
-    #     ssh.connect(hostname=ip, username=username, password=password, timeout=timeout)
-    #     logger.info(f"Connected to {ip} as {username}")
-    #     return ssh
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    try:
-        ssh.connect(hostname=ip, username=username, password=password, timeout=timeout, port=port)
-        logger.info(f"Connected to {ip} as {username}")
-        return ssh
-    except Exception as e:
-        logger.error(f"Failed to connect to {ip}: {e}")
-        raise SSHConnectionError(f"SSH connection failed: {e}")
+    session = ssh_pool.register(ip, username, password, port=port, timeout=timeout)
+    logger.info(f"Connected to {ip} as {username}")
+    return session
 
-def become_root_user(ssh: paramiko.SSHClient, password: str) -> None:
+def become_root_user(ssh: Union[SSHLike, ShellSession], password: str) -> None:
     """
     Switch to root user by running sudo commands.
 
+    Only a ``ShellSession`` keeps the root shell for later commands. On a plain
+    connection ``sudo su`` runs in a channel of its own, which exits again.
+
     Args:
-        ssh (paramiko.SSHClient): The SSH connection.
+        ssh (PooledSSHSession | paramiko.SSHClient | ShellSession): The SSH connection or interactive shell.
         password (str): The password for sudo.
 
     Raises:
         CommandExecutionError: If switching to root fails.
     """
+    if isinstance(ssh, ShellSession):
+        ssh.become_root(password)
+        return ssh
+    logger.warning("Root access does not persist without an interactive shell session.")
     try:
-        stdin, stdout, stderr = ssh.exec_command("sudo su")
-        stdin.write(f"{password}\n")
-        stdin.flush()
-        print(password)
-        exit_status = stdout.channel.recv_exit_status()
-        if exit_status != 0:
-            error = stderr.read().decode().strip()
-            raise CommandExecutionError(f"Failed to switch to root user: {error}")
+        with borrow_channel(ssh) as channel:
+            channel.exec_command("sudo su")
+            channel.sendall(f"{password}\n".encode())
+            exit_status = channel.recv_exit_status()
+            if exit_status != 0:
+                error = channel.makefile_stderr("rb").read().decode().strip()
+                raise CommandExecutionError(f"Failed to switch to root user: {error}")
         logger.info("Switched to root user.")
         return ssh
     except Exception as e:
         logger.error(f"Failed to switch to root user: {e}")
-        print(e)
         raise CommandExecutionError(f"Root user switch failed: {e}")
 
-def connect_to_llm(model_name: str = DEFAULT_MODEL, ollama_url: str = DEFAULT_OLLAMA_URL) -> OllamaLLM:
+def connect_to_llm(model_name: str = DEFAULT_MODEL, ollama_url: str = DEFAULT_OLLAMA_URL,
+                   first_token_timeout: float = DEFAULT_FIRST_TOKEN_TIMEOUT,
+                   hedge_after: Optional[float] = DEFAULT_HEDGE_AFTER) -> Union["OllamaLLM", LLMRouter]:
     """
     Connects to a local LLM using the OllamaLLM class from langchain_ollama.
 
+    When ``ollama_url`` lists several servers (separated by commas), the result is an
+    ``LLMRouter`` that load-balances requests over them and fails over between them.
+
     Args:
         model_name (str): The name of the model to connect to.
-        ollama_url (str): The URL of the Ollama server.
+        ollama_url (str): The URL of the Ollama server, or several separated by commas.
+        first_token_timeout (float): With several servers, seconds one has to start answering before the next is tried.
+        hedge_after (float): With several servers, seconds before a slow request also goes to a second one, or None.
 
     Returns:
-        OllamaLLM: The connected LLM object.
+        OllamaLLM | LLMRouter: The connected LLM object.
 
     Raises:
         ModelConnectionError: If the connection fails.
     """
     try:
-        model = OllamaLLM(model=model_name, base_url=ollama_url)
+        # Imported lazily: langchain is the slowest import in the app and is only needed once a model is picked.
+        with span("llm_connect", model=model_name):
+            urls = parse_ollama_urls(ollama_url)
+            if len(urls) > 1:
+                model = LLMRouter(model_name, urls, first_token_timeout=first_token_timeout, hedge_after=hedge_after)
+            else:
+                from langchain_ollama import OllamaLLM
+
+                model = OllamaLLM(model=model_name, base_url=ollama_url)
         logger.info(f"Connected to the model: {model_name}")
         return model
     except Exception as e:
         logger.error(f"Failed to connect to the model: {e}")
         raise ModelConnectionError(f"Model connection failed: {e}")
 
-def ask_question_to_model(model: OllamaLLM, question: str) -> Optional[str]:
+def _default_embedder(model: "OllamaLLM") -> Optional[OllamaEmbedder]:
+    base_url = getattr(model, "base_url", None) or DEFAULT_OLLAMA_URL
+    if base_url not in _embedders:
+        try:
+            _embedders[base_url] = OllamaEmbedder(base_url=base_url)
+        except Exception as e:
+            logger.warning(f"Semantic cache unavailable: {e}")
+            _embedders[base_url] = None
+    return _embedders[base_url]
+
+def _generate_bash_commands(model: "OllamaLLM", prompt: str,
+                            on_partial: Optional[Callable[[str], None]] = None) -> List[str]:
+    """
+    Runs one generation and returns the ```bash blocks it produced.
+
+    When the model supports token streaming, blocks are parsed as tokens arrive:
+    ``on_partial`` receives the commands generated so far, generation stops as soon
+    as the first block closes, and it is abandoned early if the response is clearly
+    not in the requested format.
+    """
+    if not hasattr(model, "stream"):
+        with span("llm_generate", streaming=False):
+            response = model.invoke(prompt)
+        logger.info(f"Response from the model: {response}")
+        return fenced_blocks(response, (BASH_LANGUAGE,))
+
+    parser = StreamingFenceParser()
+    with span("llm_generate", streaming=True) as generation:
+        _stream_into_parser(model, prompt, parser, on_partial, generation)
+    logger.info(f"Response from the model: {parser.text}")
+    if on_partial and parser.blocks:
+        on_partial("\n".join(parser.blocks))
+    return parser.blocks
+
+def _stream_into_parser(model: "OllamaLLM", prompt: str, parser: StreamingFenceParser,
+                        on_partial: Optional[Callable[[str], None]], generation: Dict[str, Any]) -> None:
+    started = time.perf_counter()
+    tokens = model.stream(prompt)
+    generation["tokens"] = 0
+    try:
+        for token in tokens:
+            if not generation["tokens"]:
+                observe("llm_first_token", time.perf_counter() - started)
+            generation["tokens"] += 1
+            parser.feed(token)
+            if parser.malformed:
+                logger.warning("Model response is not in the expected format, aborting generation.")
+                break
+            if parser.has_block:
+                break
+            if on_partial and parser.partial:
+                on_partial(parser.partial)
+    finally:
+        # Closing the generator closes the HTTP stream, which stops generation on the server.
+        close = getattr(tokens, "close", None)
+        if close:
+            close()
+
+@timed("ask_question")
+def ask_question_to_model(model: "OllamaLLM", question: str,
+                          on_partial: Optional[Callable[[str], None]] = None) -> Optional[str]:
     """
     Asks a question to the connected model and returns the response.
     Enhances filtering and ensures valid Bash commands are returned.
@@ -120,6 +214,7 @@ def ask_question_to_model(model: OllamaLLM, question: str) -> Optional[str]:
     Args:
         model (OllamaLLM): The connected LLM object.
         question (str): The question to ask the model.
+        on_partial (callable): Optional ``on_partial(commands)`` called with the partial commands while tokens stream in.
 
     Returns:
         str: The response from the model.
@@ -131,13 +226,38 @@ def ask_question_to_model(model: OllamaLLM, question: str) -> Optional[str]:
         logger.error("No model is connected. Please connect to a model first.")
         raise InvalidResponseError("No model connected.")
 
-    # Check if the question is already in the cache
-    if question in command_cache:
-        logger.info(f"Returning cached response for: {question}")
-        return command_cache[question]
+    cached = _lookup_cached_response(model, question)
+    if cached is not None:
+        return cached
+
+    enhanced_prompt = build_prompt(question)
+    try:
+        bash_commands = _generate_bash_commands(model, enhanced_prompt, on_partial)
+        if not bash_commands:
+            logger.warning("No valid Bash commands found in the response. Regenerating...")
+            inc("llm_retries")
+            bash_commands = _generate_bash_commands(model, RETRY_PROMPT_PREFIX + enhanced_prompt, on_partial)
+            if not bash_commands:
+                raise InvalidResponseError("No valid Bash commands generated.")
 
+        # Join commands into a single response
+        filtered_response = "```bash\n" + "\n".join(bash_commands) + "\n```"
+
+        # Cache the response for future use
+        _cache_response(model, question, filtered_response)
+        try:
+            save_command_history(question, filtered_response)
+        except Exception as e:
+            logger.warning(f"Failed to save command history: {e}")
+        return filtered_response
+    except Exception as e:
+        logger.error(f"Failed to get a response from the model: {e}")
+        raise InvalidResponseError(f"Model response failed: {e}")
+
+def build_prompt(question: str) -> str:
+    """Returns the prompt sent to the model for ``question``."""
     # Enhanced prompt for better Bash command generation
-    enhanced_prompt = (
+    return (
         f"You are a DevOps assistant. Your task is to generate accurate and efficient Bash commands. "
         f"Provide only the Bash command(s) inside triple backticks (```bash\n<command>\n```). "
         f"Do not include explanations or comments unless explicitly asked. "
@@ -148,120 +268,488 @@ def ask_question_to_model(model: OllamaLLM, question: str) -> Optional[str]:
         f"Now, respond to the following request:\n{question}"
     )
 
-    try:
-        response = model.invoke(enhanced_prompt)
-        logger.info(f"Response from the model: {response}")
+def _lookup_cached_response(model: "OllamaLLM", question: str) -> Optional[str]:
+    """Returns a response from the exact cache, then the semantic cache, or None."""
+    model_name = getattr(model, "model", "")
+    with span("cache_lookup", tier="exact"):
+        cached = response_cache.get(question, model_name, PROMPT_VERSION)
+    inc("cache_lookups", tier="exact", result="hit" if cached is not None else "miss")
+    record_cache_lookup("exact", cached is not None)
+    if cached is not None:
+        logger.info(f"Returning cached response for: {question}")
+        return cached
+    embedder = semantic_cache.embedder or _default_embedder(model)
+    with span("cache_lookup", tier="semantic"):
+        cached = semantic_cache.lookup(question, model_name, PROMPT_VERSION, embedder=embedder)
+    inc("cache_lookups", tier="semantic", result="hit" if cached is not None else "miss")
+    record_cache_lookup("semantic", cached is not None)
+    if cached is not None:
+        response_cache.set(question, model_name, PROMPT_VERSION, cached)
+    return cached
+
+def _cache_response(model: "OllamaLLM", question: str, response: str) -> None:
+    model_name = getattr(model, "model", "")
+    response_cache.set(question, model_name, PROMPT_VERSION, response)
+    semantic_cache.add(question, model_name, PROMPT_VERSION, response,
+                       embedder=semantic_cache.embedder or _default_embedder(model))
+
+def check_command_allowed(command: str) -> None:
+    """
+    Rejects commands that must never be sent to a server (see ``Core/safety.py``).
 
-        # Filter out non-Bash responses
-        bash_commands = re.findall(r"```bash\n(.*?)\n```", response, re.DOTALL)
-        if not bash_commands:
-            logger.warning("No valid Bash commands found in the response. Regenerating...")
-            response = model.invoke(f"Your previous response did not contain valid Bash commands. Please try again.\n{enhanced_prompt}")
-            bash_commands = re.findall(r"```bash\n(.*?)\n```", response, re.DOTALL)
-            if not bash_commands:
-                raise InvalidResponseError("No valid Bash commands generated.")
+    Raises:
+        CommandExecutionError: If the command is dangerous.
+    """
+    command_filter.validate(command)
 
-        # Join commands into a single response
-        filtered_response = "```bash\n" + "\n".join(bash_commands) + "\n```"
-        
-        # Cache the response for future use
-        command_cache[question] = filtered_response
-        return filtered_response
+class ChannelReader:
+    """
+    Reads the stdout and stderr of one exec channel for ``stream_ssh_command`` and
+    the async engine's ``astream_ssh_command``; only the waiting differs between them.
+
+    Both streams are drained together in non-blocking chunks and decoded incrementally,
+    so a command that fills one stream can never deadlock while the other is read.
+    Reading stops once ``max_bytes`` have been received or the deadline has passed.
+
+    Args:
+        channel (paramiko.Channel): A channel the command was started on.
+        command (str): The command, for log messages.
+        timeout (float): Wall-clock limit the deadline was derived from, for log messages.
+        deadline (float): ``time.monotonic()`` value after which the command is given up on.
+        max_bytes (int): Maximum number of output bytes to read across both streams.
+        chunk_size (int): Maximum bytes read per recv call.
+    """
+
+    def __init__(self, channel: "paramiko.Channel", command: str, timeout: float, deadline: float,
+                 max_bytes: int = DEFAULT_MAX_OUTPUT_BYTES, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.channel = channel
+        self.command = command
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.decoders = {
+            "stdout": codecs.getincrementaldecoder("utf-8")(errors="replace"),
+            "stderr": codecs.getincrementaldecoder("utf-8")(errors="replace"),
+        }
+        self.stream_bytes = {"stdout": 0, "stderr": 0}
+        self.total = 0
+        self.received = False
+        self.truncated = self.timed_out = False
+        self.exit_status = -1
+
+    def read(self) -> Iterator[Dict[str, Any]]:
+        """Yield ``{"stream": ..., "data": str}`` for everything the channel has ready."""
+        channel = self.channel
+        self.received = False
+        readers = (
+            ("stdout", channel.recv_ready, channel.recv),
+            ("stderr", channel.recv_stderr_ready, channel.recv_stderr),
+        )
+        for stream, ready, recv in readers:
+            while not self.truncated and ready():
+                data = recv(self.chunk_size)
+                if not data:
+                    break
+                self.received = True
+                if self.total + len(data) > self.max_bytes:
+                    data = data[:self.max_bytes - self.total]
+                    self.truncated = True
+                self.total += len(data)
+                self.stream_bytes[stream] += len(data)
+                text = self.decoders[stream].decode(data)
+                if text:
+                    yield {"stream": stream, "data": text}
+
+    def wait_time(self) -> Optional[float]:
+        """Seconds to wait for more data, 0 to read again at once, or None once reading is over."""
+        channel = self.channel
+        if self.truncated:
+            return None
+        if not self.received and channel.exit_status_ready() and not channel.recv_ready() \
+                and not channel.recv_stderr_ready():
+            return None
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            self.timed_out = True
+            return None
+        return 0.0 if self.received else min(remaining, CHANNEL_POLL_INTERVAL)
+
+    def drain(self) -> Iterator[Dict[str, Any]]:
+        """Yield bytes the decoders held back and record the exit status. Call before the channel closes."""
+        for stream, decoder in self.decoders.items():
+            tail = decoder.decode(b"", final=True)
+            if tail:
+                yield {"stream": stream, "data": tail}
+        if self.channel.exit_status_ready():
+            self.exit_status = self.channel.recv_exit_status()
+
+    def record(self) -> None:
+        """Count the bytes read, per stream."""
+        for stream, count in self.stream_bytes.items():
+            if count:
+                inc("ssh_bytes", count, stream=stream)
+
+    def exit_chunk(self) -> Dict[str, Any]:
+        """The final ``exit`` chunk, logging a truncation or timeout."""
+        if self.truncated:
+            logger.warning(f"Output of '{self.command}' truncated at {self.max_bytes} bytes.")
+        if self.timed_out:
+            logger.warning(f"Command '{self.command}' timed out after {self.timeout} seconds.")
+        return {"stream": "exit", "exit_status": self.exit_status, "truncated": self.truncated,
+                "timed_out": self.timed_out, "bytes": self.total}
+
+
+class CommandRun:
+    """
+    Collects the chunks of one command into its result dict, then records the run in
+    ``result_cache`` and the command stats. Shared by ``execute_ssh_command`` and the
+    async engine, which calls the blocking ``begin`` and ``finish`` on a worker thread.
+    """
+
+    def __init__(self, ssh: SSHLike, command: str, on_output: Optional[Callable[[str, str], None]] = None):
+        self.ssh = ssh
+        self.command = command
+        self.on_output = on_output
+        self.output: List[str] = []
+        self.error: List[str] = []
+        self.final: Dict[str, Any] = {}
+        self.result: Optional[Dict[str, Any]] = None
+        self.token = None
+        self.started = time.monotonic()
+
+    def begin(self) -> None:
+        self.token = result_cache.begin(self.ssh, self.command)
+        self.started = time.monotonic()
+
+    def add(self, chunk: Dict[str, Any]) -> None:
+        if chunk["stream"] == "exit":
+            self.final = chunk
+            return
+        (self.output if chunk["stream"] == "stdout" else self.error).append(chunk["data"])
+        if self.on_output:
+            self.on_output(chunk["stream"], chunk["data"])
+
+    def complete(self) -> Dict[str, Any]:
+        self.result = command_result(self.output, self.error, self.final)
+        return self.result
+
+    def finish(self) -> None:
+        """Store the result (None if the command failed) and its run time; always called."""
+        duration = time.monotonic() - self.started
+        result_cache.finish(self.ssh, self.command, self.result, self.token, duration)
+        record_command_run(normalize_command(self.command), duration,
+                           failed=self.result is None or self.result["exit_status"] != 0)
+
+
+def stream_ssh_command(ssh: SSHLike, command: str, timeout: float = DEFAULT_COMMAND_TIMEOUT,
+                       max_bytes: int = DEFAULT_MAX_OUTPUT_BYTES,
+                       chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Executes a shell command on the remote server and yields its output as it arrives.
+
+    stdout and stderr are drained together in non-blocking chunks (see ``ChannelReader``),
+    so a command that fills one stream can never deadlock while the other is being read.
+    The command is stopped once ``max_bytes`` of output have been received or ``timeout``
+    seconds have elapsed.
+
+    Args:
+        ssh (PooledSSHSession | paramiko.SSHClient): The SSH connection.
+        command (str): The shell command to execute.
+        timeout (float): Wall-clock limit for the command in seconds.
+        max_bytes (int): Maximum number of output bytes to read across both streams.
+        chunk_size (int): Maximum bytes read per recv call.
+
+    Yields:
+        dict: ``{"stream": "stdout" | "stderr", "data": str}`` for each chunk, then a final
+        ``{"stream": "exit", "exit_status": int, "truncated": bool, "timed_out": bool,
+        "bytes": int}``.
+
+    Raises:
+        CommandExecutionError: If the command is rejected or the channel fails.
+    """
+    check_command_allowed(command)
+
+    deadline = time.monotonic() + timeout
+    started = time.perf_counter()
+    reader = None
+    try:
+        with borrow_channel(ssh) as channel:
+            channel.exec_command(command)
+            observe("ssh_channel_open", time.perf_counter() - started)
+            channel.setblocking(0)
+            reader = ChannelReader(channel, command, timeout, deadline, max_bytes, chunk_size)
+            while True:
+                yield from reader.read()
+                wait_time = reader.wait_time()
+                if wait_time is None:
+                    break
+                if wait_time:
+                    select.select([channel], [], [], wait_time)
+            yield from reader.drain()
+    except CommandExecutionError:
+        raise
     except Exception as e:
-        logger.error(f"Failed to get a response from the model: {e}")
-        raise InvalidResponseError(f"Model response failed: {e}")
+        logger.error(f"Failed to execute command: {command}\nError: {e}")
+        raise CommandExecutionError(f"Command execution failed: {e}")
+    finally:
+        observe("ssh_command", time.perf_counter() - started)
+        if reader is not None:
+            reader.record()
+
+    yield reader.exit_chunk()
 
-def execute_ssh_command(ssh: paramiko.SSHClient, command: str) -> Dict[str, Any]:
+def execute_ssh_command(ssh: SSHLike, command: str, timeout: float = DEFAULT_COMMAND_TIMEOUT,
+                        max_bytes: int = DEFAULT_MAX_OUTPUT_BYTES,
+                        on_output: Optional[Callable[[str, str], None]] = None,
+                        refresh: bool = False) -> Dict[str, Any]:
     """
     Executes a shell command on the remote server via SSH and returns the output.
     Enhances error handling and command validation.
 
+    Read-only commands are answered from ``result_cache`` while their result is fresh;
+    any other command invalidates the cached results of its host.
+
     Args:
-        ssh (paramiko.SSHClient): The SSH connection.
+        ssh (PooledSSHSession | paramiko.SSHClient): The SSH connection.
         command (str): The shell command to execute.
+        timeout (float): Wall-clock limit for the command in seconds.
+        max_bytes (int): Maximum number of output bytes to keep.
+        on_output (callable): Optional ``on_output(stream, data)`` called for every chunk as it arrives.
+        refresh (bool): Skip the cached result and run the command again.
 
     Returns:
-        dict: A dictionary containing the output, error, and exit status.
+        dict: A dictionary containing the output, error, and exit status. Results served
+        from the cache also have ``cached=True`` and their ``age`` in seconds.
 
     Raises:
         CommandExecutionError: If the command execution fails.
     """
+    cached = None if refresh else cached_command_result(command, ssh)
+    if cached is not None:
+        replay_cached_output(cached, on_output)
+        return cached
+    run = CommandRun(ssh, command, on_output)
+    run.begin()
     try:
-        # Validate the command to prevent dangerous operations
-        if re.search(r"rm\s+-[rf]\s+/", command):  # Prevent 'rm -rf /'
-            raise CommandExecutionError("Dangerous command detected: 'rm -rf /' is not allowed.")
-
-        stdin, stdout, stderr = ssh.exec_command(command)
-        output = stdout.read().decode().strip()
-        error = stderr.read().decode().strip()
-        exit_status = stdout.channel.recv_exit_status()
-        result = {
-            "output": output,
-            "error": error,
-            "exit_status": exit_status
-        }
-        logger.info(f"Command executed: {command}\nResult: {result}")
-        return result
+        for chunk in stream_ssh_command(ssh, command, timeout=timeout, max_bytes=max_bytes):
+            run.add(chunk)
+        result = run.complete()
     except Exception as e:
         logger.error(f"Failed to execute command: {command}\nError: {e}")
+        if isinstance(e, CommandExecutionError):
+            raise
         raise CommandExecutionError(f"Command execution failed: {e}")
-
-def extract_and_execute_commands(response: str, ssh: paramiko.SSHClient) -> List[Dict[str, Any]]:
+    finally:
+        run.finish()
+
+    logger.info(f"Command executed: {command}\nResult: {result}")
+    return result
+
+def cached_command_result(command: str, ssh: SSHLike) -> Optional[Dict[str, Any]]:
+    """Returns the fresh cached result of ``command`` on ``ssh``, or None."""
+    cached = result_cache.get(ssh, command)
+    if cached is not None:
+        logger.info(f"Using cached result ({cached['age']:.0f}s old) for: {command}")
+    return cached
+
+def replay_cached_output(cached: Dict[str, Any], on_output: Optional[Callable[[str, str], None]] = None) -> None:
+    """Sends a cached result's output to ``on_output`` as if it had just been streamed."""
+    if on_output:
+        for stream, data in (("stdout", cached["output"]), ("stderr", cached["error"])):
+            if data:
+                on_output(stream, data + "\n")
+
+def command_result(output: List[str], error: List[str], final: Dict[str, Any]) -> Dict[str, Any]:
+    """Builds the result dict of a command from its output chunks and final ``exit`` chunk."""
+    return {
+        "output": "".join(output).strip(),
+        "error": "".join(error).strip(),
+        "exit_status": final.get("exit_status"),
+        "truncated": final.get("truncated", False),
+        "timed_out": final.get("timed_out", False),
+    }
+
+def extract_commands(response: str) -> List[str]:
     """
-    Extracts shell commands from the model response and executes them on the remote server.
-    Enhances filtering, validation, and execution.
+    Extracts the shell commands from the fenced blocks of a model response.
 
     Args:
         response (str): The text response containing shell commands.
-        ssh (paramiko.SSHClient): The SSH connection.
 
     Returns:
-        list: A list of dictionaries containing the results of each executed command.
+        list: The cleaned commands, one per line, in response order.
 
     Raises:
         InvalidResponseError: If no commands are found in the response.
     """
-    # Extract commands from triple backticks
-    command_blocks = re.findall(r"```(?:bash)?\n(.*?)```", response, re.DOTALL)
+    command_blocks = fenced_blocks(response)
     if not command_blocks:
         logger.error("No commands found in the model response.")
         raise InvalidResponseError("No commands found in the response.")
 
-    results = []
+    commands = []
     for block in command_blocks:
-        commands = block.strip().split('\n')
-        for command in commands:
-            if command:  # Ensure the line is not empty
-                # Remove '$' and '#' symbols
-                clean_command = re.sub(r"[$#]", "", command).strip()
-                if clean_command:  # Skip empty lines after cleaning
-                    logger.info(f"Executing on remote server: {clean_command}")
-                    try:
-                        result = execute_ssh_command(ssh, clean_command)
-                        results.append(result)
-                    except CommandExecutionError as e:
-                        logger.error(f"Command execution failed: {e}")
-                        results.append({"command": clean_command, "error": str(e)})
+        for command in split_commands(block):
+            # Drop a copied "$ " shell prompt; "$VAR" and "#" inside commands are kept.
+            command = _PROMPT_MARKER.sub("", command, count=1)
+            if command:
+                commands.append(command)
+    return commands
+
+def _run_command(ssh: SSHLike, command: str,
+                 on_output: Optional[Callable[[str, str], None]] = None,
+                 timeout: float = DEFAULT_COMMAND_TIMEOUT, refresh: bool = False) -> Dict[str, Any]:
+    logger.info(f"Executing on remote server: {command}")
+    try:
+        return execute_ssh_command(ssh, command, timeout=timeout, on_output=on_output, refresh=refresh)
+    except CommandExecutionError as e:
+        logger.error(f"Command execution failed: {e}")
+        return {"command": command, "error": str(e)}
+
+def _run_in_shell(shell: ShellSession, command: str,
+                  on_output: Optional[Callable[[str, str], None]] = None,
+                  timeout: float = DEFAULT_COMMAND_TIMEOUT) -> Dict[str, Any]:
+    logger.info(f"Executing in interactive shell: {command}")
+    # Results are never cached here (they may depend on the shell's cwd and variables),
+    # but a mutating command still invalidates the host's cached results.
+    token = result_cache.begin(shell.ssh, command)
+    started = time.monotonic()
+    result = None
+    try:
+        result = shell.run(command, timeout=timeout, on_output=on_output)
+        return result
+    except CommandExecutionError as e:
+        logger.error(f"Command execution failed: {e}")
+        return {"command": command, "error": str(e)}
+    finally:
+        result_cache.finish(shell.ssh, command, None, token)
+        record_command_run(normalize_command(command), time.monotonic() - started,
+                           failed=result is None or result["exit_status"] != 0)
+
+def _run_batch(ssh: SSHLike, commands: List[str], max_concurrency: int,
+               on_output: Optional[Callable[[str, str, str], None]] = None,
+               timeout: float = DEFAULT_COMMAND_TIMEOUT, refresh: bool = False) -> List[Dict[str, Any]]:
+    """Run independent commands on parallel channels, relaying output on the calling thread."""
+    chunks: "queue.Queue[tuple]" = queue.Queue()
+    forward = (lambda cmd: lambda stream, data: chunks.put((cmd, stream, data))) if on_output else (lambda cmd: None)
+    with ThreadPoolExecutor(max_workers=min(max_concurrency, len(commands))) as executor:
+        # Each worker runs in a copy of the caller's context so its spans join the current trace.
+        futures = [executor.submit(contextvars.copy_context().run, _run_command, ssh, command, forward(command),
+                                   timeout, refresh)
+                   for command in commands]
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+            while on_output and not chunks.empty():
+                on_output(*chunks.get_nowait())
+        while on_output and not chunks.empty():
+            on_output(*chunks.get_nowait())
+        return [future.result() for future in futures]
+
+def extract_and_execute_commands(response: str, ssh: SSHLike,
+                                 on_output: Optional[Callable[[str, str, str], None]] = None,
+                                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                                 timeout: float = DEFAULT_COMMAND_TIMEOUT, refresh: bool = False,
+                                 shell: Optional[ShellSession] = None) -> List[Dict[str, Any]]:
+    """
+    Extracts shell commands from the model response and executes them on the remote server.
+    Enhances filtering, validation, and execution.
+
+    With ``shell``, the commands run one after another in that interactive shell
+    instead, so ``cd``, exported variables and a root shell carry over between them.
+
+    Independent read-only commands (``df -h``, ``free -m``, ``uptime``...) run in parallel
+    on separate channels of the same transport; stateful or mutating commands such as
+    ``cd`` or ``export`` act as barriers and run on their own, in order.
+
+    Args:
+        response (str): The text response containing shell commands.
+        ssh (PooledSSHSession | paramiko.SSHClient): The SSH connection.
+        on_output (callable): Optional ``on_output(command, stream, data)`` called with output chunks as they arrive.
+        max_concurrency (int): Maximum number of commands running at once. 1 disables parallelism.
+        timeout (float): Wall-clock limit for each command in seconds.
+        refresh (bool): Run read-only commands again instead of reusing cached results.
+        shell (ShellSession): Optional interactive shell to run the commands in.
+
+    Returns:
+        list: A list of dictionaries containing the results of each executed command, in response order.
+
+    Raises:
+        InvalidResponseError: If no commands are found in the response.
+    """
+    commands = extract_commands(response)
+    if shell is not None:
+        return [_run_in_shell(shell, command,
+                              (lambda stream, data, cmd=command: on_output(cmd, stream, data)) if on_output else None,
+                              timeout)
+                for command in commands]
+    results: List[Optional[Dict[str, Any]]] = [None] * len(commands)
+    for batch in plan_command_batches(commands):
+        if len(batch) == 1 or max_concurrency <= 1:
+            for index in batch:
+                stream_to = None
+                if on_output:
+                    stream_to = lambda stream, data, cmd=commands[index]: on_output(cmd, stream, data)
+                results[index] = _run_command(ssh, commands[index], stream_to, timeout, refresh)
+            continue
+        batch_results = _run_batch(ssh, [commands[i] for i in batch], max_concurrency, on_output, timeout, refresh)
+        for index, result in zip(batch, batch_results):
+            results[index] = result
     return results
 
 def generate_command_summary(results: List[Dict[str, Any]]) -> str:
     """
     Generates a summary of executed commands and their results.
 
+    Per-host results from fleet mode (dicts with ``host`` and ``results`` keys) are
+    grouped by host and followed by an aggregate status count. The summary ends with
+    how many results came from the command result cache and its overall hit rate.
+
     Args:
-        results (list): A list of command execution results.
+        results (list): A list of command execution results, or of per-host results.
 
     Returns:
         str: A formatted summary of the executed commands.
     """
-    summary = "Command Execution Summary:\n"
+    if results and all("host" in r and "results" in r for r in results):
+        summary = "Fleet Execution Summary:\n"
+        counts: Dict[str, int] = {}
+        for host_result in results:
+            status = host_result.get("status", "unknown")
+            counts[status] = counts.get(status, 0) + 1
+            summary += f"\nHost {host_result['host']} [{status}]:\n"
+            if host_result.get("error"):
+                summary += f"  Error: {host_result['error']}\n"
+            for line in _format_command_results(host_result["results"]).splitlines():
+                summary += f"  {line}\n" if line else "\n"
+        summary += f"\nHosts: {len(results)} total, " + ", ".join(f"{n} {status}" for status, n in sorted(counts.items())) + "\n"
+        return summary + _format_cache_summary([r for host_result in results for r in host_result["results"]])
+    return "Command Execution Summary:\n" + _format_command_results(results) + _format_cache_summary(results)
+
+def _format_command_results(results: List[Dict[str, Any]]) -> str:
+    summary = ""
     for i, result in enumerate(results, start=1):
         summary += f"\nCommand {i}:\n"
         summary += f"  Output: {result.get('output', 'No output')}\n"
         summary += f"  Error: {result.get('error', 'No error')}\n"
         summary += f"  Exit Status: {result.get('exit_status', 'Unknown')}\n"
+        if result.get("cached"):
+            summary += f"  Cached: {result['age']:.0f}s old\n"
     return summary
 
+def _format_cache_summary(results: List[Dict[str, Any]]) -> str:
+    cached = [r for r in results if r.get("cached")]
+    stats = result_cache.stats()
+    summary = f"\nResult cache: {len(cached)} of {len(results)} commands served from cache"
+    if cached:
+        summary += f" (oldest {max(r['age'] for r in cached):.0f}s)"
+    lookups = stats["hits"] + stats["misses"]
+    if lookups:
+        summary += (f"; {stats['hit_rate']:.0%} hit rate over {lookups} lookups, {stats['invalidations']} invalidations, "
+                    f"{stats['saved_seconds']:.1f}s of remote execution saved")
+    return summary + "\n"
+
 
 import socket
 
@@ -275,8 +763,10 @@ def get_local_ip():
 
 
 def get_public_ip():
+    import requests
+
     try:
-        response = requests.get("https://api.ipify.org?format=json")
+        response = requests.get("https://api.ipify.org?format=json", timeout=5)
         if response.status_code == 200:
             return response.json()["ip"]
         else:
@@ -0,0 +1,431 @@
+import asyncio
+import logging
+import queue
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Set
+
+from Core.exceptions import ModelConnectionError
+from Core.metrics import inc, observe
+
+if TYPE_CHECKING:
+    from langchain_ollama import OllamaLLM
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DEFAULT_HEALTH_CHECK_INTERVAL = 10  # Seconds between /api/tags probes of every backend
+HEALTH_CHECK_TIMEOUT = 2  # Seconds a probe may take before the backend counts as down
+DEFAULT_FIRST_TOKEN_TIMEOUT = 60  # Seconds a backend has to start answering before the next one is tried
+DEFAULT_HEDGE_AFTER = None  # Seconds without a first token before a second backend is asked too; None disables hedging
+FAILURE_BACKOFF = 2  # Seconds a failed backend is skipped, doubled for every further failure in a row
+MAX_FAILURE_BACKOFF = 60
+LATENCY_SMOOTHING = 0.3  # Weight of the newest first-token latency in a backend's moving average
+INITIAL_LATENCY = 1.0  # Seconds assumed for a backend before any backend has answered
+
+_URL_SEPARATOR = re.compile(r"[\s,;]+")
+
+
+def parse_ollama_urls(value: str) -> List[str]:
+    """Split a comma- or whitespace-separated list of Ollama URLs, dropping duplicates and trailing slashes."""
+    urls: List[str] = []
+    for url in _URL_SEPARATOR.split(value or ""):
+        url = url.rstrip("/")
+        if url and url not in urls:
+            urls.append(url)
+    return urls
+
+
+class OllamaBackend:
+    """
+    One Ollama server, shared by every router that uses it.
+
+    Tracks requests in flight, a moving average of the time to the first token, the
+    models it serves and whether it is healthy. Failed requests take the backend out
+    of rotation for an exponentially growing backoff.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.healthy = True  # Until a health check or a request says otherwise
+        self.models: Optional[Set[str]] = None  # Unknown until the first health check
+        self.in_flight = 0
+        self.latency: Optional[float] = None
+        self.failures = 0
+        self.down_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self._clients: Dict[str, "OllamaLLM"] = {}
+        self._lock = threading.Lock()
+
+    def client(self, model: str) -> "OllamaLLM":
+        with self._lock:
+            client = self._clients.get(model)
+        if client is None:
+            from langchain_ollama import OllamaLLM
+
+            client = OllamaLLM(model=model, base_url=self.url)
+            with self._lock:
+                client = self._clients.setdefault(model, client)
+        return client
+
+    def serves(self, model: str) -> bool:
+        models = self.models
+        return models is None or model in models or f"{model}:latest" in models
+
+    def available(self, now: float) -> bool:
+        return self.healthy and now >= self.down_until
+
+    def load(self, default_latency: float) -> float:
+        """Expected wait for one more request: requests in flight (plus this one) times the latency."""
+        return (self.in_flight + 1) * (self.latency if self.latency is not None else default_latency)
+
+    @contextmanager
+    def acquire(self):
+        with self._lock:
+            self.in_flight += 1
+            self.requests += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def record_success(self, latency: float) -> None:
+        with self._lock:
+            self.latency = latency if self.latency is None else \
+                LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * self.latency
+            self.failures = 0
+            self.down_until = 0.0
+        observe("llm_backend_first_token", latency, backend=self.url)
+
+    def record_failure(self, error: Exception) -> None:
+        with self._lock:
+            self.failures += 1
+            self.errors += 1
+            backoff = min(MAX_FAILURE_BACKOFF, FAILURE_BACKOFF * 2 ** (self.failures - 1))
+            self.down_until = time.monotonic() + backoff
+        inc("llm_backend_errors", backend=self.url)
+        logger.warning(f"Ollama backend {self.url} failed ({error}); skipping it for {backoff}s.")
+
+    def check(self) -> bool:
+        """Probe ``/api/tags`` and refresh the health flag and model list. Returns whether the backend is healthy."""
+        import requests
+
+        try:
+            response = requests.get(f"{self.url}/api/tags", timeout=HEALTH_CHECK_TIMEOUT)
+            response.raise_for_status()
+            models = {model["name"] for model in response.json().get("models", [])}
+        except Exception as e:
+            if self.healthy:
+                logger.warning(f"Ollama backend {self.url} failed its health check: {e}")
+            self.healthy = False
+            return False
+        with self._lock:
+            if not self.healthy:
+                logger.info(f"Ollama backend {self.url} is healthy again.")
+                self.failures = 0
+                self.down_until = 0.0
+            self.healthy = True
+            self.models = models
+        return True
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "backend": self.url,
+            "healthy": self.healthy and time.monotonic() >= self.down_until,
+            "in flight": self.in_flight,
+            "latency ms": round(1000 * self.latency, 1) if self.latency is not None else None,
+            "requests": self.requests,
+            "errors": self.errors,
+        }
+
+
+class _HealthChecker:
+    """Daemon thread that probes every registered backend every ``interval`` seconds."""
+
+    def __init__(self, interval: float = DEFAULT_HEALTH_CHECK_INTERVAL):
+        self.interval = interval
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="ollama-health", daemon=True)
+                    self._thread.start()
+
+    def check_now(self) -> None:
+        self._wake.set()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.clear()
+            for backend in list(_backends.values()):
+                backend.check()
+            self._wake.wait(self.interval)
+
+
+_backends: Dict[str, OllamaBackend] = {}
+_backends_lock = threading.Lock()
+_health_checker = _HealthChecker()
+
+
+def get_backend(url: str) -> OllamaBackend:
+    """Return the shared backend for ``url``, registering it for health checks on first use."""
+    with _backends_lock:
+        backend = _backends.get(url)
+        if backend is None:
+            backend = _backends[url] = OllamaBackend(url)
+            _health_checker.check_now()
+    _health_checker.ensure_started()
+    return backend
+
+
+def backend_status() -> List[Dict[str, Any]]:
+    """Health, load and latency of every backend used so far, for the diagnostics panel."""
+    with _backends_lock:
+        backends = list(_backends.values())
+    return [backend.status() for backend in backends]
+
+
+class _Race:
+    """
+    Decides which backends one request is sent to and whose answer it uses.
+
+    The request goes to the least loaded backend. When it fails or sends no token within
+    ``first_token_timeout``, the next backend is tried; with ``hedge_after`` a second
+    backend is also asked once the first has been silent that long. The first backend
+    to send a token wins and the others are cancelled. Shared by the thread-based
+    ``stream`` and the asyncio ``astream``, which supply ``launch`` and ``cancel``.
+    """
+
+    def __init__(self, router: "LLMRouter", launch: Callable[[OllamaBackend], None],
+                 cancel: Callable[[OllamaBackend], None]):
+        self.router = router
+        self._pending = iter(router.candidates())
+        self._launch = launch
+        self._cancel = cancel
+        self.running: Dict[OllamaBackend, float] = {}
+        self.first: Optional[OllamaBackend] = None
+        self.winner: Optional[OllamaBackend] = None
+        self.hedged = False
+        self.errors: List[str] = []
+
+    def start(self) -> None:
+        if not self._launch_next():
+            raise ModelConnectionError("No Ollama backends configured.")
+
+    def _launch_next(self) -> bool:
+        backend = next(self._pending, None)
+        if backend is None:
+            return False
+        self.first = self.first or backend
+        self.running[backend] = time.monotonic()
+        self._launch(backend)
+        return True
+
+    def _can_hedge(self) -> bool:
+        return self.router.hedge_after is not None and not self.hedged and len(self.running) == 1
+
+    def wait_time(self) -> Optional[float]:
+        """Seconds until the next timeout or hedge, or None once a backend is answering."""
+        if self.winner is not None:
+            return None
+        deadlines = [started + self.router.first_token_timeout for started in self.running.values()]
+        if self._can_hedge():
+            deadlines.append(min(self.running.values()) + self.router.hedge_after)
+        return max(0.0, min(deadlines) - time.monotonic())
+
+    def timed_out(self) -> None:
+        now = time.monotonic()
+        if self._can_hedge() and now >= min(self.running.values()) + self.router.hedge_after:
+            self.hedged = True
+            if self._launch_next():
+                inc("llm_hedged_requests")
+                logger.info(f"No token after {self.router.hedge_after}s; also asking another Ollama backend.")
+            return
+        for backend, started in list(self.running.items()):
+            if now - started >= self.router.first_token_timeout:
+                self._cancel(backend)
+                self._fail(backend, TimeoutError(f"no token within {self.router.first_token_timeout}s"))
+
+    def token(self, backend: OllamaBackend) -> bool:
+        """Record a token from ``backend``; returns whether it belongs to the answer."""
+        if self.winner is None and backend in self.running:
+            self.winner = backend
+            backend.record_success(time.monotonic() - self.running.pop(backend))
+            for other in list(self.running):
+                self._cancel(other)
+            self.running.clear()
+            if self.hedged and backend is not self.first:
+                inc("llm_hedge_wins")
+        return backend is self.winner
+
+    def done(self, backend: OllamaBackend) -> bool:
+        """Record the end of ``backend``'s stream; returns whether the answer is complete."""
+        self.token(backend)  # An empty answer still counts as one
+        return backend is self.winner
+
+    def error(self, backend: OllamaBackend, error: Exception) -> None:
+        if backend is self.winner:
+            backend.record_failure(error)
+            raise ModelConnectionError(f"Ollama backend {backend.url} failed mid-response: {error}")
+        if backend in self.running:
+            self._fail(backend, error)
+
+    def _fail(self, backend: OllamaBackend, error: Exception) -> None:
+        del self.running[backend]
+        backend.record_failure(error)
+        self.errors.append(f"{backend.url}: {error}")
+        if not self.running:
+            if not self._launch_next():
+                raise ModelConnectionError(f"All Ollama backends failed: {'; '.join(self.errors)}")
+            inc("llm_failovers")
+
+    def close(self) -> None:
+        """Stop every attempt, the winner included: a caller that stops reading early must free its slot."""
+        for backend in self.running:
+            self._cancel(backend)
+        self.running.clear()
+        if self.winner is not None:
+            self._cancel(self.winner)
+
+
+class LLMRouter:
+    """
+    Spreads generations for one model over several Ollama servers.
+
+    Quacks like ``OllamaLLM`` (``model``, ``base_url``, ``invoke``, ``stream`` and
+    ``astream``), so ``ask_question_to_model`` and the async engine use it unchanged.
+    Each request goes to the healthy backend with the lowest expected wait (requests
+    in flight times first-token latency), fails over to the next one on an error or
+    ``first_token_timeout``, and with ``hedge_after`` is duplicated to a second backend
+    when the first is slow to answer. Failover only happens before the first token;
+    a backend that fails mid-response fails the request.
+
+    Args:
+        model (str): The model name; backends whose model list lacks it are only used as a last resort.
+        urls (list): Base URLs of the Ollama servers.
+        first_token_timeout (float): Seconds a backend has to send its first token.
+        hedge_after (float): Seconds before a duplicate request goes to a second backend, or None.
+    """
+
+    def __init__(self, model: str, urls: List[str], first_token_timeout: float = DEFAULT_FIRST_TOKEN_TIMEOUT,
+                 hedge_after: Optional[float] = DEFAULT_HEDGE_AFTER):
+        if not urls:
+            raise ModelConnectionError("No Ollama backends configured.")
+        self.model = model
+        self.base_url = urls[0]  # Used for the semantic cache's embeddings
+        self.backends = [get_backend(url) for url in urls]
+        self.first_token_timeout = first_token_timeout
+        self.hedge_after = hedge_after
+
+    def candidates(self) -> List[OllamaBackend]:
+        """Backends in the order a request tries them: available ones by load, then resting ones by backoff."""
+        now = time.monotonic()
+        backends = [backend for backend in self.backends if backend.serves(self.model)] or self.backends
+        latencies = [backend.latency for backend in backends if backend.latency is not None]
+        default_latency = min(latencies, default=INITIAL_LATENCY)
+        ready = sorted((b for b in backends if b.available(now)), key=lambda b: b.load(default_latency))
+        resting = sorted((b for b in backends if not b.available(now)), key=lambda b: b.down_until)
+        return ready + resting
+
+    def invoke(self, prompt: str) -> str:
+        return "".join(self.stream(prompt))
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """Stream tokens from whichever backend answers first; each attempt runs on a daemon thread."""
+        events: "queue.Queue[tuple]" = queue.Queue()
+        stops: Dict[OllamaBackend, threading.Event] = {}
+
+        def launch(backend: OllamaBackend) -> None:
+            stop = stops[backend] = threading.Event()
+            threading.Thread(target=self._pump, args=(backend, prompt, events, stop),
+                             name="ollama-stream", daemon=True).start()
+
+        race = _Race(self, launch, lambda backend: stops[backend].set())
+        try:
+            race.start()
+            while True:
+                try:
+                    backend, kind, value = events.get(timeout=race.wait_time())
+                except queue.Empty:
+                    race.timed_out()
+                    continue
+                if kind == "token":
+                    if race.token(backend):
+                        yield value
+                elif kind == "done":
+                    if race.done(backend):
+                        return
+                else:
+                    race.error(backend, value)
+        finally:
+            race.close()
+
+    def _pump(self, backend: OllamaBackend, prompt: str, events: "queue.Queue[tuple]",
+              stop: threading.Event) -> None:
+        with backend.acquire():
+            try:
+                tokens = backend.client(self.model).stream(prompt)
+                try:
+                    for token in tokens:
+                        if stop.is_set():
+                            return
+                        events.put((backend, "token", token))
+                finally:
+                    # Closing the generator closes the HTTP stream, which stops generation on the server.
+                    tokens.close()
+            except Exception as e:
+                events.put((backend, "error", e))
+                return
+        events.put((backend, "done", None))
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        """Async counterpart of ``stream``; each attempt is a task on the running loop."""
+        events: "asyncio.Queue[tuple]" = asyncio.Queue()
+        tasks: Dict[OllamaBackend, asyncio.Task] = {}
+
+        def launch(backend: OllamaBackend) -> None:
+            tasks[backend] = asyncio.ensure_future(self._apump(backend, prompt, events))
+
+        race = _Race(self, launch, lambda backend: tasks[backend].cancel())
+        try:
+            race.start()
+            while True:
+                try:
+                    backend, kind, value = await asyncio.wait_for(events.get(), race.wait_time())
+                except asyncio.TimeoutError:
+                    race.timed_out()
+                    continue
+                if kind == "token":
+                    if race.token(backend):
+                        yield value
+                elif kind == "done":
+                    if race.done(backend):
+                        return
+                else:
+                    race.error(backend, value)
+        finally:
+            race.close()
+
+    async def _apump(self, backend: OllamaBackend, prompt: str, events: "asyncio.Queue[tuple]") -> None:
+        with backend.acquire():
+            try:
+                tokens = backend.client(self.model).astream(prompt)
+                try:
+                    async for token in tokens:
+                        events.put_nowait((backend, "token", token))
+                finally:
+                    await tokens.aclose()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                events.put_nowait((backend, "error", e))
+                return
+        events.put_nowait((backend, "done", None))
@@ -0,0 +1,266 @@
+import bisect
+import contextvars
+import functools
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Constants
+METRIC_PREFIX = "devops_assistant"
+# Latency buckets in seconds, from sub-millisecond SQLite calls to multi-minute commands.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+RECENT_TRACES = 50  # Finished traces kept for the diagnostics panel
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Optional[Dict[str, Any]]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in (labels or {}).items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram, one series per label set."""
+
+    def __init__(self, name: str, help_text: str = "", buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series: Dict[LabelKey, List[float]] = {}  # bucket counts..., +Inf count, sum
+
+    def observe(self, value: float, key: LabelKey = ()) -> None:
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def quantile(self, q: float, key: LabelKey = ()) -> Optional[float]:
+        """Estimate a quantile by linear interpolation inside the bucket that contains it."""
+        series = self._series.get(key)
+        if not series:
+            return None
+        counts = series[:-1]
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0.0
+        for i, count in enumerate(counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def summary(self) -> Dict[LabelKey, Dict[str, float]]:
+        result = {}
+        for key, series in self._series.items():
+            count = sum(series[:-1])
+            result[key] = {
+                "count": count,
+                "mean": series[-1] / count if count else 0.0,
+                "p50": self.quantile(0.5, key),
+                "p95": self.quantile(0.95, key),
+                "p99": self.quantile(0.99, key),
+            }
+        return result
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self._series.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', repr(float(bound))))} {cumulative:g}")
+            cumulative += series[len(self.buckets)]
+            lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {cumulative:g}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative:g}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str = ""):
+        self.name = name
+        self.help_text = help_text
+        self._series: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, key: LabelKey = ()) -> None:
+        self._series[key] = self._series.get(key, 0.0) + amount
+
+    def values(self) -> Dict[LabelKey, float]:
+        return dict(self._series)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._series.items()):
+            lines.append(f"{self.name}{_format_labels(key)} {value:g}")
+        return lines
+
+
+class MetricsRegistry:
+    """Process-wide histograms, counters and recent request traces."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Histogram] = {}
+        self._counters: Dict[str, Counter] = {}
+        self.recent_traces: "deque[Dict[str, Any]]" = deque(maxlen=RECENT_TRACES)
+
+    def observe(self, name: str, seconds: float, labels: Optional[Dict[str, Any]] = None,
+                help_text: str = "") -> None:
+        full_name = f"{METRIC_PREFIX}_{name}_seconds"
+        with self._lock:
+            histogram = self._histograms.get(full_name)
+            if histogram is None:
+                histogram = self._histograms[full_name] = Histogram(full_name, help_text or f"{name} latency")
+            histogram.observe(seconds, _label_key(labels))
+
+    def inc(self, name: str, amount: float = 1.0, labels: Optional[Dict[str, Any]] = None,
+            help_text: str = "") -> None:
+        full_name = f"{METRIC_PREFIX}_{name}_total"
+        with self._lock:
+            counter = self._counters.get(full_name)
+            if counter is None:
+                counter = self._counters[full_name] = Counter(full_name, help_text or name)
+            counter.inc(amount, _label_key(labels))
+
+    def histogram_summaries(self) -> Dict[str, Dict[LabelKey, Dict[str, float]]]:
+        with self._lock:
+            return {name: h.summary() for name, h in sorted(self._histograms.items())}
+
+    def counter_values(self) -> Dict[str, Dict[LabelKey, float]]:
+        with self._lock:
+            return {name: c.values() for name, c in sorted(self._counters.items())}
+
+    def render_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        with self._lock:
+            lines = []
+            for histogram in sorted(self._histograms.values(), key=lambda h: h.name):
+                lines.extend(histogram.render())
+            for counter in sorted(self._counters.values(), key=lambda c: c.name):
+                lines.extend(counter.render())
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self.recent_traces.clear()
+
+
+metrics = MetricsRegistry()
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def trace(name: str, **attributes) -> Iterator[Dict[str, Any]]:
+    """
+    Group the spans of one user request.
+
+    Spans recorded while the trace is active (in this thread or context) are
+    attached to it, and the finished trace is kept in ``metrics.recent_traces``.
+    """
+    record = {"id": uuid.uuid4().hex[:12], "name": name, "start": time.time(),
+              "attributes": dict(attributes), "spans": []}
+    token = _current_trace.set(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["duration"] = time.perf_counter() - started
+        _current_trace.reset(token)
+        metrics.observe(f"{name}_request", record["duration"])
+        metrics.recent_traces.append(record)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Dict[str, Any]]:
+    """
+    Time a block, record it in the ``<name>_seconds`` histogram and attach it to the current trace.
+
+    Attributes set on the yielded dict (e.g. ``span["bytes"] = n``) are kept with the span.
+    A ``status`` label of ``error`` is added when the block raises.
+    """
+    record = {"name": name, "attributes": dict(attributes)}
+    labels = {k: v for k, v in attributes.items() if k in ("op", "tier", "stream", "status")}
+    started = time.perf_counter()
+    try:
+        yield record["attributes"]
+    except BaseException:
+        labels["status"] = "error"
+        raise
+    finally:
+        record["duration"] = time.perf_counter() - started
+        metrics.observe(name, record["duration"], labels)
+        current = _current_trace.get()
+        if current is not None:
+            current["spans"].append(record)
+
+
+def timed(name: str):
+    """Decorator form of ``span`` for timing a whole function."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe(name: str, seconds: float, **labels) -> None:
+    """Record a duration measured outside a ``span`` block (e.g. time to first token)."""
+    metrics.observe(name, seconds, labels)
+    current = _current_trace.get()
+    if current is not None:
+        current["spans"].append({"name": name, "duration": seconds, "attributes": labels})
+
+
+def inc(name: str, amount: float = 1.0, **labels) -> None:
+    metrics.inc(name, amount, labels)
+    current = _current_trace.get()
+    if current is not None:
+        counters = current["attributes"].setdefault("counters", {})
+        key = name if not labels else f"{name}[{','.join(f'{k}={v}' for k, v in sorted(labels.items()))}]"
+        counters[key] = counters.get(key, 0) + amount
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve ``/metrics`` in the Prometheus text format from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-exporter", daemon=True).start()
+    logger.info(f"Metrics exporter listening on {host}:{server.server_address[1]}/metrics")
+    return server
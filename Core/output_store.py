@@ -0,0 +1,278 @@
+import logging
+import mmap
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from Core.metrics import inc
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DEFAULT_SPILL_BYTES = 64 * 1024  # Outputs larger than this go to a temp file instead of memory
+DEFAULT_SESSION_MEMORY_BUDGET = 1024 * 1024  # Output bytes one session may keep in memory; the oldest spill beyond it
+DEFAULT_SESSION_DISK_BUDGET = 64 * 1024 * 1024  # Spilled output bytes per session; the oldest runs are dropped beyond it
+DEFAULT_MAX_RUNS = 10  # Question runs whose results a session keeps
+DEFAULT_PREVIEW_LINES = 20  # Lines shown from each end of a long output
+DEFAULT_PREVIEW_BYTES = 16 * 1024  # Most bytes a preview shows, for outputs with very long lines
+DEFAULT_PAGE_LINES = 500  # Lines per page when a long output is opened in full
+INDEX_STRIDE = 64  # Every 64th line start is indexed; lines in between are found by scanning
+SPILL_PREFIX = "devops-assistant-output-"
+
+
+class StoredOutput:
+    """
+    One command output, held as UTF-8 bytes in memory or in a memory-mapped temp file.
+
+    Only every ``INDEX_STRIDE``-th line start is indexed, so paging through a 5 MB
+    output costs a few KB of index however short its lines are. Spilled outputs
+    live in an unlinked temp file: the page cache holds them, not the Python heap,
+    and the file disappears when the output is closed or the process exits.
+
+    Args:
+        text (str): The output.
+        spill_bytes (int): Outputs larger than this are spilled right away.
+    """
+
+    def __init__(self, text: str, spill_bytes: int = DEFAULT_SPILL_BYTES):
+        data = text.encode("utf-8", "replace")
+        self.size = len(data)
+        newlines = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 10)
+        self.line_count = len(newlines) + (1 if data and data[-1] != 10 else 0)
+        self._checkpoints = np.concatenate(([0], newlines[INDEX_STRIDE - 1::INDEX_STRIDE] + 1)).astype(np.int64)
+        self._buffer: Any = data
+        self.spilled = False
+        self.closed = False
+        self._lock = threading.Lock()
+        if self.size > spill_bytes:
+            self.spill()
+
+    @property
+    def resident_bytes(self) -> int:
+        """Bytes this output keeps on the Python heap."""
+        return self._checkpoints.nbytes + (0 if self.spilled or self.closed else self.size)
+
+    def spill(self) -> None:
+        """Move the output into a memory-mapped temp file. Empty and spilled outputs are left alone."""
+        with self._lock:
+            if self.spilled or self.closed or not self.size:
+                return
+            with tempfile.TemporaryFile(prefix=SPILL_PREFIX) as f:
+                f.write(self._buffer)
+                f.flush()
+                # The mapping keeps the (already unlinked) file alive after it is closed.
+                self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.spilled = True
+        inc("output_spills")
+
+    def close(self) -> None:
+        """Release the output; later reads return an empty string."""
+        with self._lock:
+            if isinstance(self._buffer, mmap.mmap):
+                self._buffer.close()
+            self._buffer = b""
+            self.closed = True
+
+    def _offset(self, line: int) -> int:
+        """Byte offset where ``line`` starts. Caller holds the lock."""
+        if line >= self.line_count:
+            return self.size
+        checkpoint, remainder = divmod(line, INDEX_STRIDE)
+        offset = int(self._checkpoints[checkpoint])
+        for _ in range(remainder):
+            offset = self._buffer.find(b"\n", offset) + 1
+        return offset
+
+    def lines(self, start: int, stop: int) -> str:
+        """
+        Return lines ``start`` up to (not including) ``stop``, without the final newline.
+
+        Args:
+            start (int): First line, counting from 0.
+            stop (int): Line to stop before.
+
+        Returns:
+            str: The lines joined with newlines.
+        """
+        start, stop = max(0, start), min(self.line_count, stop)
+        if start >= stop:
+            return ""
+        with self._lock:
+            if self.closed:
+                return ""
+            begin = self._offset(start)
+            end = self._offset(stop)
+            data = self._buffer[begin:end]
+        if data.endswith(b"\n"):
+            data = data[:-1]
+        return data.decode("utf-8", "replace")
+
+    def text(self) -> str:
+        """The whole output. Only use this for small outputs or a deferred download."""
+        return self.lines(0, self.line_count)
+
+    def preview(self, lines: int = DEFAULT_PREVIEW_LINES, max_bytes: int = DEFAULT_PREVIEW_BYTES) -> str:
+        """
+        The first and last ``lines`` lines, at most ``max_bytes`` in all, with a note of what was left out.
+
+        Short outputs are returned whole.
+        """
+        if self.line_count <= 2 * lines and self.size <= max_bytes:
+            return self.text()
+        with self._lock:
+            if self.closed:
+                return ""
+            head_end = min(self._offset(lines), max_bytes // 2)
+            tail_start = max(self._offset(max(0, self.line_count - lines)), self.size - max_bytes // 2, head_end)
+            head, tail = self._buffer[:head_end], self._buffer[tail_start:]
+        omitted = tail_start - head_end
+        head = head.decode("utf-8", "replace").rstrip("\n")
+        tail = tail.decode("utf-8", "replace").rstrip("\n")
+        return f"{head}\n... {omitted:,} bytes not shown ...\n{tail}"
+
+    def page_count(self, page_lines: int = DEFAULT_PAGE_LINES) -> int:
+        return max(1, -(-self.line_count // page_lines))
+
+    def page(self, number: int, page_lines: int = DEFAULT_PAGE_LINES) -> str:
+        """Page ``number`` (from 0) of ``page_lines`` lines."""
+        return self.lines(number * page_lines, (number + 1) * page_lines)
+
+    def __repr__(self) -> str:
+        where = "closed" if self.closed else "spilled" if self.spilled else "memory"
+        return f"StoredOutput({self.line_count} lines, {self.size} bytes, {where})"
+
+
+def _outputs_of(result: Dict[str, Any]) -> List[StoredOutput]:
+    if "results" in result:
+        return [output for r in result["results"] for output in _outputs_of(r)]
+    output = result.get("output")
+    return [output] if isinstance(output, StoredOutput) else []
+
+
+def preview_results(results: List[Dict[str, Any]], lines: int = DEFAULT_PREVIEW_LINES) -> List[Dict[str, Any]]:
+    """
+    Copy stored results with every output replaced by its head/tail preview.
+
+    Works on command results and on fleet per-host results, so the copy can go to
+    ``generate_command_summary`` without reading whole outputs back into memory.
+    """
+    previews = []
+    for result in results:
+        if "results" in result:
+            previews.append({**result, "results": preview_results(result["results"], lines)})
+        elif isinstance(result.get("output"), StoredOutput):
+            previews.append({**result, "output": result["output"].preview(lines)})
+        else:
+            previews.append(result)
+    return previews
+
+
+class SessionOutputs:
+    """
+    Bounded store for the command results of one Streamlit session.
+
+    Results are grouped in runs, one per submitted question. Outputs over
+    ``spill_bytes`` are spilled on arrival, and smaller ones are spilled oldest
+    first once the session holds more than ``memory_budget`` bytes of them. Once
+    spilled outputs exceed ``disk_budget``, or there are more than ``max_runs``
+    runs, the oldest runs are dropped. The run being filled is never dropped.
+
+    Args:
+        memory_budget (int): Output bytes kept on the heap.
+        disk_budget (int): Output bytes kept in temp files.
+        max_runs (int): Runs kept.
+        spill_bytes (int): Size above which an output is spilled on arrival.
+    """
+
+    def __init__(self, memory_budget: int = DEFAULT_SESSION_MEMORY_BUDGET,
+                 disk_budget: int = DEFAULT_SESSION_DISK_BUDGET, max_runs: int = DEFAULT_MAX_RUNS,
+                 spill_bytes: int = DEFAULT_SPILL_BYTES):
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.max_runs = max_runs
+        self.spill_bytes = spill_bytes
+        self.runs: List[Dict[str, Any]] = []
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def new_run(self, question: str, response: str = "", fleet: bool = False) -> Dict[str, Any]:
+        """
+        Start a run for a question, dropping the oldest runs past ``max_runs``.
+
+        Returns:
+            dict: The run, with ``id``, ``question``, ``response``, ``fleet``, ``started`` and ``results``.
+        """
+        run = {"id": self._next_id, "question": question, "response": response, "fleet": fleet,
+               "started": time.time(), "results": []}
+        with self._lock:
+            self._next_id += 1
+            self.runs.append(run)
+            while len(self.runs) > self.max_runs:
+                self._drop_oldest()
+        return run
+
+    def keep(self, run: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Store a command result, or a fleet per-host result, in ``run``.
+
+        Returns:
+            dict: A copy of ``result`` whose outputs are ``StoredOutput`` objects.
+        """
+        if "results" in result:
+            stored = {**result, "results": [self._store(r) for r in result["results"]]}
+        else:
+            stored = self._store(result)
+        with self._lock:
+            run["results"].append(stored)
+            self._enforce(run)
+        return stored
+
+    def _store(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        output = result.get("output")
+        if isinstance(output, StoredOutput):
+            return result
+        return {**result, "output": StoredOutput(output or "", self.spill_bytes)}
+
+    def _outputs(self):
+        for run in self.runs:
+            for result in run["results"]:
+                yield from _outputs_of(result)
+
+    def _enforce(self, current: Dict[str, Any]) -> None:
+        """Spill, then drop runs, until the session is within budget. Caller holds the lock."""
+        resident = sum(output.resident_bytes for output in self._outputs())
+        for output in self._outputs():
+            if resident <= self.memory_budget:
+                break
+            if not output.spilled and output.size:
+                before = output.resident_bytes
+                output.spill()
+                resident -= before - output.resident_bytes
+        while self.runs[0] is not current and self.disk_bytes() > self.disk_budget:
+            self._drop_oldest()
+
+    def _drop_oldest(self) -> None:
+        run = self.runs.pop(0)
+        for result in run["results"]:
+            for output in _outputs_of(result):
+                output.close()
+        inc("output_runs_evicted")
+        logger.debug(f"Dropped stored results of run {run['id']} to stay within the session budget")
+
+    def disk_bytes(self) -> int:
+        return sum(output.size for output in self._outputs() if output.spilled and not output.closed)
+
+    def memory_bytes(self) -> int:
+        return sum(output.resident_bytes for output in self._outputs())
+
+    def get(self, run_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return next((run for run in self.runs if run["id"] == run_id), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            while self.runs:
+                self._drop_oldest()
@@ -0,0 +1,200 @@
+import re
+from typing import List, Optional, Sequence
+
+# Constants
+FENCE = "```"
+BASH_LANGUAGE = "bash"
+SHELL_LANGUAGES = ("bash", "sh", "shell", "zsh", "console", "")  # Fence languages treated as shell code
+MALFORMED_PREFIX_CHARS = 400  # Prose allowed before the first fence before a response counts as malformed
+
+
+class StreamingFenceParser:
+    """
+    Incrementally extracts ```bash fenced blocks from a token stream.
+
+    Feed it chunks as they arrive. ``partial`` holds the text of the block being
+    generated so it can be shown right away, ``blocks`` the completed blocks, and
+    ``malformed`` becomes True as soon as the response can no longer produce a
+    valid block in the expected format (a non-bash fence, or too much prose before
+    any fence), so the caller can abort generation and retry.
+    """
+
+    def __init__(self, malformed_prefix_chars: int = MALFORMED_PREFIX_CHARS):
+        self.malformed_prefix_chars = malformed_prefix_chars
+        self.text = ""
+        self.blocks: List[str] = []
+        self.partial: Optional[str] = None
+        self.malformed = False
+        self._pos = 0  # Start of the not yet consumed text
+        self._block_start: Optional[int] = None
+
+    @property
+    def has_block(self) -> bool:
+        return bool(self.blocks)
+
+    def feed(self, chunk: str) -> None:
+        self.text += chunk
+        while not self.malformed:
+            if self._block_start is None:
+                if not self._seek_open():
+                    break
+            elif not self._seek_close():
+                break
+
+    def _seek_open(self) -> bool:
+        fence = self.text.find(FENCE, self._pos)
+        if fence < 0:
+            if not self.blocks and len(self.text[self._pos:].strip()) > self.malformed_prefix_chars:
+                self.malformed = True
+            return False
+        newline = self.text.find("\n", fence)
+        if newline < 0:
+            return False
+        language = self.text[fence + len(FENCE):newline].strip().lower()
+        if language != BASH_LANGUAGE:
+            self.malformed = True
+            return False
+        self._block_start = newline + 1
+        self._pos = self._block_start
+        self.partial = ""
+        return True
+
+    def _seek_close(self) -> bool:
+        # The block closes on "\n```". A match not found yet can only start in the last few characters.
+        close = self.text.find("\n" + FENCE, self._pos)
+        if close < 0:
+            self.partial = self.text[self._block_start:]
+            self._pos = max(self._block_start, len(self.text) - len(FENCE))
+            return False
+        block = self.text[self._block_start:close]
+        self.blocks.append(block)
+        self.partial = None
+        self._pos = close + 1 + len(FENCE)
+        self._block_start = None
+        return True
+
+
+_FENCED_BLOCK = re.compile(r"```[ \t]*([\w+-]*)[^\n]*\n(.*?)\n?[ \t]*```", re.DOTALL)
+
+# Characters that can change whether a newline ends the current command. The scanner
+# jumps from one to the next, so plain text is skipped at regex speed.
+_SHELL_SPECIAL = re.compile(r"[\n#<{}\\'\"`();&|]")
+_SHELL_KEYWORD = re.compile(r"[ \t]*(if|for|while|until|case|select|fi|done|esac)(?=[\s;&|)]|$)")
+_HEREDOC = re.compile(r"<<(-?)[ \t]*(['\"]?)\\?([\w.-]+)\2")
+_DOUBLE_QUOTED_REST = re.compile(r'(?:[^"\\]|\\.)*"', re.DOTALL)
+_COMPOUND_OPENERS = {"if", "for", "while", "until", "case", "select"}
+_WORD_START = " \t\n;&|("
+_CONTINUATION_OPERATORS = ("&&", "||", "|")
+
+
+def fenced_blocks(text: str, languages: Sequence[str] = SHELL_LANGUAGES) -> List[str]:
+    """Return the bodies of the fenced code blocks in ``text`` whose language is in ``languages``."""
+    return [body for language, body in _FENCED_BLOCK.findall(text) if language.lower() in languages]
+
+
+def split_commands(block: str) -> List[str]:
+    """
+    Split the body of a shell code block into commands in a single linear pass.
+
+    A newline ends a command unless it is escaped (line continuation), inside quotes,
+    backticks, parentheses or a ``{ ... }`` group, inside an ``if``/``for``/``while``/
+    ``case`` compound, follows ``&&``, ``||`` or ``|``, or starts a heredoc body, which
+    runs up to its delimiter line. Comments are skipped for quoting purposes, and
+    comment-only lines are dropped. Nothing inside a command is rewritten, so ``$VAR``
+    and ``#`` in arguments are preserved.
+
+    Args:
+        block (str): The text between the fences.
+
+    Returns:
+        list: The commands, stripped of surrounding whitespace, in order.
+    """
+    commands = []
+    start = 0  # Start of the current command
+    line_start = 0
+    depth = 0  # Open brace groups and compound statements
+    parens = 0  # Open parentheses; tracked apart since case patterns close ones never opened
+    heredocs = []  # (strip_tabs, delimiter) whose bodies start after the current line
+    end = len(block)
+    pos, depth = _keyword(block, 0, depth)
+    while pos < end:
+        match = _SHELL_SPECIAL.search(block, pos)
+        if match is None:
+            break
+        i = match.start()
+        char = block[i]
+        pos = i + 1
+        if char == "\n":
+            line = block[line_start:i].rstrip()
+            for strip_tabs, delimiter in heredocs:
+                pos = _skip_heredoc_body(block, pos, delimiter, strip_tabs)
+            heredocs = []
+            line_start = pos
+            if not (depth or parens or line.endswith(_CONTINUATION_OPERATORS)):
+                _append_command(commands, block[start:pos])
+                start = pos
+            pos, depth = _keyword(block, pos, depth)
+        elif char in ";&|":
+            pos, depth = _keyword(block, pos, depth)
+        elif char == "#":
+            if i == 0 or block[i - 1] in _WORD_START:
+                newline = block.find("\n", pos)
+                pos = end if newline < 0 else newline
+        elif char == "\\":
+            pos += 1
+        elif char in "'`":
+            closing = block.find(char, pos)
+            pos = end if closing < 0 else closing + 1
+        elif char == '"':
+            rest = _DOUBLE_QUOTED_REST.match(block, pos)
+            pos = rest.end() if rest else end
+        elif char == "<":
+            if block.startswith("<<<", i):
+                pos = i + 3
+            else:
+                heredoc = _HEREDOC.match(block, i)
+                if heredoc:
+                    heredocs.append((heredoc.group(1) == "-", heredoc.group(3)))
+                    pos = heredoc.end()
+        elif char == "(":
+            parens += 1
+            pos, depth = _keyword(block, pos, depth)
+        elif char == ")":
+            parens = max(parens - 1, 0)
+        elif char == "{":
+            if (i == 0 or block[i - 1] in _WORD_START) and block[pos:pos + 1].isspace():
+                depth += 1
+        elif char == "}":
+            if i == 0 or block[i - 1] in " \t\n;&":
+                depth = max(depth - 1, 0)
+    _append_command(commands, block[start:])
+    return commands
+
+
+def _keyword(block: str, pos: int, depth: int):
+    """Account for a compound keyword (``if``, ``done``...) at a command position."""
+    keyword = _SHELL_KEYWORD.match(block, pos)
+    if keyword is None:
+        return pos, depth
+    if keyword.group(1) in _COMPOUND_OPENERS:
+        return keyword.end(), depth + 1
+    return keyword.end(), max(depth - 1, 0)
+
+
+def _skip_heredoc_body(block: str, pos: int, delimiter: str, strip_tabs: bool) -> int:
+    """Return the position just after the heredoc's delimiter line (or the end of the block)."""
+    end = len(block)
+    while pos < end:
+        newline = block.find("\n", pos)
+        line_end = end if newline < 0 else newline
+        line = block[pos:line_end]
+        pos = end if newline < 0 else newline + 1
+        if (line.lstrip("\t") if strip_tabs else line).rstrip() == delimiter:
+            break
+    return pos
+
+
+def _append_command(commands: List[str], text: str) -> None:
+    command = text.strip()
+    if command and not command.startswith("#"):
+        commands.append(command)
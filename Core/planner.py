@@ -0,0 +1,351 @@
+import re
+import shlex
+from typing import Any, Dict, List, Optional, Tuple
+
+# Builtins whose effect is the shell state seen by the following commands.
+STATEFUL_BUILTINS = {
+    "cd", "pushd", "popd", "export", "unset", "set", "source", ".", "alias", "unalias",
+    "umask", "ulimit", "shopt", "declare", "typeset", "local", "readonly", "trap", "exec",
+    "su", "sudo", "newgrp", "eval",
+}
+
+# Programs that only inspect the host, whatever arguments they are given.
+READ_ONLY_PROGRAMS = {
+    "df", "du", "free", "uptime", "uname", "whoami", "id", "groups", "ls", "cat", "head", "tail",
+    "less", "more", "grep", "egrep", "fgrep", "zgrep", "cut", "tr", "column", "nl", "wc", "ps",
+    "pgrep", "top", "htop", "lsblk", "blkid", "lscpu", "lsmem", "lspci", "lsusb", "lsmod", "lsof",
+    "netstat", "ping", "dig", "nslookup", "host", "traceroute", "printenv", "echo", "printf",
+    "which", "whereis", "type", "stat", "locate", "vmstat", "iostat", "mpstat", "nproc", "getconf",
+    "w", "who", "last", "findmnt", "getent", "cal", "pwd", "realpath", "readlink", "basename",
+    "dirname", "md5sum", "sha1sum", "sha256sum", "diff", "cmp", "test", "true", "false", "seq",
+    "sleep",
+}
+
+# Programs that are read-only only in the forms described here; any other option or
+# operand makes the command mutating. Keys:
+#   flags        options allowed on their own (None: any option)
+#   value_flags  options that take a value, attached or as the next word
+#   denied       options never allowed, even when ``flags`` is None
+#   requires     at least one of these options must be given
+#   subcommands  operand position -> the words allowed there
+#   operands     most operands allowed (absent: any number)
+#   operand      pattern every operand must match
+READ_ONLY_FORMS: Dict[str, Dict[str, Any]] = {
+    "hostname": {"flags": {"-f", "-s", "-d", "-i", "-I", "-A", "-a", "-y", "--fqdn", "--long", "--short",
+                           "--domain", "--ip-address", "--all-ip-addresses", "--all-fqdns", "--alias", "--nis"},
+                 "operands": 0},
+    "hostnamectl": {"flags": {"--static", "--transient", "--pretty", "--no-pager"},
+                    "subcommands": {0: {"status"}}, "operands": 1},
+    "timedatectl": {"flags": {"-a", "--all", "--value", "--no-pager"}, "value_flags": {"-p", "--property"},
+                    "subcommands": {0: {"status", "show", "list-timezones", "timesync-status", "show-timesync"}},
+                    "operands": 1},
+    "date": {"flags": {"-u", "-R", "--utc", "--universal", "--rfc-email", "--debug"},
+             "value_flags": {"-d", "--date", "-r", "--reference", "-I", "--iso-8601", "--rfc-3339"},
+             "operand": re.compile(r"\+.*", re.DOTALL)},
+    "mount": {"flags": {"-l", "--show-labels"}, "value_flags": {"-t", "--types"}, "operands": 0},
+    "crontab": {"flags": {"-l"}, "value_flags": {"-u"}, "requires": {"-l"}, "operands": 0},
+    "sysctl": {"flags": {"-a", "-A", "-X", "-n", "-N", "-e", "-b", "-d", "--all", "--values", "--names",
+                         "--binary"},
+               "value_flags": {"-r", "--pattern"}, "operand": re.compile(r"[^=]+")},
+    "route": {"flags": {"-n", "-e", "-v", "--numeric", "--extend", "--verbose"}, "value_flags": {"-A", "--family"},
+              "operands": 0},
+    "ifconfig": {"flags": {"-a", "-s", "-v"}, "operands": 1},
+    "arp": {"flags": {"-a", "-e", "-n", "-v", "--all", "--numeric", "--verbose"},
+            "value_flags": {"-i", "-H", "--device", "--hw-type"}, "operands": 1},
+    "ip": {"flags": {"-4", "-6", "-0", "-s", "-d", "-h", "-c", "-j", "-p", "-o", "-r", "-br", "-brief", "-color",
+                     "-json", "-pretty", "-oneline", "-resolve", "-details", "-stats", "-statistics", "-human"},
+           "value_flags": {"-f", "-family", "-n", "-netns"},
+           "subcommands": {0: {"a", "addr", "address", "l", "link", "r", "route", "n", "neigh", "neighbor",
+                               "neighbour", "rule", "maddr", "maddress", "ntable", "netconf", "mroute", "tunnel"},
+                           1: {"show", "sh", "list", "lst", "ls", "get"}}},
+    "dmesg": {"flags": {"-T", "-H", "-k", "-x", "-L", "-P", "-r", "-t", "-u", "-w", "-W", "-e", "-d", "--ctime",
+                        "--human", "--kernel", "--decode", "--color", "--nopager", "--raw", "--notime",
+                        "--userspace", "--follow", "--follow-new", "--reltime", "--show-delta"},
+              "value_flags": {"-l", "-f", "-s", "-F", "--level", "--facility", "--buffer-size", "--file",
+                              "--time-format"},
+              "operands": 0},
+    "journalctl": {"flags": {"-a", "-b", "-e", "-f", "-k", "-l", "-m", "-q", "-r", "-x", "--all", "--boot",
+                             "--catalog", "--disk-usage", "--dmesg", "--follow", "--full", "--header",
+                             "--list-boots", "--merge", "--no-full", "--no-hostname", "--no-pager", "--no-tail",
+                             "--pager-end", "--quiet", "--reverse", "--system", "--user", "--utc"},
+                   "value_flags": {"-n", "-o", "-p", "-S", "-U", "-u", "-t", "-g", "-D", "-F", "--lines", "--output",
+                                   "--priority", "--since", "--until", "--unit", "--user-unit", "--identifier",
+                                   "--grep", "--directory", "--file", "--field", "--facility", "--output-fields",
+                                   "--cursor", "--after-cursor"}},
+    "systemctl": {"flags": None,
+                  "value_flags": {"-t", "--type", "--state", "-p", "--property", "-H", "--host", "-M", "--machine",
+                                  "-n", "--lines", "-o", "--output"},
+                  "subcommands": {0: {"status", "show", "cat", "is-active", "is-enabled", "is-failed",
+                                      "is-system-running", "list-units", "list-unit-files", "list-sockets",
+                                      "list-timers", "list-jobs", "list-dependencies", "list-machines",
+                                      "list-automounts", "list-paths", "get-default", "show-environment", "help"}}},
+    "service": {"flags": {"--status-all"}, "subcommands": {1: {"status"}}, "operands": 2},
+    "docker": {"flags": None,
+               "value_flags": {"-H", "--host", "--context", "-c", "--config", "-f", "--filter", "--format", "-n",
+                               "--tail", "--since", "--until"},
+               "subcommands": {0: {"ps", "images", "inspect", "logs", "stats", "top", "port", "diff", "history",
+                                   "version", "info", "search"}}},
+    "kubectl": {"flags": None,
+                "value_flags": {"-n", "--namespace", "-o", "--output", "-l", "--selector", "-c", "--container",
+                                "--context", "--cluster", "--kubeconfig", "--field-selector", "--tail", "--since"},
+                "subcommands": {0: {"get", "describe", "logs", "top", "version", "cluster-info", "api-resources",
+                                    "api-versions", "explain", "events"}}},
+    "dpkg": {"flags": {"-l", "-L", "-s", "-S", "-p", "-C", "-V", "--list", "--listfiles", "--status", "--search",
+                       "--print-avail", "--get-selections", "--print-architecture",
+                       "--print-foreign-architectures", "--audit", "--verify", "--version"}},
+    # Query forms are listed whole: "-i" alone installs.
+    "rpm": {"flags": {"-q", "-qa", "-qi", "-ql", "-qf", "-qc", "-qd", "-qR", "-qai", "-qip", "-qlp", "-V", "-Va",
+                      "--query", "--all", "--info", "--list", "--file", "--requires", "--provides", "--changelog",
+                      "--whatprovides", "--whatrequires", "--verify", "--last"},
+            "value_flags": {"--qf", "--queryformat"}},
+    "find": {"flags": None,
+             "denied": {"-delete", "-exec", "-execdir", "-ok", "-okdir", "-fprint", "-fprint0", "-fprintf", "-fls"}},
+    "sort": {"flags": {"-b", "-d", "-f", "-g", "-h", "-i", "-M", "-n", "-r", "-R", "-s", "-u", "-V", "-z", "-c",
+                       "-C", "--check", "--ignore-leading-blanks", "--dictionary-order", "--ignore-case",
+                       "--general-numeric-sort", "--human-numeric-sort", "--ignore-nonprinting", "--month-sort",
+                       "--numeric-sort", "--reverse", "--random-sort", "--stable", "--unique", "--version-sort",
+                       "--zero-terminated"},
+             "value_flags": {"-k", "-t", "-S", "-T", "--key", "--field-separator", "--buffer-size",
+                             "--temporary-directory", "--parallel"}},
+    # A second operand is the output file.
+    "uniq": {"flags": {"-c", "-d", "-D", "-i", "-u", "-z", "--count", "--repeated", "--all-repeated",
+                       "--ignore-case", "--unique", "--zero-terminated", "--group"},
+             "value_flags": {"-f", "-s", "-w", "--skip-fields", "--skip-chars", "--check-chars"}, "operands": 1},
+    # No output redirection, pipes to commands or system() inside the program.
+    "awk": {"flags": set(), "value_flags": {"-F", "-v", "--field-separator", "--assign"},
+            "operand": re.compile(r"(?!.*\bsystem\s*\()[^>|]*", re.DOTALL)},
+    "file": {"flags": {"-b", "-i", "-L", "-h", "-z", "-Z", "-s", "-k", "-N", "-n", "-r", "-E", "-0", "-l",
+                       "--brief", "--mime", "--mime-type", "--mime-encoding", "--dereference", "--no-dereference",
+                       "--uncompress", "--special-files", "--keep-going", "--no-pad", "--raw"},
+             "value_flags": {"-m", "-f", "-F", "-e", "--magic-file", "--files-from", "--separator", "--exclude"}},
+    "sar": {"flags": {"-A", "-B", "-b", "-d", "-H", "-h", "-p", "-q", "-r", "-S", "-t", "-u", "-v", "-W", "-w",
+                      "-y", "-z", "--human"},
+            "value_flags": {"-n", "-f", "-P", "-s", "-e", "-i", "-I", "-m"}, "operand": re.compile(r"\d+")},
+    "lastlog": {"flags": set(), "value_flags": {"-b", "-t", "-u", "--before", "--time", "--user"}, "operands": 0},
+    "ss": {"flags": {"-H", "-O", "-n", "-r", "-a", "-l", "-o", "-e", "-m", "-p", "-i", "-s", "-E", "-Z", "-z",
+                     "-b", "-4", "-6", "-0", "-t", "-u", "-d", "-w", "-x", "-S", "-M", "--numeric", "--resolve",
+                     "--all", "--listening", "--options", "--extended", "--memory", "--processes", "--info",
+                     "--summary", "--events", "--tcp", "--udp", "--dccp", "--raw", "--unix", "--sctp", "--ipv4",
+                     "--ipv6", "--packet", "--no-header", "--oneline"},
+           "value_flags": {"-f", "-A", "-F", "-N", "--family", "--query", "--filter", "--net"}},
+}
+
+# Programs that run another command, which is classified instead. Besides the
+# READ_ONLY_FORMS keys: ``skip`` operands come before the command (timeout's duration),
+# ``assignments`` allows leading NAME=value words, and ``bare`` means the wrapper is
+# read-only when given no command. xargs appends words the planner cannot see, so only
+# programs in READ_ONLY_PROGRAMS may follow it.
+WRAPPERS: Dict[str, Dict[str, Any]] = {
+    "env": {"flags": {"-i", "-0", "--ignore-environment", "--null"}, "value_flags": {"-u", "--unset"},
+            "assignments": True, "bare": True},
+    "nice": {"flags": set(), "value_flags": {"-n", "--adjustment"}},
+    "timeout": {"flags": {"-v", "--verbose", "--preserve-status", "--foreground"},
+                "value_flags": {"-s", "-k", "--signal", "--kill-after"}, "skip": 1},
+    "stdbuf": {"flags": set(), "value_flags": {"-i", "-o", "-e", "--input", "--output", "--error"}},
+    "time": {"flags": {"-p", "-v", "--portability", "--verbose"}},
+    "xargs": {"flags": {"-0", "-r", "-t", "-x", "--null", "--no-run-if-empty", "--verbose", "--exit"},
+              "value_flags": {"-n", "-L", "-P", "-d", "-s", "-a", "-E", "-I", "--max-args", "--max-lines",
+                              "--max-procs", "--delimiter", "--max-chars", "--arg-file", "--eof", "--replace"},
+              "bare": True},
+}
+
+_SEGMENT_SPLIT = re.compile(r"\|\||&&|[;|]|(?<![<>&])&(?![>&])")
+_ASSIGNMENT = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*=")
+# Output redirections that only discard or duplicate a stream are harmless.
+_REDIRECTION = re.compile(r"(?<![<\d])\d*>>?(?!&)\s*(?!/dev/null\b)\S")
+
+
+def _segments(command: str) -> List[List[str]]:
+    segments = []
+    for part in _SEGMENT_SPLIT.split(command):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            words = shlex.split(part)
+        except ValueError:
+            words = part.split()
+        if words:
+            segments.append(words)
+    return segments
+
+
+def command_forms(command: str) -> List[str]:
+    """
+    Return the form run by each segment: the program, behind any wrapper, followed by its
+    subcommand for programs that have one (``systemctl status``, ``docker ps``).
+    """
+    forms = []
+    for words in _segments(command):
+        while words[0].rsplit("/", 1)[-1] in WRAPPERS:
+            words = _unwrap(words)
+            if not words:
+                break
+        if not words:
+            continue
+        program = words[0].rsplit("/", 1)[-1]
+        form = READ_ONLY_FORMS.get(program, {})
+        if 0 in form.get("subcommands", {}):
+            parsed = _parse_arguments(words[1:], form)
+            if parsed and parsed[0]:
+                program = f"{program} {parsed[0][0]}"
+        forms.append(program)
+    return forms
+
+
+def is_stateful_command(command: str) -> bool:
+    """Return True if the command changes shell state (cwd, variables, user) for later commands."""
+    for words in _segments(command):
+        if words[0] in STATEFUL_BUILTINS or _ASSIGNMENT.match(words[0]):
+            return True
+    return False
+
+
+def _parse_arguments(arguments: List[str], form: Dict[str, Any],
+                     stop_at_operand: bool = False) -> Optional[Tuple[List[str], set]]:
+    """
+    Split ``arguments`` into operands and the options seen, checking every option against ``form``.
+
+    Returns None when an option is not allowed. With ``stop_at_operand``, the operands are
+    everything from the first operand on, options included, as a wrapper's command line.
+    """
+    flags = form.get("flags", set())
+    value_flags = form.get("value_flags", set())
+    denied = form.get("denied", set())
+    operands: List[str] = []
+    seen = set()
+    i = 0
+    while i < len(arguments):
+        word = arguments[i]
+        i += 1
+        if word == "--":
+            operands.extend(arguments[i:])
+            break
+        if not word.startswith("-") or word == "-":
+            if stop_at_operand:
+                operands.extend(arguments[i - 1:])
+                break
+            operands.append(word)
+            continue
+        name = word.split("=", 1)[0] if word.startswith("--") else word
+        if name in denied:
+            return None
+        if name in value_flags:
+            seen.add(name)
+            if name == word:
+                i += 1
+            continue
+        if flags is None or name in flags:
+            seen.add(name)
+            continue
+        if word.startswith("--"):
+            return None
+        # Clustered short options such as -tulpn, or a value attached to one as in -k2,2n.
+        for position, letter in enumerate(word[1:], 1):
+            option = f"-{letter}"
+            if option in denied:
+                return None
+            if option in value_flags:
+                seen.add(option)
+                if position == len(word) - 1:
+                    i += 1
+                break
+            if option not in flags:
+                return None
+            seen.add(option)
+    return operands, seen
+
+
+def _matches_form(arguments: List[str], form: Dict[str, Any]) -> bool:
+    parsed = _parse_arguments(arguments, form)
+    if parsed is None:
+        return False
+    operands, seen = parsed
+    if "requires" in form and not form["requires"] & seen:
+        return False
+    if len(operands) > form.get("operands", len(operands)):
+        return False
+    for position, allowed in form.get("subcommands", {}).items():
+        if position < len(operands) and operands[position] not in allowed:
+            return False
+    pattern = form.get("operand")
+    return pattern is None or all(pattern.fullmatch(operand) for operand in operands)
+
+
+def _unwrap(words: List[str]) -> Optional[List[str]]:
+    """
+    Return the command run by a wrapper such as ``env`` or ``timeout``, ``[]`` when it runs
+    none, or None when the wrapper's own options are not understood.
+    """
+    wrapper = WRAPPERS[words[0].rsplit("/", 1)[-1]]
+    parsed = _parse_arguments(words[1:], wrapper, stop_at_operand=True)
+    if parsed is None:
+        return None
+    command = parsed[0]
+    if wrapper.get("assignments"):
+        while command and _ASSIGNMENT.match(command[0]):
+            command = command[1:]
+    return command[wrapper.get("skip", 0):]
+
+
+def _is_read_only_words(words: List[str]) -> bool:
+    program = words[0].rsplit("/", 1)[-1]
+    if program in READ_ONLY_PROGRAMS:
+        return True
+    if program in READ_ONLY_FORMS:
+        return _matches_form(words[1:], READ_ONLY_FORMS[program])
+    if program in WRAPPERS:
+        command = _unwrap(words)
+        if command is None:
+            return False
+        if not command:
+            return bool(WRAPPERS[program].get("bare"))
+        if program == "xargs":
+            return command[0].rsplit("/", 1)[-1] in READ_ONLY_PROGRAMS
+        return _is_read_only_words(command)
+    return False
+
+
+def is_read_only_command(command: str) -> bool:
+    """
+    Return True if the command only inspects the host.
+
+    Every segment of a pipeline or command list must run a program from
+    ``READ_ONLY_PROGRAMS``, or one from ``READ_ONLY_FORMS`` with only the options and
+    operands its form allows, possibly behind a wrapper from ``WRAPPERS``. Output may
+    only be redirected to /dev/null.
+    """
+    # Multi-line commands (heredocs, loops, continued pipelines) are never batched.
+    if "\n" in command or _REDIRECTION.search(command) or "`" in command or "$(" in command:
+        return False
+    segments = _segments(command)
+    return bool(segments) and all(_is_read_only_words(words) for words in segments)
+
+
+def plan_command_batches(commands: List[str]) -> List[List[int]]:
+    """
+    Split commands into ordered batches of indices that may run concurrently.
+
+    Consecutive read-only commands share a batch. Stateful or mutating commands
+    act as barriers and get a batch of their own, so ordering dependencies such
+    as ``cd``, ``export`` or a file written and then read are preserved.
+
+    Args:
+        commands (list): The commands in the order the model produced them.
+
+    Returns:
+        list: Batches of indices into ``commands``; batches must run in order.
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    for index, command in enumerate(commands):
+        if is_read_only_command(command) and not is_stateful_command(command):
+            current.append(index)
+            continue
+        if current:
+            batches.append(current)
+            current = []
+        batches.append([index])
+    if current:
+        batches.append(current)
+    return batches
@@ -0,0 +1,202 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from Core.database import record_cache_lookup
+from Core.metrics import inc
+from Core.planner import command_forms, is_read_only_command, is_stateful_command
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DEFAULT_RESULT_TTL = 30  # Seconds a read-only result is reused when its program has no entry below
+DEFAULT_MAX_ENTRIES = 1024  # Results kept across all hosts
+DEFAULT_MAX_RESULT_BYTES = 256 * 1024  # Larger outputs are never cached
+
+# Read-only form -> seconds its output stays fresh. A form is a program, or a program and
+# its subcommand (see ``command_forms``); the program's entry covers subcommands without
+# their own. Only commands ``is_read_only_command`` accepts get a TTL at all, so
+# ``hostname`` is cached but ``hostname web02`` never is. A pipeline uses the shortest TTL
+# of its forms; 0 means never cached (clocks, probes and commands that are run to wait).
+DEFAULT_COMMAND_TTLS: Dict[str, float] = {
+    **dict.fromkeys(("uname", "hostname", "hostnamectl", "lscpu", "lsmem", "lspci", "lsusb", "nproc",
+                     "getconf", "whoami", "id", "groups", "blkid", "which", "whereis", "type",
+                     "docker version", "kubectl version"), 600),
+    **dict.fromkeys(("dpkg", "rpm", "crontab", "getent", "findmnt", "mount", "lsblk", "sysctl",
+                     "systemctl list-unit-files", "systemctl cat", "docker images"), 120),
+    **dict.fromkeys(("ps", "pgrep", "top", "htop", "free", "uptime", "vmstat", "iostat", "mpstat", "sar",
+                     "w", "who", "ss", "netstat", "lsof", "journalctl", "dmesg", "tail", "docker",
+                     "kubectl", "systemctl", "service"), 5),
+    **dict.fromkeys(("date", "timedatectl", "sleep", "ping", "traceroute", "dig", "nslookup", "host"), 0),
+}
+
+# Whitespace-separated words, keeping quoted strings and escapes intact.
+_WORD = re.compile(r"""(?:[^\s'"\\]+|\\.|'[^']*'|"(?:[^"\\]|\\.)*"|['"\\])+""")
+
+HostKey = Tuple[str, int]
+
+
+def normalize_command(command: str) -> str:
+    """Collapse insignificant whitespace; quoting is kept, since ``'$HOME'`` and ``"$HOME"`` differ."""
+    return " ".join(_WORD.findall(command))
+
+
+def host_identity(ssh) -> Optional[Tuple[str, int, str]]:
+    """
+    Return ``(host, port, username)`` for a pooled session or a plain paramiko client,
+    or None when the client is not connected.
+    """
+    if hasattr(ssh, "key"):
+        return ssh.host, ssh.port, ssh.username
+    transport = ssh.get_transport() if hasattr(ssh, "get_transport") else None
+    if transport is None or not transport.is_active():
+        return None
+    try:
+        host, port = transport.getpeername()[:2]
+    except OSError:
+        return None
+    return host, port, transport.get_username() or ""
+
+
+class CommandResultCache:
+    """
+    In-memory cache of read-only command results, keyed by host and normalized command.
+
+    Only commands that ``is_read_only_command`` accepts are cached, each for the TTL of
+    its forms. Any other command sent to a host drops every cached result of that
+    host, for all users, before it runs and again once it finishes. A per-host
+    generation counter keeps a read that overlapped a mutating command from storing
+    its (possibly stale) result.
+    """
+
+    def __init__(self, ttls: Optional[Dict[str, float]] = None, default_ttl: float = DEFAULT_RESULT_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, max_result_bytes: int = DEFAULT_MAX_RESULT_BYTES):
+        self.ttls = dict(DEFAULT_COMMAND_TTLS)
+        self.ttls.update(ttls or {})
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.max_result_bytes = max_result_bytes
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._generations: Dict[HostKey, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.saved_seconds = 0.0
+
+    def ttl_for(self, command: str) -> float:
+        """Seconds a result of ``command`` may be reused; 0 if it is not cacheable."""
+        if not is_read_only_command(command) or is_stateful_command(command):
+            return 0
+        forms = command_forms(command)
+        if not forms:
+            return 0
+        return min(self.ttls.get(form, self.ttls.get(form.split(" ", 1)[0], self.default_ttl)) for form in forms)
+
+    def get(self, ssh, command: str) -> Optional[Dict[str, Any]]:
+        """
+        Return a copy of the cached result with ``cached=True`` and its ``age`` in
+        seconds, or None on a miss.
+        """
+        identity = host_identity(ssh)
+        if identity is None or self.ttl_for(command) <= 0:
+            return None
+        key = identity + (normalize_command(command),)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                result, stored_at, expires_at, duration = entry
+                if now < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    self.saved_seconds += duration
+                    inc("cache_lookups", tier="result", result="hit")
+                    record_cache_lookup("result", True)
+                    return dict(result, cached=True, age=now - stored_at)
+                del self._entries[key]
+            self.misses += 1
+        inc("cache_lookups", tier="result", result="miss")
+        record_cache_lookup("result", False)
+        return None
+
+    def begin(self, ssh, command: str) -> Optional[int]:
+        """
+        Call before running ``command``. Returns a token to pass to ``finish`` when the
+        result may be cached, or None after invalidating the host for any other command.
+        """
+        identity = host_identity(ssh)
+        if identity is None:
+            return None
+        if self.ttl_for(command) <= 0:
+            if not is_read_only_command(command):
+                self.invalidate(identity[:2])
+            return None
+        with self._lock:
+            return self._generations.setdefault(identity[:2], 0)
+
+    def finish(self, ssh, command: str, result: Optional[Dict[str, Any]], token: Optional[int],
+               duration: float = 0.0) -> None:
+        """
+        Call once ``command`` has finished (or failed, with ``result=None``). Stores a clean
+        result when no mutating command ran on the host meanwhile; invalidates the host
+        again when ``command`` was mutating.
+        """
+        identity = host_identity(ssh)
+        if identity is None:
+            return
+        if token is None:
+            if not is_read_only_command(command):
+                self.invalidate(identity[:2])
+            return
+        if result is None or result.get("exit_status") != 0 or result.get("truncated") or result.get("timed_out"):
+            return
+        if len(result.get("output", "")) + len(result.get("error", "")) > self.max_result_bytes:
+            return
+        now = time.monotonic()
+        key = identity + (normalize_command(command),)
+        expires_at = now + self.ttl_for(command)
+        with self._lock:
+            if self._generations.get(identity[:2], 0) != token:
+                return
+            self._entries[key] = (dict(result), now, expires_at, duration)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, host: Optional[HostKey] = None) -> int:
+        """Drop the cached results of ``(host, port)``, or of every host. Returns the number dropped."""
+        with self._lock:
+            if host is None:
+                dropped = list(self._entries)
+                for generation_host in self._generations:
+                    self._generations[generation_host] += 1
+            else:
+                dropped = [key for key in self._entries if key[:2] == host]
+                self._generations[host] = self._generations.get(host, 0) + 1
+            for key in dropped:
+                del self._entries[key]
+            self.invalidations += 1
+        inc("result_cache_invalidations")
+        if dropped:
+            logger.info(f"Dropped {len(dropped)} cached command results for {host or 'all hosts'}")
+        return len(dropped)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "saved_seconds": self.saved_seconds,
+            }
+
+
+# Shared by every session of the process, like the SSH pool.
+result_cache = CommandResultCache()
@@ -0,0 +1,168 @@
+import json
+import logging
+import os
+import re
+from typing import Dict, Optional, Tuple, Union
+
+from Core.exceptions import CommandExecutionError
+
+logger = logging.getLogger(__name__)
+
+# Constants
+RULES_ENV = "DEVOPS_ASSISTANT_COMMAND_RULES"  # Path of a JSON file with extra deny/allow rules
+
+_SYSTEM_PATH = r"/(?:\*|(?:bin|boot|dev|etc|home|lib|lib32|lib64|opt|proc|root|sbin|srv|sys|usr|var)/?\*?)?"
+_WORD_END = r"(?=[\s;&|)]|$)"
+_ARGUMENT = r"[^\s;&|]+\s+"  # One word of the same command, with the spaces after it
+# Separators of the commands in a list or pipeline; "&" of redirections such as 2>&1 is not one.
+_SEGMENT_SEPARATOR = re.compile(r"\|\||&&|[;|\n]|(?<![<>&])&(?![>&])")
+
+# name -> (pattern, description). Patterns avoid nested quantifiers so the combined
+# expression stays linear in the length of the command, and each starts with a literal
+# character so the regex engine can skip straight to candidate positions. A word
+# boundary is checked after the literal (``rm(?<!\wrm)``) rather than with a leading
+# \b, which would hide it, so e.g. "confirm -rf /" or "farm -rf /" are not mistaken for rm.
+DEFAULT_DENY_RULES: Dict[str, Tuple[str, str]] = {
+    # Any recursive or forced rm of an absolute path, quoted or not, whatever the flag
+    # order: "rm -f /etc/passwd", "rm -rf '/'", "rm -v --force /srv". A superset of the
+    # original check (-r or -f followed by an absolute path); relative paths are allowed.
+    "rm_root": (
+        rf"rm(?<!\wrm)\s+(?=(?:{_ARGUMENT})*?(?:-[a-zA-Z]*[rRf][a-zA-Z]*|--recursive|--force){_WORD_END})"
+        rf"(?:{_ARGUMENT})*?[\"']?/",
+        "'rm -r' or 'rm -f' on an absolute path",
+    ),
+    "mkfs": (r"mkfs(?:\.\w+)?\s", "formatting a filesystem"),
+    "dd_device": (r"dd\s[^\n;|&]*\bof=/dev/(?!null\b|zero\b)", "'dd' onto a device"),
+    "device_overwrite": (r">\s*/dev/(?:sd|hd|vd|xvd|nvme|mmcblk)\w*", "redirecting output onto a disk device"),
+    "fork_bomb": (r":\s*\(\s*\)\s*\{\s*:\s*\|\s*:\s*&\s*\}", "a fork bomb"),
+    "recursive_root_ownership": (
+        rf"ch(?:mod|own|grp)\s+-[a-zA-Z]*R[a-zA-Z]*\s+(?:\S+\s+)?{_SYSTEM_PATH}{_WORD_END}",
+        "recursive permission changes on / or a top-level system directory",
+    ),
+}
+
+RuleSpec = Union[str, Tuple[str, str], list]
+
+
+def _combine(rules: Dict[str, Tuple[str, str]]) -> Optional["re.Pattern"]:
+    if not rules:
+        return None
+    # Plain groups, not named ones: named groups hide the leading literals from the
+    # regex compiler's prefix scan and make every search several times slower.
+    return re.compile("|".join(f"(?:{pattern})" for pattern, _ in rules.values()))
+
+
+def _normalize(rules: Optional[Dict[str, RuleSpec]]) -> Dict[str, Tuple[str, str]]:
+    normalized = {}
+    for name, spec in (rules or {}).items():
+        pattern, description = (spec, name) if isinstance(spec, str) else spec
+        re.compile(pattern)  # Fail on the bad rule, not inside the combined expression
+        normalized[name] = (pattern, description)
+    return normalized
+
+
+class CommandFilter:
+    """
+    Deny/allow rules for commands, each set compiled into a single alternation.
+
+    Checking a command is one scan with the deny expression, however many rules there
+    are. A command is rejected when a deny rule matches, unless every match lies in a
+    shell segment (one command of a list or pipeline) that an allow rule matches from
+    start to end: allowing ``rm -rf /tmp/scratch`` does not let
+    ``rm -rf /tmp/scratch; rm -rf /`` through.
+
+    Rules map a name to a regex, or to ``(regex, description)``. ``deny`` defaults to
+    ``DEFAULT_DENY_RULES``; use ``add_rules`` to extend the defaults instead of replacing them.
+    """
+
+    def __init__(self, deny: Optional[Dict[str, RuleSpec]] = None, allow: Optional[Dict[str, RuleSpec]] = None):
+        self.deny = _normalize(DEFAULT_DENY_RULES if deny is None else deny)
+        self.allow = _normalize(allow)
+        self._compile()
+
+    def _compile(self) -> None:
+        self._deny_rules = [(name, re.compile(pattern), description) for name, (pattern, description) in self.deny.items()]
+        self._deny = _combine(self.deny)
+        self._allow = _combine(self.allow)
+
+    def add_rules(self, deny: Optional[Dict[str, RuleSpec]] = None,
+                  allow: Optional[Dict[str, RuleSpec]] = None) -> None:
+        """Add or replace rules by name and recompile."""
+        self.deny.update(_normalize(deny))
+        self.allow.update(_normalize(allow))
+        self._compile()
+
+    @classmethod
+    def from_file(cls, path: str) -> "CommandFilter":
+        """
+        Build a filter from the default deny rules plus a JSON file of the form
+        ``{"deny": {"name": "regex" | ["regex", "description"]}, "allow": {...}}``.
+        """
+        with open(path) as f:
+            config = json.load(f)
+        command_filter = cls()
+        command_filter.add_rules(deny=config.get("deny"), allow=config.get("allow"))
+        return command_filter
+
+    def match(self, command: str) -> Optional[Tuple[str, str]]:
+        """
+        Return ``(rule name, description)`` of the deny rule blocking ``command``, or None.
+        """
+        if self._deny is None:
+            return None
+        if self._deny.search(command) is None:
+            return None
+        # Rare path: find which rule matched, and whether every match is allowed.
+        for name, pattern, description in self._deny_rules:
+            found = pattern.search(command)
+            while found is not None:
+                if not self._allowed(command, found):
+                    return name, description
+                found = pattern.search(command, found.start() + 1)
+        return None
+
+    def _allowed(self, command: str, found: "re.Match") -> bool:
+        """Whether an allow rule matches the whole segment the deny match ``found`` lies in."""
+        if self._allow is None:
+            return False
+        start, end = 0, len(command)
+        for separator in _SEGMENT_SEPARATOR.finditer(command):
+            if separator.end() <= found.start():
+                start = separator.end()
+            elif separator.start() >= found.start():
+                end = separator.start()
+                break
+        if found.end() > end:
+            return False  # The match spans several segments
+        while start < end and command[start].isspace():
+            start += 1
+        while end > start and command[end - 1].isspace():
+            end -= 1
+        return self._allow.fullmatch(command, start, end) is not None
+
+    def validate(self, command: str) -> None:
+        """
+        Raises:
+            CommandExecutionError: If a deny rule blocks ``command``.
+        """
+        blocked = self.match(command)
+        if blocked is not None:
+            name, description = blocked
+            logger.warning(f"Blocked command by rule '{name}': {command}")
+            raise CommandExecutionError(f"Dangerous command detected: {description} is not allowed.")
+
+
+def load_command_filter() -> CommandFilter:
+    """Return the default filter, extended by the rules file named in ``DEVOPS_ASSISTANT_COMMAND_RULES``."""
+    path = os.environ.get(RULES_ENV)
+    if not path:
+        return CommandFilter()
+    try:
+        return CommandFilter.from_file(path)
+    except (OSError, ValueError, re.error) as e:
+        logger.error(f"Failed to load command rules from {path}: {e}")
+        raise
+
+
+# Applied to every command before it is sent to a server.
+command_filter = load_command_filter()
@@ -0,0 +1,344 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from Core.cache import normalize_question
+from Core.database import save_semantic_entry, load_semantic_entries, evict_semantic_entries
+from Core.parser import fenced_blocks, split_commands
+from Core.planner import is_read_only_command
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DEFAULT_EMBEDDING_MODEL = "nomic-embed-text"
+DEFAULT_SIMILARITY_THRESHOLD = 0.92  # Cosine similarity needed to reuse a stored response
+DEFAULT_SEMANTIC_TTL = 7 * 24 * 3600  # Seconds a stored response stays eligible
+DEFAULT_SEMANTIC_ENTRIES = 10000  # Entries kept per embedder in memory and in all in SQLite
+SEMANTIC_EVICTION_INTERVAL = 100  # Expired and surplus entries are purged once every N adds
+RECENT_EMBEDDINGS = 64  # Embeddings of the last questions, reused by add() after a missed lookup
+EMBEDDER_RETRY_AFTER = 300  # Seconds semantic lookups stay off after the embedder fails
+INITIAL_CAPACITY = 256
+
+_TOKEN = re.compile(r"\w+")
+_QUOTED = re.compile(r"'([^']*)'|\"([^\"]*)\"|`([^`]*)`")
+# Words with a digit or one of these are literals: paths, numbers, versions, addresses,
+# user@host, and host, service or package names such as web-01, php8.2-fpm or db_main.
+_LITERAL_CHARS = re.compile(r"[\d/.:@_=-]")
+_TRIM = ".,;:!?()[]{}<>"
+# Words that do not change what a question asks for.
+_FILLER_WORDS = {
+    "a", "an", "the", "on", "in", "of", "for", "to", "at", "from", "my", "our", "this", "that", "these",
+    "those", "please", "how", "do", "does", "i", "we", "can", "could", "you", "me", "is", "are", "what",
+    "which", "all", "some", "any", "and", "with", "it", "its", "server", "host", "machine", "system",
+}
+
+
+class QuestionGuard:
+    """
+    What a stored question must share with a new one before its response is reused.
+
+    Similar embeddings are not enough for commands: "delete old logs in /var/log/app1"
+    and "... /var/log/app2" embed almost alike. The literal tokens of both questions
+    (quoted strings and words with digits, paths or name punctuation) must be equal,
+    and a response that would change the host is only reused when the questions also
+    have the same words apart from filler words, since plain names such as "nginx" and
+    "apache" are not literals.
+    """
+
+    def __init__(self, question: str, response: str):
+        self.literals = literal_tokens(question)
+        self.words = frozenset(_TOKEN.findall(normalize_question(question))) - _FILLER_WORDS
+        self.read_only = _is_read_only_response(response)
+
+    def allows(self, other: "QuestionGuard") -> bool:
+        """Whether the stored question guarded by ``self`` may answer the question guarded by ``other``."""
+        if self.literals != other.literals:
+            return False
+        return self.read_only or self.words == other.words
+
+
+def literal_tokens(question: str) -> frozenset:
+    """Return the quoted strings and literal words (paths, numbers, names) of ``question``."""
+    literals = {next(group for group in match.groups() if group is not None) for match in _QUOTED.finditer(question)}
+    for word in _QUOTED.sub(" ", question).split():
+        word = word.strip(_TRIM)
+        if _LITERAL_CHARS.search(word):
+            literals.add(word)
+    return frozenset(literals)
+
+
+def _is_read_only_response(response: str) -> bool:
+    commands = [command for block in fenced_blocks(response) for command in split_commands(block)]
+    return all(is_read_only_command(command) for command in commands)
+
+
+class HashingEmbedder:
+    """
+    Local, dependency-free stand-in for an embedding model.
+
+    Words and character trigrams are hashed into a fixed number of buckets. It is
+    good enough to catch reordered or lightly reworded questions and makes the
+    semantic cache usable in tests and offline benchmarks.
+    """
+
+    def __init__(self, dimensions: int = 512):
+        self.dimensions = dimensions
+        self.name = f"hashing-{dimensions}"
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in _TOKEN.findall(normalize_question(text)):
+            features = [word] + [word[i:i + 3] for i in range(max(len(word) - 2, 1))]
+            for feature in features:
+                digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dimensions
+                vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        return vector
+
+
+class OllamaEmbedder:
+    """Embeds questions with an Ollama embedding model (e.g. ``nomic-embed-text``)."""
+
+    def __init__(self, model: str = DEFAULT_EMBEDDING_MODEL, base_url: str = "http://localhost:11434"):
+        from langchain_ollama import OllamaEmbeddings
+
+        self._embeddings = OllamaEmbeddings(model=model, base_url=base_url)
+        self.name = f"ollama:{model}"
+
+    def embed(self, text: str) -> np.ndarray:
+        return np.asarray(self._embeddings.embed_query(text), dtype=np.float32)
+
+
+class _VectorIndex:
+    """Growable float32 matrix of unit vectors produced by a single embedder."""
+
+    def __init__(self, dimensions: int):
+        self.vectors = np.zeros((INITIAL_CAPACITY, dimensions), dtype=np.float32)
+        self.group_ids = np.zeros(INITIAL_CAPACITY, dtype=np.int32)
+        self.created = np.zeros(INITIAL_CAPACITY, dtype=np.float64)
+        self.responses: List[str] = []
+        self.guards: List[QuestionGuard] = []
+        self.size = 0
+
+    def append(self, vector: np.ndarray, group: int, response: str, created: float, guard: QuestionGuard) -> None:
+        if self.size == self.vectors.shape[0]:
+            capacity = self.size * 2
+            self.vectors = np.resize(self.vectors, (capacity, self.vectors.shape[1]))
+            self.group_ids = np.resize(self.group_ids, capacity)
+            self.created = np.resize(self.created, capacity)
+        self.vectors[self.size] = vector
+        self.group_ids[self.size] = group
+        self.created[self.size] = created
+        self.responses.append(response)
+        self.guards.append(guard)
+        self.size += 1
+
+    def compact(self, min_created: float, max_entries: int) -> int:
+        """Drop entries created before ``min_created`` and all but the newest ``max_entries``; return how many went."""
+        created = self.created[:self.size]
+        keep = np.flatnonzero(created >= min_created)
+        if keep.size > max_entries:
+            keep = np.sort(keep[np.argsort(created[keep], kind="stable")[-max_entries:]])
+        dropped = self.size - keep.size
+        if not dropped:
+            return 0
+        capacity = max(INITIAL_CAPACITY, keep.size)
+        vectors = np.zeros((capacity, self.vectors.shape[1]), dtype=np.float32)
+        vectors[:keep.size] = self.vectors[keep]
+        group_ids = np.zeros(capacity, dtype=np.int32)
+        group_ids[:keep.size] = self.group_ids[keep]
+        created_at = np.zeros(capacity, dtype=np.float64)
+        created_at[:keep.size] = created[keep]
+        self.vectors, self.group_ids, self.created = vectors, group_ids, created_at
+        self.responses = [self.responses[i] for i in keep]
+        self.guards = [self.guards[i] for i in keep]
+        self.size = int(keep.size)
+        return dropped
+
+    def matches(self, vector: np.ndarray, group: int, min_created: float,
+                threshold: float) -> List[Tuple[int, float]]:
+        """Return the index and cosine similarity of every live entry in ``group`` reaching ``threshold``, best first."""
+        if not self.size or vector.shape[0] != self.vectors.shape[1]:
+            return []
+        mask = (self.group_ids[:self.size] == group) & (self.created[:self.size] >= min_created)
+        if not mask.any():
+            return []
+        scores = np.where(mask, self.vectors[:self.size] @ vector, -1.0)
+        candidates = np.flatnonzero(scores >= threshold)
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(i), float(scores[i])) for i in candidates]
+
+
+class SemanticCache:
+    """
+    Near-duplicate question cache backed by NumPy matrices of unit vectors.
+
+    Entries are persisted to the ``semantic_cache`` SQLite table and loaded on
+    first use, one matrix per embedder. A lookup is one matrix-vector product over
+    the entries that share the model and prompt version; the best match whose cosine
+    similarity reaches ``threshold`` and whose ``QuestionGuard`` allows the new question
+    is returned. Every
+    ``SEMANTIC_EVICTION_INTERVAL`` adds, entries older than ``ttl`` are purged from
+    both, and each matrix and the table are cut back to ``max_entries``.
+    """
+
+    def __init__(self, embedder=None, threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+                 ttl: float = DEFAULT_SEMANTIC_TTL, max_entries: int = DEFAULT_SEMANTIC_ENTRIES):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lookup_seconds = 0.0
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._indexes: Dict[str, _VectorIndex] = {}
+        self._groups: List[Tuple[str, str]] = []
+        self._recent: Dict[Tuple[str, str], np.ndarray] = {}
+        self._writes = 0
+        self._disabled_until = 0.0
+
+    def lookup(self, question: str, model_name: str, prompt_version: str, embedder=None) -> Optional[str]:
+        """
+        Returns a stored response for a question similar enough to ``question``, or None.
+
+        Args:
+            question (str): The user question.
+            model_name (str): The LLM the response must come from.
+            prompt_version (str): The prompt-template version the response must come from.
+            embedder: Optional embedder overriding ``self.embedder``.
+
+        Returns:
+            str: The cached response, or None on a miss or when no embedder is available.
+        """
+        embedder = embedder or self.embedder
+        if embedder is None or time.monotonic() < self._disabled_until:
+            return None
+        start = time.perf_counter()
+        vector = self._embed(question, embedder)
+        response = None
+        score = 0.0
+        if vector is not None:
+            guard = QuestionGuard(question, "")
+            with self._lock:
+                self._load()
+                index = self._indexes.get(embedder.name)
+                group = self._group_id(model_name, prompt_version, create=False)
+                if index is not None and group is not None:
+                    for best, score in index.matches(vector, group, time.time() - self.ttl, self.threshold):
+                        if index.guards[best].allows(guard):
+                            response = index.responses[best]
+                            break
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.lookup_seconds += elapsed
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if response is not None:
+            logger.info(f"Semantic cache hit ({score:.3f}) for: {question}")
+        return response
+
+    def add(self, question: str, model_name: str, prompt_version: str, response: str, embedder=None) -> None:
+        """Stores the response for ``question`` in memory and in SQLite."""
+        embedder = embedder or self.embedder
+        if embedder is None or time.monotonic() < self._disabled_until:
+            return
+        vector = self._embed(question, embedder)
+        if vector is None:
+            return
+        created = time.time()
+        guard = QuestionGuard(question, response)
+        with self._lock:
+            self._load()
+            self._append(embedder.name, vector, self._group_id(model_name, prompt_version), response, created, guard)
+            self._writes += 1
+            evict = self._writes % SEMANTIC_EVICTION_INTERVAL == 0
+            if evict:
+                self._compact()
+        try:
+            save_semantic_entry(question, model_name, prompt_version, embedder.name, vector.tobytes(), response)
+            if evict:
+                evict_semantic_entries(self.max_entries, self.ttl)
+        except Exception as e:
+            logger.warning(f"Failed to persist semantic cache entry: {e}")
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": sum(index.size for index in self._indexes.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "avg_lookup_ms": 1000 * self.lookup_seconds / lookups if lookups else 0.0,
+            }
+
+    def _embed(self, question: str, embedder) -> Optional[np.ndarray]:
+        key = (embedder.name, normalize_question(question))
+        with self._lock:
+            vector = self._recent.get(key)
+        if vector is not None:
+            return vector
+        try:
+            vector = np.asarray(embedder.embed(question), dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"Embedding failed, disabling semantic cache for {EMBEDDER_RETRY_AFTER}s: {e}")
+            self._disabled_until = time.monotonic() + EMBEDDER_RETRY_AFTER
+            return None
+        norm = float(np.linalg.norm(vector))
+        if norm == 0.0:
+            return None
+        vector = vector / norm
+        # Remember the last few embeddings so add() after a missed lookup does not embed twice.
+        with self._lock:
+            if len(self._recent) >= RECENT_EMBEDDINGS:
+                self._recent.pop(next(iter(self._recent)))
+            self._recent[key] = vector
+        return vector
+
+    def _group_id(self, model_name: str, prompt_version: str, create: bool = True) -> Optional[int]:
+        group = (model_name, prompt_version)
+        if group in self._groups:
+            return self._groups.index(group)
+        if not create:
+            return None
+        self._groups.append(group)
+        return len(self._groups) - 1
+
+    def _append(self, embedder_name: str, vector: np.ndarray, group: int, response: str, created: float,
+                guard: QuestionGuard) -> None:
+        index = self._indexes.get(embedder_name)
+        if index is None:
+            index = self._indexes[embedder_name] = _VectorIndex(vector.shape[0])
+        index.append(vector, group, response, created, guard)
+
+    def _compact(self) -> None:
+        """Purge expired entries and cut every matrix back to ``max_entries``. Caller holds the lock."""
+        min_created = time.time() - self.ttl
+        for name, index in self._indexes.items():
+            dropped = index.compact(min_created, self.max_entries)
+            if dropped:
+                logger.debug(f"Evicted {dropped} semantic cache entries of {name}")
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            entries = load_semantic_entries(time.time() - self.ttl)
+        except Exception as e:
+            logger.warning(f"Failed to load semantic cache: {e}")
+            return
+        for question, model_name, prompt_version, embedder_name, blob, response, created in entries:
+            vector = np.frombuffer(blob, dtype=np.float32)
+            self._append(embedder_name, vector, self._group_id(model_name, prompt_version), response, created,
+                         QuestionGuard(question or "", response))
+        self._compact()
@@ -0,0 +1,292 @@
+import codecs
+import logging
+import re
+import secrets
+import select
+import shlex
+import threading
+import time
+import weakref
+from contextlib import ExitStack
+from typing import Any, Callable, Dict, List, Optional
+
+from Core.exceptions import CommandExecutionError, SSHConnectionError
+from Core.ssh_pool import SSHLike, borrow_channel, ssh_pool
+from Core.safety import command_filter
+from Core.metrics import observe, inc
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DEFAULT_SHELL_TIMEOUT = 60  # Wall-clock limit for one command in seconds
+DEFAULT_SHELL_MAX_OUTPUT_BYTES = 5 * 1024 * 1024  # Output kept per command
+DEFAULT_SHELL_IDLE_TIMEOUT = 900  # Seconds an unused shell keeps its channel before it is closed
+SHELL_START_TIMEOUT = 15  # Seconds for the login shell to start and accept the setup line
+SHELL_TERM = "dumb"  # No colours, pagers or bracketed paste
+SHELL_WIDTH = 4096  # Wide enough that the terminal never wraps long lines
+SHELL_HEIGHT = 1000
+SHELL_CHUNK_SIZE = 32768
+MARKER_PREFIX = "__DEVOPS_ASSISTANT_DONE_"
+
+# Run once per shell (and again in a root shell): no echo, no prompts, no \r\n
+# translation, no history file, and no pagers that would wait for a keypress.
+_SHELL_SETUP = (
+    "stty -echo -onlcr 2>/dev/null; unset HISTFILE PROMPT_COMMAND; PS1=''; PS2=''; "
+    "bind 'set enable-bracketed-paste off' 2>/dev/null; "
+    f"export TERM={SHELL_TERM} PAGER=cat GIT_PAGER=cat SYSTEMD_PAGER= SYSTEMD_COLORS=0"
+)
+_TERMINAL_NOISE = re.compile(r"\x1b\[\?2004[hl]|\r(?=\n)")
+
+
+class ShellSession:
+    """
+    One long-lived interactive shell on a PTY, reused for every command of a session.
+
+    Each command is written to the shell followed by a ``printf`` of a per-session
+    marker and ``$?``; output is everything up to the marker line, and the number after
+    it is the exit status. Because the same shell reads every command, ``cd``,
+    exported variables and a root shell from ``become_root`` carry over to the
+    following commands, and no channel or shell is started per command.
+
+    The terminal merges stdout and stderr, so results always have an empty ``error``.
+    Commands read stdin from ``/dev/null`` so they cannot swallow the marker line. A
+    command that times out is interrupted by closing the shell; the next command
+    starts a fresh one, without the earlier state. The same happens to a shell left
+    unused for ``DEFAULT_SHELL_IDLE_TIMEOUT``, so abandoned sessions give their
+    channel back to the pool.
+
+    Args:
+        ssh (PooledSSHSession | paramiko.SSHClient): The SSH connection to open the shell on.
+    """
+
+    def __init__(self, ssh: SSHLike):
+        self.ssh = ssh
+        self.root = False
+        self.commands_run = 0
+        self.restarts = 0
+        self.last_used = time.monotonic()
+        self._nonce = secrets.token_hex(8)
+        # The marker is printed as two arguments, so the command text itself never contains it.
+        self._marker = re.compile(re.escape(MARKER_PREFIX + self._nonce) + r":(\d+)\n")
+        self._marker_command = f"printf '\\n%s%s:%d\\n' {MARKER_PREFIX} {self._nonce} \"$?\""
+        self._lock = threading.Lock()
+        self._stack: Optional[ExitStack] = None
+        self._channel = None
+
+    @property
+    def alive(self) -> bool:
+        channel = self._channel
+        return channel is not None and not channel.closed and not channel.exit_status_ready()
+
+    def open(self) -> "ShellSession":
+        """Start the shell if it is not running. Returns the session for chaining."""
+        with self._lock:
+            self._ensure_open()
+        return self
+
+    def close(self) -> None:
+        """Close the shell and hand its channel back to the pool."""
+        with self._lock:
+            self._close()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def run(self, command: str, timeout: float = DEFAULT_SHELL_TIMEOUT,
+            max_bytes: int = DEFAULT_SHELL_MAX_OUTPUT_BYTES,
+            on_output: Optional[Callable[[str, str], None]] = None) -> Dict[str, Any]:
+        """
+        Run one command in the shell and wait for its marker.
+
+        Args:
+            command (str): The command; may span several lines (heredocs, loops...).
+            timeout (float): Wall-clock limit in seconds.
+            max_bytes (int): Maximum number of output bytes to keep.
+            on_output (callable): Optional ``on_output("stdout", data)`` called as output arrives.
+
+        Returns:
+            dict: ``output``, ``error`` (always empty), ``exit_status``, ``truncated`` and ``timed_out``.
+
+        Raises:
+            CommandExecutionError: If the command is rejected or the shell cannot be started.
+        """
+        command_filter.validate(command)
+        with self._lock:
+            self._ensure_open()
+            started = time.perf_counter()
+            # A brace group runs in the current shell, so its state changes persist.
+            result = self._execute(f"{{ {command}\n}} < /dev/null", timeout, max_bytes, on_output)
+            observe("shell_command", time.perf_counter() - started)
+            self.commands_run += 1
+            self.last_used = time.monotonic()
+        return result
+
+    def become_root(self, password: str, timeout: float = DEFAULT_SHELL_TIMEOUT) -> None:
+        """
+        Replace the shell with a root shell (``sudo su``) that stays open for later commands.
+
+        Raises:
+            CommandExecutionError: If sudo rejects the password or the root shell does not start.
+        """
+        with self._lock:
+            self._ensure_open()
+            if self._execute("id -u", timeout)["output"] == "0":
+                self.root = True
+                return
+            # printf is a builtin, so the password never shows up in the process list.
+            validated = self._execute(f"printf '%s\\n' {shlex.quote(password)} | sudo -S -p '' -v", timeout)
+            if validated["exit_status"] != 0:
+                raise CommandExecutionError(
+                    f"Failed to switch to root user: {validated['output'] or 'sudo rejected the password'}")
+            # Unlike a command, su keeps the terminal as stdin and reads the following lines as root.
+            self._execute(f"sudo -n su\n{_SHELL_SETUP}", timeout)
+            if self._execute("id -u", timeout)["output"] != "0":
+                raise CommandExecutionError("Failed to switch to root user: sudo su did not start a root shell.")
+            self.root = True
+        logger.info("Switched the interactive shell to the root user.")
+
+    def _ensure_open(self) -> None:
+        if self.alive:
+            return
+        if self._channel is not None:
+            logger.warning("Interactive shell exited; starting a new one. Earlier shell state is lost.")
+            self.restarts += 1
+            self._close()
+        started = time.perf_counter()
+        stack = ExitStack()
+        try:
+            channel = stack.enter_context(borrow_channel(self.ssh))
+            channel.get_pty(term=SHELL_TERM, width=SHELL_WIDTH, height=SHELL_HEIGHT)
+            channel.invoke_shell()
+        except Exception as e:
+            stack.close()
+            logger.error(f"Failed to start interactive shell: {e}")
+            raise CommandExecutionError(f"Failed to start interactive shell: {e}")
+        self._stack, self._channel = stack, channel
+        self.root = False
+        self.last_used = time.monotonic()
+        _open_shells.add(self)
+        result = self._execute(_SHELL_SETUP, SHELL_START_TIMEOUT)  # Also drains the login banner
+        if result["timed_out"] or not self.alive:
+            self._close()
+            raise CommandExecutionError("Interactive shell did not start.")
+        observe("shell_start", time.perf_counter() - started)
+
+    def close_if_idle(self, max_idle: float = DEFAULT_SHELL_IDLE_TIMEOUT) -> bool:
+        """Close the shell if it has not been used for ``max_idle`` seconds. Returns whether it was closed."""
+        if self._channel is None or time.monotonic() - self.last_used < max_idle:
+            return False
+        if not self._lock.acquire(blocking=False):
+            return False  # A command is running
+        try:
+            if self._channel is None:
+                return False
+            logger.info(f"Closing interactive shell idle for {time.monotonic() - self.last_used:.0f}s.")
+            self._close()
+            # Not a restart: the next command quietly starts a fresh shell.
+            self.root = False
+            return True
+        finally:
+            self._lock.release()
+
+    def _close(self) -> None:
+        _open_shells.discard(self)
+        stack, self._stack, self._channel = self._stack, None, None
+        if stack is not None:
+            try:
+                stack.close()
+            except Exception as e:
+                logger.debug(f"Error while closing interactive shell: {e}")
+
+    def _execute(self, script: str, timeout: float, max_bytes: int = DEFAULT_SHELL_MAX_OUTPUT_BYTES,
+                 on_output: Optional[Callable[[str, str], None]] = None) -> Dict[str, Any]:
+        """Send ``script`` plus the marker line and collect output until the marker arrives."""
+        channel = self._channel
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        output: List[str] = []
+        pending = ""
+        total = received = 0
+        exit_status = -1
+        truncated = timed_out = False
+        deadline = time.monotonic() + timeout
+
+        def emit(text: str) -> None:
+            nonlocal total, truncated
+            if not text or truncated:
+                return
+            size = len(text.encode())
+            if total + size > max_bytes:
+                text = text.encode()[:max_bytes - total].decode(errors="ignore")
+                truncated = True
+            total += len(text.encode())
+            output.append(text)
+            if on_output and text:
+                on_output("stdout", text)
+
+        try:
+            channel.sendall(f"{script}\n{self._marker_command}\n".encode())
+            while True:
+                if channel.recv_ready():
+                    data = channel.recv(SHELL_CHUNK_SIZE)
+                    if not data:
+                        break
+                    received += len(data)
+                    pending = _TERMINAL_NOISE.sub("", pending + decoder.decode(data))
+                    match = self._marker.search(pending)
+                    if match:
+                        emit(pending[:match.start()][:-1])  # Minus the newline printed before the marker
+                        exit_status = int(match.group(1))
+                        break
+                    # Hold back a trailing line that may be the start of the marker.
+                    cut = pending.rfind("\n")
+                    tail = pending[cut:] if cut >= 0 else pending
+                    keep = tail if MARKER_PREFIX.startswith(tail.lstrip("\n")[:len(MARKER_PREFIX)]) else ""
+                    emit(pending[:len(pending) - len(keep)])
+                    pending = keep
+                    continue
+                if channel.closed or channel.exit_status_ready():
+                    emit(pending)
+                    if channel.exit_status_ready():
+                        exit_status = channel.recv_exit_status()
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    timed_out = True
+                    break
+                select.select([channel], [], [], min(remaining, 0.5))
+        except (OSError, EOFError, SSHConnectionError) as e:
+            self._close()
+            raise CommandExecutionError(f"Interactive shell failed: {e}")
+        finally:
+            if received:
+                inc("ssh_bytes", received, stream="pty")
+
+        if timed_out:
+            # The only reliable way to stop whatever is holding the terminal.
+            logger.warning(f"Command timed out after {timeout} seconds; closing the interactive shell.")
+            self._close()
+        return {
+            "output": "".join(output).strip(),
+            "error": "",
+            "exit_status": exit_status,
+            "truncated": truncated,
+            "timed_out": timed_out,
+        }
+
+
+# Open shells, so the pool reaper can close the ones whose Streamlit session went away.
+_open_shells: "weakref.WeakSet[ShellSession]" = weakref.WeakSet()
+
+
+def reap_idle_shells(max_idle: float = DEFAULT_SHELL_IDLE_TIMEOUT) -> int:
+    """Close every shell unused for ``max_idle`` seconds and return how many were closed."""
+    closed = sum(shell.close_if_idle(max_idle) for shell in list(_open_shells))
+    if closed:
+        inc("shell_reaped", closed)
+    return closed
+
+
+ssh_pool.add_reaper(reap_idle_shells)
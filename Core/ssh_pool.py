@@ -0,0 +1,440 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from Core.exceptions import SSHConnectionError
+
+if TYPE_CHECKING:
+    import paramiko
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DEFAULT_CONNECT_TIMEOUT = 10  # Timeout for establishing a transport in seconds
+DEFAULT_MAX_SESSIONS_PER_HOST = 4  # Transports kept open per (host, port, user)
+DEFAULT_CHANNELS_PER_SESSION = 8  # Concurrent channels multiplexed on one transport
+DEFAULT_IDLE_TTL = 300  # Seconds an unused transport may stay in the pool
+DEFAULT_KEEPALIVE_INTERVAL = 30  # Seconds between keepalive packets
+DEFAULT_ACQUIRE_TIMEOUT = 30  # Seconds to wait for a free slot when a host is saturated
+DEFAULT_REAP_INTERVAL = 60  # Seconds between background sweeps for idle transports and shells
+
+PoolKey = Tuple[str, int, str]
+
+
+class _PooledConnection:
+    """A single authenticated transport owned by the pool."""
+
+    def __init__(self, client: "paramiko.SSHClient"):
+        self.client = client
+        self.created = time.monotonic()
+        self.last_used = self.created
+        self.in_use = 0
+
+    @property
+    def transport(self) -> Optional["paramiko.Transport"]:
+        return self.client.get_transport()
+
+    def close(self) -> None:
+        try:
+            self.client.close()
+        except Exception as e:
+            logger.debug(f"Error while closing pooled SSH client: {e}")
+
+
+class SSHConnectionPool:
+    """
+    Process-wide pool of SSH transports keyed by (host, port, user).
+
+    Transports are shared: callers borrow a channel (or the client) and the pool
+    multiplexes up to ``channels_per_session`` borrowers on one transport before
+    opening another, never exceeding ``max_sessions_per_host`` per key. Dead
+    transports are detected with keepalives and replaced transparently, and
+    idle ones are closed once they exceed ``idle_ttl``. A background reaper sweeps
+    every ``reap_interval`` seconds, so transports of hosts nobody uses again, and
+    idle resources registered with ``add_reaper``, are released too.
+
+    Every ``register`` hands out a handle, and sessions of other users may hold handles
+    to the same key. A key's credentials and transports are only dropped once its last
+    handle is closed.
+    """
+
+    def __init__(
+        self,
+        max_sessions_per_host: int = DEFAULT_MAX_SESSIONS_PER_HOST,
+        channels_per_session: int = DEFAULT_CHANNELS_PER_SESSION,
+        idle_ttl: float = DEFAULT_IDLE_TTL,
+        keepalive_interval: int = DEFAULT_KEEPALIVE_INTERVAL,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        acquire_timeout: float = DEFAULT_ACQUIRE_TIMEOUT,
+        reap_interval: float = DEFAULT_REAP_INTERVAL,
+    ):
+        self.max_sessions_per_host = max_sessions_per_host
+        self.channels_per_session = channels_per_session
+        self.idle_ttl = idle_ttl
+        self.keepalive_interval = keepalive_interval
+        self.connect_timeout = connect_timeout
+        self.acquire_timeout = acquire_timeout
+        self.reap_interval = reap_interval
+        self._lock = threading.Condition()
+        self._connections: Dict[PoolKey, List[_PooledConnection]] = {}
+        self._pending: Dict[PoolKey, int] = {}
+        self._credentials: Dict[PoolKey, str] = {}
+        self._handles: Dict[PoolKey, int] = {}
+        self._reapers: List[Callable[[], None]] = []
+        self._reaper: Optional[threading.Thread] = None
+
+    def register(self, host: str, username: str, password: str, port: int = 22,
+                 timeout: Optional[float] = None) -> "PooledSSHSession":
+        """
+        Register credentials for a host and verify them by opening a transport.
+
+        Args:
+            host (str): The IP address or hostname of the server.
+            username (str): The username for SSH login.
+            password (str): The password for SSH login.
+            port (int): The SSH port.
+            timeout (float): Optional connect timeout overriding the pool default.
+
+        Returns:
+            PooledSSHSession: A lightweight handle used to borrow channels.
+
+        Raises:
+            SSHConnectionError: If the connection fails.
+        """
+        key = (host, port, username)
+        with self._lock:
+            known = self._credentials.get(key)
+        if known == password:
+            with self.client(key, timeout=timeout):
+                pass
+        else:
+            # Prove new credentials on a fresh connection before storing them, and never
+            # let them ride on a transport authenticated with a different password.
+            fresh = self._connect(key, timeout, password=password)
+            with self._lock:
+                self._credentials[key] = password
+                for conn in self._connections.pop(key, []):
+                    conn.close()
+                fresh.in_use = 0
+                self._connections[key] = [fresh]
+        with self._lock:
+            self._handles[key] = self._handles.get(key, 0) + 1
+        self._start_reaper()
+        return PooledSSHSession(self, key, timeout)
+
+    def _connect(self, key: PoolKey, timeout: Optional[float] = None,
+                 password: Optional[str] = None) -> _PooledConnection:
+        host, port, username = key
+        password = password if password is not None else self._credentials.get(key)
+        if password is None:
+            raise SSHConnectionError(f"No credentials registered for {username}@{host}:{port}")
+        # Imported here so importing the pool does not pull in paramiko and its crypto stack.
+        import paramiko
+
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        try:
+            ssh.connect(hostname=host, username=username, password=password,
+                        timeout=timeout or self.connect_timeout, port=port)
+        except Exception as e:
+            ssh.close()
+            logger.error(f"Failed to connect to {host}: {e}")
+            raise SSHConnectionError(f"SSH connection failed: {e}")
+        transport = ssh.get_transport()
+        if transport is not None and self.keepalive_interval:
+            transport.set_keepalive(self.keepalive_interval)
+        logger.info(f"Opened pooled SSH transport to {username}@{host}:{port}")
+        return _PooledConnection(ssh)
+
+    @staticmethod
+    def _is_active(conn: _PooledConnection) -> bool:
+        transport = conn.transport
+        return transport is not None and transport.is_active()
+
+    def _probe_due(self, conn: _PooledConnection) -> bool:
+        return time.monotonic() - conn.last_used >= self.keepalive_interval
+
+    def _is_alive(self, conn: _PooledConnection) -> bool:
+        """Check the transport, sending an ignore packet if it has been quiet. Never call it under the lock."""
+        transport = conn.transport
+        if transport is None or not transport.is_active():
+            return False
+        if self._probe_due(conn):
+            try:
+                transport.send_ignore()
+            except Exception:
+                return False
+        return True
+
+    def _sweep(self, key: PoolKey) -> None:
+        """
+        Drop closed transports and close idle ones past their TTL. Caller holds the lock.
+
+        Only local state is checked here; transports that need a network probe are
+        checked by ``_checkout`` and ``evict_idle`` once the lock is released.
+        """
+        now = time.monotonic()
+        alive = []
+        for conn in self._connections.get(key, []):
+            if conn.in_use == 0 and (now - conn.last_used > self.idle_ttl or not self._is_active(conn)):
+                conn.close()
+            else:
+                alive.append(conn)
+        self._connections[key] = alive
+
+    def _checkout(self, key: PoolKey, timeout: Optional[float] = None) -> _PooledConnection:
+        """Reserve a slot on a live transport, probing a quiet one outside the lock first."""
+        while True:
+            conn = self._reserve(key, timeout)
+            if self._is_alive(conn):
+                return conn
+            logger.info(f"Pooled SSH transport to {key[0]} failed its keepalive probe, replacing it")
+            self._checkin(key, conn, broken=True)
+
+    def _reserve(self, key: PoolKey, timeout: Optional[float] = None) -> _PooledConnection:
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._lock:
+            while True:
+                self._sweep(key)
+                conns = self._connections[key]
+                candidates = [c for c in conns if c.in_use < self.channels_per_session]
+                if candidates:
+                    conn = min(candidates, key=lambda c: c.in_use)
+                    conn.in_use += 1
+                    return conn
+                if len(conns) + self._pending.get(key, 0) < self.max_sessions_per_host:
+                    self._pending[key] = self._pending.get(key, 0) + 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise SSHConnectionError(f"SSH pool exhausted for {key[2]}@{key[0]}:{key[1]}")
+                self._lock.wait(remaining)
+
+        # Connect outside the lock so a slow handshake does not block other hosts.
+        try:
+            conn = self._connect(key, timeout)
+        finally:
+            with self._lock:
+                self._pending[key] -= 1
+                self._lock.notify_all()
+        with self._lock:
+            conn.in_use = 1
+            self._connections.setdefault(key, []).append(conn)
+        return conn
+
+    def _checkin(self, key: PoolKey, conn: _PooledConnection, broken: bool = False) -> None:
+        with self._lock:
+            conn.in_use -= 1
+            conn.last_used = time.monotonic()
+            # A transport of a closed key is not handed out again once its last borrower is done.
+            if broken or key not in self._credentials:
+                conns = self._connections.get(key, [])
+                if conn in conns:
+                    conns.remove(conn)
+                if conn.in_use == 0:
+                    conn.close()
+            self._lock.notify_all()
+
+    @contextmanager
+    def client(self, key: PoolKey, timeout: Optional[float] = None) -> Iterator["paramiko.SSHClient"]:
+        """Borrow a live ``paramiko.SSHClient`` for ``key``; it stays shared with other borrowers."""
+        conn = self._checkout(key, timeout)
+        try:
+            yield conn.client
+        finally:
+            self._checkin(key, conn, broken=not self._is_alive(conn))
+
+    @contextmanager
+    def channel(self, key: PoolKey, timeout: Optional[float] = None) -> Iterator["paramiko.Channel"]:
+        """
+        Borrow a fresh session channel on a pooled transport.
+
+        If the chosen transport turns out to be dead it is discarded and the
+        channel is opened once more on a new transport.
+        """
+        for attempt in range(2):
+            conn = self._checkout(key, timeout)
+            try:
+                chan = conn.transport.open_session(timeout=timeout or self.connect_timeout)
+            except Exception as e:
+                self._checkin(key, conn, broken=True)
+                if attempt:
+                    raise SSHConnectionError(f"Failed to open SSH channel: {e}")
+                logger.warning(f"Pooled SSH transport to {key[0]} is dead, reconnecting: {e}")
+                continue
+            try:
+                yield chan
+            finally:
+                chan.close()
+                self._checkin(key, conn, broken=not self._is_alive(conn))
+            return
+
+    def evict_idle(self) -> None:
+        """Close every idle transport whose TTL has expired or that fails its keepalive probe."""
+        with self._lock:
+            for key in list(self._connections):
+                self._sweep(key)
+            quiet = [(key, conn) for key, conns in self._connections.items() for conn in conns
+                     if conn.in_use == 0 and self._probe_due(conn)]
+        # Probe outside the lock: send_ignore is network I/O and may block on a dead peer.
+        dead = [(key, conn) for key, conn in quiet if not self._is_alive(conn)]
+        with self._lock:
+            for key, conn in dead:
+                conns = self._connections.get(key, [])
+                if conn.in_use == 0 and conn in conns:
+                    conns.remove(conn)
+                    conn.close()
+
+    def add_reaper(self, callback: Callable[[], None]) -> None:
+        """Call ``callback`` on every reaper sweep, before idle transports are evicted."""
+        with self._lock:
+            self._reapers.append(callback)
+
+    def reap(self) -> None:
+        """Run the registered reapers, which may hand channels back, then evict idle transports."""
+        with self._lock:
+            reapers = list(self._reapers)
+        for callback in reapers:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"SSH pool reaper {callback.__name__} failed: {e}")
+        self.evict_idle()
+
+    def _start_reaper(self) -> None:
+        if self._reaper is not None or not self.reap_interval:
+            return
+        with self._lock:
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap_loop, name="ssh-pool-reaper", daemon=True)
+                self._reaper.start()
+
+    def _reap_loop(self) -> None:
+        while True:
+            time.sleep(self.reap_interval)
+            self.reap()
+
+    def release(self, key: PoolKey) -> None:
+        """Give back a handle from ``register``; closing ``key`` once no handle to it is left."""
+        with self._lock:
+            remaining = self._handles.get(key, 0) - 1
+            if remaining > 0:
+                self._handles[key] = remaining
+                return
+            self._handles.pop(key, None)
+        self.close(key)
+
+    def close(self, key: PoolKey) -> None:
+        """
+        Close all idle transports for ``key``, the busy ones when they are checked in, and
+        forget its credentials, whoever still holds a handle to it.
+        """
+        with self._lock:
+            self._handles.pop(key, None)
+            busy = []
+            for conn in self._connections.pop(key, []):
+                if conn.in_use:
+                    busy.append(conn)
+                else:
+                    conn.close()
+            if busy:
+                self._connections[key] = busy
+            self._credentials.pop(key, None)
+
+    def close_all(self) -> None:
+        with self._lock:
+            for conns in self._connections.values():
+                for conn in conns:
+                    conn.close()
+            self._connections.clear()
+            self._credentials.clear()
+            self._handles.clear()
+
+    def stats(self) -> Dict[PoolKey, Dict[str, int]]:
+        """Return the number of open transports and borrowed channels per key."""
+        with self._lock:
+            return {
+                key: {"sessions": len(conns), "in_use": sum(c.in_use for c in conns)}
+                for key, conns in self._connections.items()
+            }
+
+
+class PooledSSHSession:
+    """
+    Handle to a registered pool key. This is what ``connect_to_server`` hands out
+    and what ``main.py`` keeps in ``st.session_state['ssh']``.
+    """
+
+    def __init__(self, pool: SSHConnectionPool, key: PoolKey, timeout: Optional[float] = None):
+        self.pool = pool
+        self.key = key
+        self.timeout = timeout
+        self._released = False
+        self._lock = threading.Lock()
+
+    @property
+    def host(self) -> str:
+        return self.key[0]
+
+    @property
+    def port(self) -> int:
+        return self.key[1]
+
+    @property
+    def username(self) -> str:
+        return self.key[2]
+
+    def client(self):
+        return self.pool.client(self.key, timeout=self.timeout)
+
+    def channel(self):
+        return self.pool.channel(self.key, timeout=self.timeout)
+
+    def close(self) -> None:
+        """
+        Disconnect this handle. The key's transports and password are dropped once no
+        other session holds a handle to it; closing twice has no further effect.
+        """
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self.pool.release(self.key)
+
+    def __repr__(self) -> str:
+        return f"PooledSSHSession({self.username}@{self.host}:{self.port})"
+
+
+SSHLike = Union[PooledSSHSession, "paramiko.SSHClient"]
+
+
+@contextmanager
+def borrow_channel(ssh: SSHLike, timeout: Optional[float] = None) -> Iterator["paramiko.Channel"]:
+    """
+    Open a session channel on either a pooled session or a plain ``SSHClient``.
+
+    Args:
+        ssh (PooledSSHSession | paramiko.SSHClient): The SSH connection.
+        timeout (float): Optional channel open timeout.
+
+    Yields:
+        paramiko.Channel: A new session channel, closed on exit.
+    """
+    if isinstance(ssh, PooledSSHSession):
+        with ssh.pool.channel(ssh.key, timeout=timeout or ssh.timeout) as chan:
+            yield chan
+        return
+    transport = ssh.get_transport()
+    if transport is None or not transport.is_active():
+        raise SSHConnectionError("SSH connection is not active.")
+    chan = transport.open_session(timeout=timeout)
+    try:
+        yield chan
+    finally:
+        chan.close()
+
+
+# Shared by every Streamlit session in this process.
+ssh_pool = SSHConnectionPool()
@@ -0,0 +1,457 @@
+import logging
+import math
+import re
+import select
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from Core.database import evict_telemetry, load_telemetry_chunks, save_telemetry_chunk
+from Core.metrics import inc
+from Core.result_cache import host_identity
+from Core.ssh_pool import SSHLike, borrow_channel
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DEFAULT_SAMPLE_INTERVAL = 5  # Seconds between samples of one host
+DEFAULT_RING_CAPACITY = 720  # Samples kept in memory per host (an hour at the default interval)
+TELEMETRY_FLUSH_SAMPLES = 12  # Samples written to SQLite per chunk
+TELEMETRY_RETENTION = 7 * 24 * 3600  # Seconds persisted samples are kept
+TELEMETRY_IDLE_TIMEOUT = 600  # Seconds without a reader before a host's sampler stops
+STALE_INTERVALS = 3  # Missed samples after which a sampler restarts and its data counts as stale
+RESTART_BACKOFF = 5  # Seconds before a failed sampler reconnects, doubled per failure in a row
+MAX_RESTART_BACKOFF = 60
+HEALTH_WINDOW = 300  # Seconds of samples summarized in health answers
+HIGH_USAGE_PERCENT = 90  # CPU, memory or disk usage flagged in health answers
+SECTOR_SIZE = 512  # /proc/diskstats counts 512-byte sectors
+SECTION_MARKER = "__DEVOPS_ASSISTANT_TELEMETRY__"
+
+FIELDS = ("cpu_percent", "iowait_percent", "mem_percent", "swap_percent", "load1", "load5", "load15",
+          "disk_read_bps", "disk_write_bps", "disk_percent")
+
+# One long-running command per host: a sample every interval, each section introduced by a marker line.
+_SAMPLE_SCRIPT = (
+    "while :; do "
+    f"echo {SECTION_MARKER}stat; head -n 1 /proc/stat; "
+    f"echo {SECTION_MARKER}meminfo; cat /proc/meminfo; "
+    f"echo {SECTION_MARKER}loadavg; cat /proc/loadavg; "
+    f"echo {SECTION_MARKER}diskstats; cat /proc/diskstats; "
+    f"echo {SECTION_MARKER}df; df -P -k 2>/dev/null; "
+    f"echo {SECTION_MARKER}end; sleep {{interval}}; done"
+)
+_SECTION = re.compile(rf"^{SECTION_MARKER}(\w+)\n", re.MULTILINE)
+# Whole disks only: partitions, loop devices, RAM disks and device-mapper volumes would double count.
+_PARTITION = re.compile(r"^(?:(?:[shvx]|xv)d[a-z]+\d+|(?:nvme\d+n\d+|mmcblk\d+)p\d+|loop\d+|ram\d+|dm-\d+|sr\d+|zram\d+)$")
+
+_CPU_TOPIC = re.compile(r"\b(cpus?|processors?|load|busy)\b", re.IGNORECASE)
+_MEMORY_TOPIC = re.compile(r"\b(memory|ram|swap|mem)\b", re.IGNORECASE)
+_DISK_TOPIC = re.compile(r"\b(disks?|storage|space|filesystems?|i/?o|iops)\b", re.IGNORECASE)
+_GENERAL_TOPIC = re.compile(r"\b(health|healthy|overview|resources?)\b|"
+                            r"\b(server|host|machine|system|box)('s)? (status|load|usage|doing)\b|"
+                            r"\bhow('s| is) (the )?(server|host|machine|system|box)\b", re.IGNORECASE)
+# Questions that need commands rather than a snapshot of the numbers.
+_NEEDS_COMMANDS = re.compile(
+    r"\b(kill|restart|stop|start|install|remove|delete|clean|clear|free up|find|list|top|process(es)?|"
+    r"largest|biggest|why|configure|set|increase|mount|format|resize|partition|docker|containers?|"
+    r"files?|folders?|director(y|ies)|logs?|services?|config\w*|balanc\w*|git)\b", re.IGNORECASE)
+# How-to questions ("How do I check disk usage?") want commands to run, not the current numbers.
+_HOW_TO = re.compile(r"\bhow (do|can|could|should|would) (i|we|you|one)\b|\bhow to\b|\bcommands?\b|"
+                     r"\b(teach|explain|show) me\b", re.IGNORECASE)
+# Only questions about the current state are answered from samples.
+_STATUS_QUESTION = re.compile(
+    r"^\s*(what('s| is| are)|how('s| is| are| much| many| busy| full| high| loaded)|is|are|any)\b|"
+    r"\b(usage|utili[sz]ation|status|health\w*|overview|load|space|used|free|available|left|full|busy|doing)\b",
+    re.IGNORECASE)
+
+
+def parse_sample(text: str) -> Dict[str, Any]:
+    """
+    Parse one sample (the sections between two ``end`` markers) into raw counters:
+    ``cpu`` jiffies, ``meminfo`` in kB, ``loadavg``, total disk ``sectors`` read and
+    written, and ``filesystems`` as ``(mount, used_kb, size_kb)``.
+    """
+    sections = {}
+    parts = _SECTION.split(text)
+    for name, body in zip(parts[1::2], parts[2::2]):
+        sections[name] = body
+
+    raw: Dict[str, Any] = {}
+    fields = sections.get("stat", "").split()
+    if fields and fields[0] == "cpu":
+        raw["cpu"] = [int(value) for value in fields[1:]]
+    meminfo = {}
+    for line in sections.get("meminfo", "").splitlines():
+        name, _, value = line.partition(":")
+        if value:
+            meminfo[name] = int(value.split()[0])
+    raw["meminfo"] = meminfo
+    loadavg = sections.get("loadavg", "").split()
+    if len(loadavg) >= 3:
+        raw["loadavg"] = tuple(float(value) for value in loadavg[:3])
+    read = written = 0
+    for line in sections.get("diskstats", "").splitlines():
+        fields = line.split()
+        if len(fields) >= 10 and not _PARTITION.match(fields[2]):
+            read += int(fields[5])
+            written += int(fields[9])
+    raw["sectors"] = (read, written)
+    filesystems = []
+    for line in sections.get("df", "").splitlines()[1:]:
+        fields = line.split()
+        # Real filesystems, plus whatever is mounted on / (an overlay in containers).
+        if len(fields) >= 6 and (fields[0].startswith("/dev/") or fields[5] == "/") and fields[1].isdigit():
+            filesystems.append((fields[5], int(fields[2]), int(fields[1])))
+    raw["filesystems"] = filesystems
+    return raw
+
+
+def sample_values(raw: Dict[str, Any], previous: Optional[Dict[str, Any]], elapsed: float) -> List[float]:
+    """Turn raw counters into one row of ``FIELDS``; rates need the ``previous`` sample and are NaN without it."""
+    values = dict.fromkeys(FIELDS, math.nan)
+    if previous and "cpu" in raw and "cpu" in previous:
+        deltas = [now - before for now, before in zip(raw["cpu"], previous["cpu"])]
+        total = sum(deltas[:8])  # user nice system idle iowait irq softirq steal
+        if total > 0:
+            idle = deltas[3] + deltas[4]
+            values["cpu_percent"] = 100.0 * (total - idle) / total
+            values["iowait_percent"] = 100.0 * deltas[4] / total
+    meminfo = raw.get("meminfo", {})
+    if meminfo.get("MemTotal"):
+        available = meminfo.get("MemAvailable", meminfo.get("MemFree", 0))
+        values["mem_percent"] = 100.0 * (1 - available / meminfo["MemTotal"])
+    if "SwapTotal" in meminfo:
+        values["swap_percent"] = 100.0 * (1 - meminfo.get("SwapFree", 0) / meminfo["SwapTotal"]) \
+            if meminfo["SwapTotal"] else 0.0
+    if "loadavg" in raw:
+        values["load1"], values["load5"], values["load15"] = raw["loadavg"]
+    if previous and elapsed > 0:
+        values["disk_read_bps"] = max(0, raw["sectors"][0] - previous["sectors"][0]) * SECTOR_SIZE / elapsed
+        values["disk_write_bps"] = max(0, raw["sectors"][1] - previous["sectors"][1]) * SECTOR_SIZE / elapsed
+    usage = [100.0 * used / size for _, used, size in raw.get("filesystems", []) if size]
+    if usage:
+        values["disk_percent"] = max(usage)
+    return [values[field] for field in FIELDS]
+
+
+class TelemetryRing:
+    """
+    Fixed-capacity ring of samples in two preallocated numpy arrays: float64
+    timestamps and one float32 row of ``fields`` per sample. Not thread-safe.
+    """
+
+    def __init__(self, fields: Sequence[str] = FIELDS, capacity: int = DEFAULT_RING_CAPACITY):
+        self.fields = tuple(fields)
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.values = np.full((capacity, len(self.fields)), np.nan, dtype=np.float32)
+        self.size = 0
+        self._next = 0
+
+    def append(self, timestamp: float, row: Sequence[float]) -> None:
+        self.timestamps[self._next] = timestamp
+        self.values[self._next] = row
+        self._next = (self._next + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def window(self, since: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+        """Return copies of the timestamps and rows taken at or after ``since``, oldest first."""
+        order = np.roll(np.arange(self.capacity), -self._next)[self.capacity - self.size:]
+        timestamps = self.timestamps[order]
+        keep = timestamps >= since
+        return timestamps[keep], self.values[order][keep]
+
+    def latest(self) -> Optional[Tuple[float, np.ndarray]]:
+        if not self.size:
+            return None
+        index = (self._next - 1) % self.capacity
+        return float(self.timestamps[index]), self.values[index].copy()
+
+
+class HostTelemetry:
+    """
+    Samples one host in the background and keeps the samples in a ``TelemetryRing``.
+
+    A single command on one pooled channel prints every section each ``interval``, so a
+    sample costs no new channel or process start on the host. Samples are written to
+    SQLite in chunks and reloaded when the sampler starts again. The sampler stops by
+    itself once nobody has read its data for ``TELEMETRY_IDLE_TIMEOUT`` seconds.
+    """
+
+    def __init__(self, ssh: SSHLike, key: str, interval: float = DEFAULT_SAMPLE_INTERVAL,
+                 capacity: int = DEFAULT_RING_CAPACITY):
+        self.ssh = ssh
+        self.key = key
+        self.interval = interval
+        self.ring = TelemetryRing(FIELDS, capacity)
+        self.filesystems: List[Tuple[str, int, int]] = []
+        self.meminfo: Dict[str, int] = {}
+        self.samples = 0
+        self.restarts = 0
+        self.failures = 0  # Failed attempts in a row; the sampler is waiting to retry while this is set
+        self._pending: List[Tuple[float, List[float]]] = []
+        self._previous: Optional[Dict[str, Any]] = None
+        self._previous_at = 0.0
+        self._last_read = time.monotonic()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        with self._lock:
+            if self.running:
+                return
+            self._stop.clear()
+            self._wake.clear()
+            self._last_read = time.monotonic()
+            self._thread = threading.Thread(target=self._run, name=f"telemetry-{self.key}", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    @property
+    def failing(self) -> bool:
+        return self.failures > 0
+
+    def rebind(self, ssh: SSHLike) -> None:
+        """Sample through ``ssh`` from now on, retrying right away if the current connection is failing."""
+        if ssh is self.ssh:
+            return
+        self.ssh = ssh
+        if self.failing:
+            self._wake.set()
+
+    def touch(self) -> None:
+        self._last_read = time.monotonic()
+
+    def window(self, seconds: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Timestamps and rows of ``FIELDS`` from the last ``seconds``, oldest first."""
+        self.touch()
+        with self._lock:
+            return self.ring.window(time.time() - seconds)
+
+    def latest(self) -> Optional[Tuple[float, np.ndarray]]:
+        self.touch()
+        with self._lock:
+            return self.ring.latest()
+
+    def fresh(self) -> bool:
+        """Whether the newest sample is recent enough to answer questions with."""
+        latest = self.latest()
+        return latest is not None and time.time() - latest[0] <= STALE_INTERVALS * self.interval + 1
+
+    def _run(self) -> None:
+        self._load_history()
+        # Idleness is checked here too: a sampler whose connection is gone never gets as
+        # far as the read loop in _stream.
+        while not self._idle():
+            try:
+                self._stream()
+            except Exception as e:
+                self.failures += 1
+                self.restarts += 1
+                backoff = min(MAX_RESTART_BACKOFF, RESTART_BACKOFF * 2 ** (self.failures - 1))
+                logger.warning(f"Telemetry sampling of {self.key} failed ({e}); retrying in {backoff}s.")
+                self._wake.wait(backoff)
+                self._wake.clear()
+        self._flush()
+        logger.info(f"Stopped telemetry sampling of {self.key}.")
+
+    def _idle(self) -> bool:
+        if time.monotonic() - self._last_read > TELEMETRY_IDLE_TIMEOUT:
+            logger.info(f"Telemetry of {self.key} has not been read for {TELEMETRY_IDLE_TIMEOUT}s; stopping.")
+            self._stop.set()
+        return self._stop.is_set()
+
+    def _stream(self) -> None:
+        """Run the sampling loop on one channel until it fails, stalls or the sampler stops."""
+        stall = STALE_INTERVALS * self.interval + 10
+        with borrow_channel(self.ssh) as channel:
+            channel.exec_command(_SAMPLE_SCRIPT.format(interval=self.interval))
+            buffer = ""
+            end = f"{SECTION_MARKER}end\n"
+            last_sample = time.monotonic()
+            while not self._idle():
+                if channel.recv_ready():
+                    data = channel.recv(65536)
+                    if not data:
+                        raise ConnectionError("telemetry channel closed")
+                    buffer += data.decode(errors="replace")
+                    while end in buffer:
+                        text, buffer = buffer.split(end, 1)
+                        self._record(parse_sample(text))
+                        last_sample = time.monotonic()
+                    continue
+                if channel.closed or channel.exit_status_ready():
+                    raise ConnectionError(f"telemetry command exited with status {channel.recv_exit_status()}")
+                if time.monotonic() - last_sample > stall:
+                    raise TimeoutError(f"no sample for {stall}s")
+                select.select([channel], [], [], 1.0)
+
+    def _record(self, raw: Dict[str, Any]) -> None:
+        now, clock = time.time(), time.monotonic()
+        row = sample_values(raw, self._previous, clock - self._previous_at)
+        self._previous, self._previous_at = raw, clock
+        with self._lock:
+            self.ring.append(now, row)
+            self.filesystems = raw.get("filesystems", [])
+            self.meminfo = raw.get("meminfo", {})
+            self.samples += 1
+            self.failures = 0
+            self._pending.append((now, row))
+            flush = len(self._pending) >= TELEMETRY_FLUSH_SAMPLES
+        inc("telemetry_samples")
+        if flush:
+            self._flush()
+
+    def _flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        timestamps = np.array([timestamp for timestamp, _ in pending], dtype=np.float64)
+        rows = np.array([row for _, row in pending], dtype=np.float32)
+        try:
+            save_telemetry_chunk(self.key, FIELDS, float(timestamps[0]), float(timestamps[-1]),
+                                 timestamps.tobytes(), rows.tobytes())
+            evict_telemetry(time.time() - TELEMETRY_RETENTION)
+        except Exception as e:
+            logger.warning(f"Failed to save telemetry samples of {self.key}: {e}")
+
+    def _load_history(self) -> None:
+        """Refill the ring from SQLite so charts survive a restart of the app or the sampler."""
+        since = time.time() - self.ring.capacity * self.interval
+        with self._lock:
+            latest = self.ring.latest()
+        if latest is not None:
+            since = max(since, latest[0] + 1e-3)
+        try:
+            chunks = load_telemetry_chunks(self.key, since)
+        except Exception as e:
+            logger.warning(f"Failed to load telemetry samples of {self.key}: {e}")
+            return
+        with self._lock:
+            for fields, timestamps, samples in chunks:
+                timestamps = np.frombuffer(timestamps, dtype=np.float64)
+                rows = np.frombuffer(samples, dtype=np.float32).reshape(len(timestamps), len(fields))
+                columns = [fields.index(field) if field in fields else None for field in FIELDS]
+                for timestamp, row in zip(timestamps, rows):
+                    if timestamp >= since:
+                        self.ring.append(timestamp, [row[c] if c is not None else math.nan for c in columns])
+
+
+class TelemetryCollector:
+    """One ``HostTelemetry`` per (host, port), shared by every session connected to that host."""
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL, capacity: int = DEFAULT_RING_CAPACITY):
+        self.interval = interval
+        self.capacity = capacity
+        self._hosts: Dict[str, HostTelemetry] = {}
+        self._lock = threading.Lock()
+
+    def watch(self, ssh: SSHLike) -> Optional[HostTelemetry]:
+        """Return the host's telemetry, starting its sampler on ``ssh`` if it is not running."""
+        identity = host_identity(ssh)
+        if identity is None:
+            return None
+        key = f"{identity[0]}:{identity[1]}"
+        with self._lock:
+            host = self._hosts.get(key)
+            if host is None:
+                host = self._hosts[key] = HostTelemetry(ssh, key, self.interval, self.capacity)
+        if not host.running or host.failing:
+            host.rebind(ssh)  # The session the sampler was started on may be closed by now
+            host.start()
+        host.touch()
+        return host
+
+    def stop_all(self) -> None:
+        with self._lock:
+            for host in self._hosts.values():
+                host.stop()
+
+
+# Shared by every session of the process, like the SSH pool.
+telemetry = TelemetryCollector()
+
+
+def _percent(value: float) -> str:
+    return "n/a" if math.isnan(value) else f"{value:.0f}%"
+
+
+def _rate(value: float) -> str:
+    return "n/a" if math.isnan(value) else f"{value / 1e6:.1f} MB/s"
+
+
+def _gib(kb: float) -> str:
+    return f"{kb / 1024 ** 2:.1f} GiB"
+
+
+def answer_health_question(question: str, host: Optional[HostTelemetry]) -> Optional[str]:
+    """
+    Answer a status question about CPU, memory, disk or overall health from the host's
+    recent samples, as Markdown. Returns None when the question asks how to do something,
+    needs commands, is about something else, or there is no fresh sample to answer from.
+    """
+    if host is None or not question or _NEEDS_COMMANDS.search(question) or _HOW_TO.search(question):
+        return None
+    if not _STATUS_QUESTION.search(question):
+        return None
+    topics = [name for name, pattern in (("cpu", _CPU_TOPIC), ("memory", _MEMORY_TOPIC), ("disk", _DISK_TOPIC))
+              if pattern.search(question)]
+    if not topics:
+        if not _GENERAL_TOPIC.search(question):
+            return None
+        topics = ["cpu", "memory", "disk"]
+    if not host.fresh():
+        return None
+
+    timestamps, rows = host.window(HEALTH_WINDOW)
+    column = {field: rows[:, i] for i, field in enumerate(FIELDS)}
+    now = {field: float(values[-1]) for field, values in column.items()}
+
+    def stat(field: str, reducer) -> float:
+        values = column[field][~np.isnan(column[field])]
+        return float(reducer(values)) if values.size else math.nan
+
+    minutes = HEALTH_WINDOW // 60
+    lines, warnings = [], []
+    if "cpu" in topics:
+        lines.append(f"**CPU**: {_percent(now['cpu_percent'])} busy (iowait {_percent(now['iowait_percent'])}); "
+                     f"{minutes}-min average {_percent(stat('cpu_percent', np.mean))}, "
+                     f"peak {_percent(stat('cpu_percent', np.max))}. "
+                     f"Load average {now['load1']:.2f} / {now['load5']:.2f} / {now['load15']:.2f}.")
+        if now["cpu_percent"] >= HIGH_USAGE_PERCENT:
+            warnings.append("CPU is almost fully busy.")
+    if "memory" in topics:
+        memory = f"**Memory**: {_percent(now['mem_percent'])} used"
+        if host.meminfo.get("MemTotal"):
+            available = host.meminfo.get("MemAvailable", host.meminfo.get("MemFree", 0))
+            memory += f", {_gib(available)} of {_gib(host.meminfo['MemTotal'])} available"
+        lines.append(f"{memory}; {minutes}-min peak {_percent(stat('mem_percent', np.max))}. "
+                     f"Swap {_percent(now['swap_percent'])} used.")
+        if now["mem_percent"] >= HIGH_USAGE_PERCENT:
+            warnings.append("Memory is nearly exhausted.")
+    if "disk" in topics:
+        filesystems = sorted(host.filesystems, key=lambda fs: fs[1] / fs[2] if fs[2] else 0, reverse=True)
+        usage = ", ".join(f"`{mount}` {100 * used / size:.0f}% ({_gib(used)} of {_gib(size)})"
+                          for mount, used, size in filesystems[:3] if size) or "n/a"
+        lines.append(f"**Disk**: fullest filesystems {usage}. I/O {_rate(now['disk_read_bps'])} read, "
+                     f"{_rate(now['disk_write_bps'])} write ({minutes}-min average "
+                     f"{_rate(stat('disk_read_bps', np.mean))} / {_rate(stat('disk_write_bps', np.mean))}).")
+        if any(size and 100 * used / size >= HIGH_USAGE_PERCENT for _, used, size in filesystems):
+            warnings.append("A filesystem is almost full.")
+
+    inc("telemetry_answers")
+    age = time.time() - timestamps[-1]
+    answer = "\n\n".join(lines + [f"⚠️ {warning}" for warning in warnings])
+    return f"{answer}\n\n_From telemetry of {host.key}, sampled {age:.0f}s ago._"
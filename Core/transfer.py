@@ -0,0 +1,449 @@
+import logging
+import mmap
+import os
+import posixpath
+import queue
+import shlex
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from Core.exceptions import FileTransferError
+from Core.ssh_pool import SSHLike, borrow_channel
+from Core.safety import command_filter
+from Core.result_cache import result_cache
+from Core.metrics import observe, inc
+
+if TYPE_CHECKING:
+    import paramiko
+
+logger = logging.getLogger(__name__)
+
+# Constants
+DEFAULT_TRANSFER_CHUNK = 32768  # Bytes per SFTP read/write request (the protocol's usual maximum)
+DEFAULT_PIPELINE_DEPTH = 64  # SFTP read requests kept in flight per file
+DEFAULT_TRANSFER_WORKERS = 4  # Files (or segments of one file) transferred at once
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024  # Downloads at least twice this size are split across channels
+DEFAULT_COMPRESSION_LEVEL = 6  # gzip level used on the remote side and locally
+DEFAULT_TRANSFER_IDLE_TIMEOUT = 60  # Seconds without data before a compressed transfer is abandoned
+PROGRESS_INTERVAL = 0.1  # Seconds between progress callbacks
+PARTIAL_SUFFIX = ".part"  # Partial files are kept under this suffix until complete, so they can resume
+
+ProgressCallback = Callable[[int, int], None]
+Source = Union[str, BinaryIO]
+
+
+@contextmanager
+def borrow_sftp(ssh: SSHLike) -> Iterator["paramiko.SFTPClient"]:
+    """
+    Open an SFTP session on a channel of the existing connection (pooled or plain).
+
+    Yields:
+        paramiko.SFTPClient: Closed, with its channel, on exit.
+    """
+    import paramiko
+
+    with borrow_channel(ssh) as channel:
+        channel.invoke_subsystem("sftp")
+        sftp = paramiko.SFTPClient(channel)
+        try:
+            yield sftp
+        finally:
+            sftp.close()
+
+
+class _Progress:
+    """Byte counter shared by the threads of one transfer; reports at most every ``PROGRESS_INTERVAL``."""
+
+    def __init__(self, total: int, done: int = 0, callback: Optional[ProgressCallback] = None):
+        self.total = total
+        self.done = done
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._reported = 0.0
+
+    def add(self, count: int) -> None:
+        with self._lock:
+            self.done += count
+
+    def report(self, force: bool = False) -> None:
+        if self.callback is None:
+            return
+        now = time.monotonic()
+        if force or now - self._reported >= PROGRESS_INTERVAL:
+            self._reported = now
+            self.callback(self.done, self.total)
+
+
+def _chunks(start: int, end: int, size: int = DEFAULT_TRANSFER_CHUNK) -> List[Tuple[int, int]]:
+    return [(offset, min(size, end - offset)) for offset in range(start, end, size)]
+
+
+def _transfer_result(direction: str, source: str, destination: str, size: int, resumed_from: int,
+                     started: float, compressed: bool, error: Optional[str] = None) -> Dict[str, Any]:
+    elapsed = time.monotonic() - started
+    transferred = max(0, size - resumed_from) if error is None else 0
+    if error is None:
+        observe("transfer", elapsed, op=direction)
+        inc("transfer_bytes", transferred, op=direction)
+    return {
+        "direction": direction,
+        "source": source,
+        "destination": destination,
+        "bytes": size,
+        "transferred": transferred,
+        "resumed_from": resumed_from,
+        "elapsed": elapsed,
+        "throughput": transferred / elapsed if elapsed > 0 else 0.0,
+        "compressed": compressed,
+        "error": error,
+    }
+
+
+def download_file(ssh: SSHLike, remote_path: str, local_path: str, resume: bool = True,
+                  compress: bool = False, max_workers: int = DEFAULT_TRANSFER_WORKERS,
+                  on_progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+    """
+    Download a remote file straight to disk.
+
+    Data is written as it arrives into ``<local_path>.part``, which is renamed once
+    complete; nothing holds the whole file in memory. Reads are pipelined
+    (``DEFAULT_PIPELINE_DEPTH`` requests in flight), and a file of at least two
+    segments is fetched over ``max_workers`` SFTP channels at once into a
+    memory-mapped, pre-sized ``.part`` file. With ``compress`` the remote side runs
+    ``gzip`` and the stream is decompressed on the fly instead.
+
+    Args:
+        ssh (PooledSSHSession | paramiko.SSHClient): The SSH connection.
+        remote_path (str): File on the server.
+        local_path (str): Destination file; an existing directory keeps the remote file name.
+        resume (bool): Continue from an existing ``.part`` file (sequential transfers only).
+        compress (bool): Compress on the server with gzip; needs gzip and tail there.
+        max_workers (int): Channels used for a segmented download.
+        on_progress (callable): Optional ``on_progress(done_bytes, total_bytes)``, called on this thread.
+
+    Returns:
+        dict: ``direction``, ``source``, ``destination``, ``bytes``, ``transferred``,
+        ``resumed_from``, ``elapsed``, ``throughput`` (bytes/s), ``compressed`` and ``error``.
+
+    Raises:
+        FileTransferError: If the transfer fails. The ``.part`` file is kept for a resume.
+    """
+    local_path = _local_destination(remote_path, local_path)
+    part_path = local_path + PARTIAL_SUFFIX
+    started = time.monotonic()
+    try:
+        with borrow_sftp(ssh) as sftp:
+            size = sftp.stat(remote_path).st_size
+            offset = os.path.getsize(part_path) if resume and os.path.exists(part_path) else 0
+            if offset > size:
+                logger.warning(f"Partial download of {remote_path} is larger than the file; starting over.")
+                offset = 0
+            progress = _Progress(size, offset, on_progress)
+            if compress:
+                _download_compressed(ssh, remote_path, part_path, offset, progress)
+            elif offset == 0 and max_workers > 1 and size >= 2 * DEFAULT_SEGMENT_SIZE:
+                _download_segments(ssh, remote_path, part_path, size, max_workers, progress)
+            else:
+                _download_sftp(sftp, remote_path, part_path, offset, size, progress)
+        progress.report(force=True)
+        os.replace(part_path, local_path)
+    except FileTransferError:
+        raise
+    except Exception as e:
+        logger.error(f"Download of {remote_path} failed: {e}")
+        raise FileTransferError(f"Download of {remote_path} failed: {e}")
+    logger.info(f"Downloaded {remote_path} to {local_path} ({size} bytes)")
+    return _transfer_result("download", remote_path, local_path, size, offset, started, compress)
+
+
+def _local_destination(remote_path: str, local_path: str) -> str:
+    if os.path.isdir(local_path):
+        return os.path.join(local_path, posixpath.basename(remote_path))
+    return local_path
+
+
+def _download_sftp(sftp: "paramiko.SFTPClient", remote_path: str, part_path: str, offset: int, size: int,
+                   progress: _Progress) -> None:
+    with sftp.open(remote_path, "rb") as remote, open(part_path, "r+b" if offset else "wb") as out:
+        out.seek(offset)
+        out.truncate()
+        for data in remote.readv(_chunks(offset, size), DEFAULT_PIPELINE_DEPTH):
+            out.write(data)
+            progress.add(len(data))
+            progress.report()
+
+
+def _download_segments(ssh: SSHLike, remote_path: str, part_path: str, size: int, max_workers: int,
+                       progress: _Progress) -> None:
+    segment = max(DEFAULT_SEGMENT_SIZE, -(-size // max_workers))
+    bounds = [(start, min(size, start + segment)) for start in range(0, size, segment)]
+    with open(part_path, "wb") as out:
+        out.truncate(size)
+    with open(part_path, "r+b") as out, mmap.mmap(out.fileno(), size) as buffer:
+
+        def fetch(start: int, end: int) -> None:
+            position = start
+            with borrow_sftp(ssh) as sftp, sftp.open(remote_path, "rb") as remote:
+                for data in remote.readv(_chunks(start, end), DEFAULT_PIPELINE_DEPTH):
+                    buffer[position:position + len(data)] = data
+                    position += len(data)
+                    progress.add(len(data))
+
+        with ThreadPoolExecutor(max_workers=len(bounds)) as executor:
+            pending = {executor.submit(fetch, start, end) for start, end in bounds}
+            while pending:
+                done, pending = wait(pending, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+                progress.report()
+        buffer.flush()
+
+
+def _download_compressed(ssh: SSHLike, remote_path: str, part_path: str, offset: int,
+                         progress: _Progress) -> None:
+    quoted = shlex.quote(remote_path)
+    command = (f"tail -c +{offset + 1} -- {quoted} | gzip -c -{DEFAULT_COMPRESSION_LEVEL}" if offset
+               else f"gzip -c -{DEFAULT_COMPRESSION_LEVEL} -- {quoted}")
+    command_filter.validate(command)
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    with borrow_channel(ssh) as channel, open(part_path, "r+b" if offset else "wb") as out:
+        out.seek(offset)
+        out.truncate()
+        channel.settimeout(DEFAULT_TRANSFER_IDLE_TIMEOUT)
+        channel.exec_command(command)
+        while True:
+            data = channel.recv(DEFAULT_TRANSFER_CHUNK)
+            if not data:
+                break
+            data = decompressor.decompress(data)
+            out.write(data)
+            progress.add(len(data))
+            progress.report()
+        tail = decompressor.flush()
+        out.write(tail)
+        progress.add(len(tail))
+        exit_status = channel.recv_exit_status()
+        if exit_status != 0:
+            error = channel.recv_stderr(4096).decode(errors="replace").strip()
+            raise FileTransferError(f"Compressed download of {remote_path} failed ({exit_status}): {error}")
+
+
+def upload_file(ssh: SSHLike, source: Source, remote_path: str, resume: bool = True,
+                compress: bool = False, size: Optional[int] = None,
+                on_progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+    """
+    Upload a local file (or a binary file object, e.g. a Streamlit upload) to the server.
+
+    The data goes to ``<remote_path>.part`` with pipelined SFTP writes, read from a
+    memory map of the local file (or in chunks from a file object), and the part file
+    is renamed once complete. With ``compress`` the data is gzipped on the fly and
+    unpacked by ``gzip -d`` on the server. Cached command results of the host are
+    dropped, since the upload changes it.
+
+    Args:
+        ssh (PooledSSHSession | paramiko.SSHClient): The SSH connection.
+        source (str | file): Local path, or a seekable binary file object.
+        remote_path (str): Destination file; a path ending in ``/`` keeps the local file name.
+        resume (bool): Continue from an existing remote ``.part`` file.
+        compress (bool): Compress in transit; needs gzip on the server.
+        size (int): Size of a file object ``source``; measured by seeking when omitted.
+        on_progress (callable): Optional ``on_progress(done_bytes, total_bytes)``, called on this thread.
+
+    Returns:
+        dict: The same keys as ``download_file``.
+
+    Raises:
+        FileTransferError: If the transfer fails. The remote ``.part`` file is kept for a resume.
+    """
+    name = _source_name(source)
+    remote_path = _remote_destination(name, remote_path)
+    part_path = remote_path + PARTIAL_SUFFIX
+    started = time.monotonic()
+    # Not a read-only command, so this drops the host's cached results (again when finished).
+    token = result_cache.begin(ssh, f"upload {remote_path}")
+    try:
+        with _open_source(source) as (stream, view):
+            if size is None:
+                size = len(view) if view is not None else stream.seek(0, os.SEEK_END)
+            with borrow_sftp(ssh) as sftp:
+                offset = 0
+                if resume:
+                    try:
+                        offset = sftp.stat(part_path).st_size
+                    except IOError:
+                        offset = 0
+                if offset > size:
+                    logger.warning(f"Partial upload to {remote_path} is larger than the file; starting over.")
+                    offset = 0
+                progress = _Progress(size, offset, on_progress)
+                if compress:
+                    _upload_compressed(ssh, stream, view, part_path, offset, size, progress)
+                else:
+                    _upload_sftp(sftp, stream, view, part_path, offset, size, progress)
+                progress.report(force=True)
+                try:
+                    sftp.posix_rename(part_path, remote_path)
+                except IOError:
+                    # Servers without the posix-rename extension refuse to replace an existing file.
+                    try:
+                        sftp.remove(remote_path)
+                    except IOError:
+                        pass
+                    sftp.rename(part_path, remote_path)
+    except FileTransferError:
+        raise
+    except Exception as e:
+        logger.error(f"Upload to {remote_path} failed: {e}")
+        raise FileTransferError(f"Upload to {remote_path} failed: {e}")
+    finally:
+        result_cache.finish(ssh, f"upload {remote_path}", None, token)
+    logger.info(f"Uploaded {name} to {remote_path} ({size} bytes)")
+    return _transfer_result("upload", name, remote_path, size, offset, started, compress)
+
+
+def _source_name(source: Source) -> str:
+    return source if isinstance(source, str) else getattr(source, "name", "upload")
+
+
+def _remote_destination(name: str, remote_path: str) -> str:
+    if remote_path.endswith("/"):
+        return posixpath.join(remote_path, os.path.basename(name))
+    return remote_path
+
+
+@contextmanager
+def _open_source(source: Source) -> Iterator[Tuple[BinaryIO, Optional[mmap.mmap]]]:
+    """Yield ``(stream, memory map or None)``; empty files and file objects get no map."""
+    if not isinstance(source, str):
+        yield source, None
+        return
+    with open(source, "rb") as stream:
+        if os.fstat(stream.fileno()).st_size == 0:
+            yield stream, None
+            return
+        with mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            yield stream, view
+
+
+def _read_blocks(stream: BinaryIO, view: Optional[mmap.mmap], offset: int, size: int) -> Iterator[bytes]:
+    if view is not None:
+        for start, length in _chunks(offset, size):
+            yield view[start:start + length]
+        return
+    stream.seek(offset)
+    while True:
+        data = stream.read(DEFAULT_TRANSFER_CHUNK)
+        if not data:
+            return
+        yield data
+
+
+def _upload_sftp(sftp: "paramiko.SFTPClient", stream: BinaryIO, view: Optional[mmap.mmap], part_path: str,
+                 offset: int, size: int, progress: _Progress) -> None:
+    with sftp.open(part_path, "r+b" if offset else "wb") as remote:
+        remote.set_pipelined(True)  # Don't wait for each write to be acknowledged
+        remote.seek(offset)
+        for data in _read_blocks(stream, view, offset, size):
+            remote.write(data)
+            progress.add(len(data))
+            progress.report()
+
+
+def _upload_compressed(ssh: SSHLike, stream: BinaryIO, view: Optional[mmap.mmap], part_path: str,
+                       offset: int, size: int, progress: _Progress) -> None:
+    command = f"gzip -dc {'>>' if offset else '>'} {shlex.quote(part_path)}"
+    command_filter.validate(command)
+    compressor = zlib.compressobj(DEFAULT_COMPRESSION_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    with borrow_channel(ssh) as channel:
+        channel.settimeout(DEFAULT_TRANSFER_IDLE_TIMEOUT)
+        channel.exec_command(command)
+        for data in _read_blocks(stream, view, offset, size):
+            channel.sendall(compressor.compress(data))
+            progress.add(len(data))
+            progress.report()
+        channel.sendall(compressor.flush())
+        channel.shutdown_write()
+        exit_status = channel.recv_exit_status()
+        if exit_status != 0:
+            error = channel.recv_stderr(4096).decode(errors="replace").strip()
+            raise FileTransferError(f"Compressed upload to {part_path} failed ({exit_status}): {error}")
+
+
+def duplicate_destinations(transfers: List[Dict[str, Any]]) -> List[str]:
+    """
+    Return the destination files that more than one of ``transfers`` would write.
+
+    Such transfers would share one ``.part`` file and overwrite each other's result,
+    e.g. ``/var/log/app1/error.log`` and ``/var/log/app2/error.log`` downloaded into
+    one directory.
+    """
+    seen = set()
+    duplicates = []
+    for transfer in transfers:
+        if transfer["direction"] == "upload":
+            path = posixpath.normpath(_remote_destination(_source_name(transfer["source"]), transfer["destination"]))
+        else:
+            path = os.path.normcase(os.path.abspath(_local_destination(transfer["source"], transfer["destination"])))
+        key = (transfer["direction"], path)
+        if key in seen and path not in duplicates:
+            duplicates.append(path)
+        seen.add(key)
+    return duplicates
+
+
+def transfer_files(ssh: SSHLike, transfers: List[Dict[str, Any]], max_workers: int = DEFAULT_TRANSFER_WORKERS,
+                   on_progress: Optional[Callable[[int, int, int], None]] = None,
+                   **options) -> List[Dict[str, Any]]:
+    """
+    Run many uploads and downloads in parallel, each on its own SFTP channel.
+
+    Args:
+        ssh (PooledSSHSession | paramiko.SSHClient): The SSH connection.
+        transfers (list): Dicts with ``direction`` (``"upload"`` or ``"download"``), ``source``
+            and ``destination``, plus optional ``size`` for uploads from file objects.
+        max_workers (int): Maximum number of files transferred at once.
+        on_progress (callable): Optional ``on_progress(index, done_bytes, total_bytes)``, relayed to this thread.
+        **options: ``resume`` and ``compress``, passed to every transfer.
+
+    Returns:
+        list: One result per transfer, in order. A failed transfer has its message in
+        ``error`` instead of raising.
+
+    Raises:
+        FileTransferError: If two transfers have the same destination file; nothing is transferred.
+    """
+    if not transfers:
+        return []
+    duplicates = duplicate_destinations(transfers)
+    if duplicates:
+        raise FileTransferError(f"More than one transfer would write {', '.join(duplicates)}")
+    updates: "queue.Queue[tuple]" = queue.Queue()
+
+    def run(index: int, transfer: Dict[str, Any]) -> Dict[str, Any]:
+        report = (lambda done, total: updates.put((index, done, total))) if on_progress else None
+        started = time.monotonic()
+        try:
+            if transfer["direction"] == "upload":
+                return upload_file(ssh, transfer["source"], transfer["destination"], size=transfer.get("size"),
+                                   on_progress=report, **options)
+            # Files already run in parallel; don't also split each one.
+            return download_file(ssh, transfer["source"], transfer["destination"], max_workers=1,
+                                 on_progress=report, **options)
+        except FileTransferError as e:
+            return _transfer_result(transfer["direction"], _source_name(transfer["source"]), transfer["destination"], 0, 0, started,
+                                    options.get("compress", False), error=str(e))
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(transfers))) as executor:
+        futures = [executor.submit(run, index, transfer) for index, transfer in enumerate(transfers)]
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+            while on_progress and not updates.empty():
+                on_progress(*updates.get_nowait())
+        while on_progress and not updates.empty():
+            on_progress(*updates.get_nowait())
+        return [future.result() for future in futures]
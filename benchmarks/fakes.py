@@ -0,0 +1,481 @@
+"""
+Local stand-ins for an Ollama server and an SSH host, used by the benchmarks.
+
+``FakeOllamaServer`` speaks enough of the Ollama HTTP API for ``langchain_ollama``:
+``/api/tags``, streamed or buffered ``/api/generate`` with a configurable first-token
+latency and token rate, and ``/api/embed`` (hashing embeddings, so the semantic
+cache behaves as it would against a real embedding model).
+
+``FakeSSHServer`` is an in-process paramiko server. Commands are not executed:
+each one answers with canned output of a configurable size after a configurable
+delay, so runs are repeatable and independent of the machine's own shell. Only
+with ``shell=True`` does an interactive shell request get a real local ``/bin/sh``
+on a PTY, for exercising persistent shell sessions; ``execute=True`` runs exec
+requests through a local ``/bin/sh -c``, and ``sftp_root`` serves that directory
+over SFTP, for exercising file transfers.
+"""
+import hashlib
+import json
+import os
+import select
+import socket
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import paramiko
+
+# Constants
+DEFAULT_MODEL_NAME = "llama3.2"
+DEFAULT_EMBEDDING_DIMENSIONS = 768
+DEFAULT_RESPONSES = (
+    "```bash\ndf -h\n```",
+    "```bash\nuptime\nfree -m\n```",
+    "```bash\nps aux --sort=-%cpu | head -n 10\n```",
+    "```bash\nsystemctl status nginx\njournalctl -u nginx -n 50\n```",
+    "```bash\nls -la /var/log\ndu -sh /var/log\n```",
+)
+SSH_SEND_CHUNK = 32768
+
+
+class FakeOllamaServer:
+    """
+    Threaded HTTP server mimicking the Ollama endpoints the assistant uses.
+
+    Args:
+        first_token_latency (float): Seconds before the first token (or buffered response) is sent.
+        tokens_per_second (float): Streaming rate; 0 sends all tokens at once.
+        responses (tuple): Canned answers; a prompt always maps to the same one.
+        models (list): Model names listed by ``/api/tags``.
+    """
+
+    def __init__(self, first_token_latency: float = 0.2, tokens_per_second: float = 50.0,
+                 responses=DEFAULT_RESPONSES, models: Optional[List[str]] = None,
+                 tags_latency: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        self.first_token_latency = first_token_latency
+        self.tokens_per_second = tokens_per_second
+        self.responses = tuple(responses)
+        self.models = models or [DEFAULT_MODEL_NAME]
+        self.tags_latency = tags_latency
+        self.requests = {"tags": 0, "generate": 0, "embed": 0}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOllamaServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def response_for(self, prompt: str) -> str:
+        # The question is the last line of the assistant's prompt template.
+        question = prompt.strip().rsplit("\n", 1)[-1]
+        digest = hashlib.sha256(question.encode()).digest()
+        return self.responses[digest[0] % len(self.responses)]
+
+    def _count(self, endpoint: str) -> None:
+        with self._lock:
+            self.requests[endpoint] += 1
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def handle(self):
+                try:
+                    super().handle()
+                except (ConnectionResetError, BrokenPipeError):
+                    pass  # Clients drop idle keep-alive connections
+
+            def do_GET(self):
+                if self.path.rstrip("/") != "/api/tags":
+                    self.send_error(404)
+                    return
+                fake._count("tags")
+                time.sleep(fake.tags_latency)
+                self._send_json({"models": [{"name": name, "model": name} for name in fake.models]})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                path = self.path.rstrip("/")
+                if path == "/api/generate":
+                    fake._count("generate")
+                    self._generate(body)
+                elif path in ("/api/embed", "/api/embeddings"):
+                    fake._count("embed")
+                    self._embed(body, legacy=path == "/api/embeddings")
+                else:
+                    self.send_error(404)
+
+            def _generate(self, body):
+                model = body.get("model", DEFAULT_MODEL_NAME)
+                text = fake.response_for(body.get("prompt", ""))
+                time.sleep(fake.first_token_latency)
+                if not body.get("stream", True):
+                    self._send_json(self._chunk(model, text, done=True))
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                interval = 1.0 / fake.tokens_per_second if fake.tokens_per_second else 0.0
+                try:
+                    for i, token in enumerate(_tokenize(text)):
+                        if i and interval:
+                            time.sleep(interval)
+                        self._write_chunk(json.dumps(self._chunk(model, token)) + "\n")
+                    self._write_chunk(json.dumps(self._chunk(model, "", done=True)) + "\n")
+                    self._write_chunk("")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client closed the stream early, as the assistant does once a block is complete.
+                    self.close_connection = True
+
+            def _embed(self, body, legacy):
+                from Core.semantic_cache import HashingEmbedder
+
+                embedder = HashingEmbedder(DEFAULT_EMBEDDING_DIMENSIONS)
+                if legacy:
+                    self._send_json({"embedding": embedder.embed(body.get("prompt", "")).tolist()})
+                    return
+                inputs = body.get("input", "")
+                inputs = [inputs] if isinstance(inputs, str) else inputs
+                self._send_json({"model": body.get("model"),
+                                 "embeddings": [embedder.embed(text).tolist() for text in inputs]})
+
+            @staticmethod
+            def _chunk(model, text, done=False):
+                chunk = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                         "response": text, "done": done}
+                if done:
+                    chunk["done_reason"] = "stop"
+                return chunk
+
+            def _write_chunk(self, data: str):
+                payload = data.encode()
+                self.wfile.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+                self.wfile.flush()
+
+            def _send_json(self, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def _tokenize(text: str) -> List[str]:
+    """Split text into word-ish tokens roughly the size a model would emit."""
+    tokens, current = [], ""
+    for char in text:
+        current += char
+        if char in " \n" or len(current) >= 4:
+            tokens.append(current)
+            current = ""
+    if current:
+        tokens.append(current)
+    return tokens
+
+
+@dataclass
+class CannedCommand:
+    """Reply of the fake SSH host to one command."""
+    output_bytes: int = 2048
+    delay: float = 0.05
+    exit_status: int = 0
+    stderr_bytes: int = 0
+
+
+class FakeSSHServer:
+    """
+    In-process paramiko SSH server answering every command with canned output.
+
+    Commands are looked up in ``commands`` by their full text, then by program name;
+    anything else gets ``default``. Any username is accepted with ``password``.
+    With ``shell=True``, shell requests run a local ``/bin/sh`` as the current user;
+    with ``execute=True`` exec requests do too. ``sftp_root`` enables the SFTP
+    subsystem, with paths relative to that directory.
+    """
+
+    def __init__(self, password: str = "benchmark", default: Optional[CannedCommand] = None,
+                 commands: Optional[Dict[str, CannedCommand]] = None, host: str = "127.0.0.1", port: int = 0,
+                 shell: bool = False, execute: bool = False, sftp_root: Optional[str] = None):
+        self.password = password
+        self.default = default or CannedCommand()
+        self.commands = dict(commands or {})
+        self.shell = shell
+        self.execute = execute
+        self.sftp_root = os.path.realpath(sftp_root) if sftp_root else None
+        self.executed = 0
+        self.connections = 0
+        self.shells = 0
+        self._lock = threading.Lock()
+        self._host_key = paramiko.ECDSAKey.generate()
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((host, port))
+        self._transports = []
+        self._running = False
+
+    @property
+    def port(self) -> int:
+        return self._socket.getsockname()[1]
+
+    def start(self) -> "FakeSSHServer":
+        self._socket.listen(128)
+        self._running = True
+        threading.Thread(target=self._accept_loop, name="fake-ssh", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._running = False
+        self._socket.close()
+        for transport in self._transports:
+            transport.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def canned(self, command: str) -> CannedCommand:
+        if command in self.commands:
+            return self.commands[command]
+        program = command.strip().split(" ", 1)[0]
+        return self.commands.get(program, self.default)
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                client, _ = self._socket.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self._host_key)
+            if self.sftp_root:
+                transport.set_subsystem_handler("sftp", paramiko.SFTPServer, _LocalSFTPServer, self.sftp_root)
+            with self._lock:
+                self.connections += 1
+                self._transports.append(transport)
+            try:
+                transport.start_server(server=_ServerInterface(self))
+            except Exception:
+                transport.close()
+
+    def _run(self, channel, command: str):
+        with self._lock:
+            self.executed += 1
+        canned = self.canned(command)
+        try:
+            time.sleep(canned.delay)
+            _send_filler(channel.sendall, canned.output_bytes, f"{command}\n")
+            _send_filler(channel.sendall_stderr, canned.stderr_bytes, f"{command}: warning\n")
+            channel.send_exit_status(canned.exit_status)
+        except Exception:
+            pass  # The client went away mid-command
+        finally:
+            channel.close()
+
+    def _run_local(self, channel, command: str):
+        """Run ``command`` with the local ``/bin/sh``, wiring its stdin/stdout/stderr to the channel."""
+        with self._lock:
+            self.executed += 1
+        process = subprocess.Popen(["/bin/sh", "-c", command], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, cwd=self.sftp_root)
+
+        def pump(read, write, close=None):
+            try:
+                while True:
+                    data = read(SSH_SEND_CHUNK)
+                    if not data:
+                        break
+                    write(data)
+            except Exception:
+                pass  # Either side went away
+            finally:
+                if close:
+                    close()
+
+        pumps = [
+            threading.Thread(target=pump, args=(channel.recv, process.stdin.write, process.stdin.close), daemon=True),
+            threading.Thread(target=pump, args=(process.stdout.read1, channel.sendall), daemon=True),
+            threading.Thread(target=pump, args=(process.stderr.read1, channel.sendall_stderr), daemon=True),
+        ]
+        for thread in pumps:
+            thread.start()
+        try:
+            status = process.wait()
+            for thread in pumps[1:]:
+                thread.join()
+            channel.send_exit_status(status)
+        except Exception:
+            pass
+        finally:
+            channel.close()
+
+    def _run_shell(self, channel):
+        """Relay between the channel and a local shell on a fresh PTY until either side closes."""
+        with self._lock:
+            self.shells += 1
+        master, slave = os.openpty()
+        process = subprocess.Popen(["/bin/sh", "-i"], stdin=slave, stdout=slave, stderr=slave,
+                                   start_new_session=True, env={"PATH": os.environ.get("PATH", ""), "HOME": "/tmp"})
+        os.close(slave)
+        try:
+            while process.poll() is None and not channel.closed:
+                readable, _, _ = select.select([master, channel], [], [], 0.5)
+                if master in readable:
+                    try:
+                        data = os.read(master, SSH_SEND_CHUNK)
+                    except OSError:
+                        break  # The shell exited and closed the terminal
+                    channel.sendall(data)
+                if channel in readable:
+                    data = channel.recv(SSH_SEND_CHUNK)
+                    if not data:
+                        break
+                    os.write(master, data)
+            channel.send_exit_status(process.wait(timeout=1) if process.poll() is None else process.returncode)
+        except Exception:
+            pass  # The client went away
+        finally:
+            if process.poll() is None:
+                process.kill()
+            os.close(master)
+            channel.close()
+
+
+def _send_filler(send, size: int, line: str) -> None:
+    """Send ``size`` bytes made of repeated ``line``."""
+    if size <= 0:
+        return
+    unit = line.encode() or b"x\n"
+    block = (unit * (SSH_SEND_CHUNK // len(unit) + 1))[:SSH_SEND_CHUNK]
+    sent = 0
+    while sent < size:
+        piece = block[:min(SSH_SEND_CHUNK, size - sent)]
+        send(piece)
+        sent += len(piece)
+
+
+class _ServerInterface(paramiko.ServerInterface):
+    def __init__(self, server: FakeSSHServer):
+        self.server = server
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL if password == self.server.password else paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED if kind == "session" else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        target = self.server._run_local if self.server.execute else self.server._run
+        threading.Thread(target=target, args=(channel, command.decode()), daemon=True).start()
+        return True
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return self.server.shell
+
+    def check_channel_shell_request(self, channel):
+        if not self.server.shell:
+            return False
+        threading.Thread(target=self.server._run_shell, args=(channel,), daemon=True).start()
+        return True
+
+
+class _LocalSFTPServer(paramiko.SFTPServerInterface):
+    """SFTP over a local directory; remote paths are resolved relative to ``root``."""
+
+    def __init__(self, server, root: str, *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.root = root
+
+    def _local(self, path: str) -> str:
+        return os.path.join(self.root, os.path.normpath("/" + path).lstrip("/"))
+
+    def canonicalize(self, path):
+        return os.path.normpath("/" + path)
+
+    def list_folder(self, path):
+        try:
+            local = self._local(path)
+            return [paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(local, name)), name)
+                    for name in os.listdir(local)]
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self._local(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        try:
+            fd = os.open(self._local(path), flags, 0o644)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        mode = "ab" if flags & os.O_APPEND else "r+b" if flags & (os.O_WRONLY | os.O_RDWR) else "rb"
+        handle = paramiko.SFTPHandle(flags)
+        handle.filename = self._local(path)
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+    def remove(self, path):
+        try:
+            os.remove(self._local(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        if os.path.exists(self._local(newpath)):
+            return paramiko.SFTP_FAILURE
+        return self.posix_rename(oldpath, newpath)
+
+    def posix_rename(self, oldpath, newpath):
+        try:
+            os.replace(self._local(oldpath), self._local(newpath))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def chattr(self, path, attr):
+        try:
+            paramiko.SFTPServer.set_file_attr(self._local(path), attr)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
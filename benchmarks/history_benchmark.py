@@ -0,0 +1,106 @@
+"""
+Latency of the history page queries on a large history, fully offline.
+
+``--rows`` history rows (questions over ``TOPICS`` with a unique suffix, and a
+command block as the response) are written through ``save_command_history`` into a
+temporary database, so the full-text index and the summary tables are maintained
+by the same triggers as in production. Each query the history page makes is then
+timed ``--repeat`` times next to the scan it replaces: a deep history page, a
+full-text search against ``LIKE``, and the summary tables against ``GROUP BY``
+over ``command_history``.
+
+Usage:
+    python benchmarks/history_benchmark.py [--rows 200000] [--repeat 20]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.load_benchmark import TOPICS, percentiles  # noqa: E402
+
+COMMANDS = ("df -h", "free -m", "ps aux --sort=-%cpu | head", "systemctl restart nginx",
+            "find /var/log -size +100M", "ss -tulpn", "uptime", "systemctl --failed")
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def run(args, workdir):
+    from Core import database
+
+    database.DB_PATH = os.path.join(workdir, "history.db")
+    database.init_db()
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    for i in range(args.rows):
+        topic = rng.randrange(len(TOPICS))
+        database.save_command_history(f"{TOPICS[topic]} on node-{i % 500}",
+                                      f"```bash\n{COMMANDS[topic]}\n```")
+        if i % 10 == 0:
+            database.record_cache_lookup("exact", rng.random() < 0.3)
+            database.record_command_run(COMMANDS[topic], rng.uniform(0.01, 2))
+    database.flush_history()
+    write_seconds = time.perf_counter() - start
+
+    deep_page = database.get_command_history(1, before_id=args.rows // 2)[0][0]
+    with database.get_pool().connection(write=False) as conn:
+        def like_search():
+            conn.execute("SELECT id, question, response, timestamp FROM command_history "
+                         "WHERE question LIKE ? OR response LIKE ? ORDER BY id DESC LIMIT ?",
+                         ("%restart the nginx%", "%restart the nginx%",
+                          database.DEFAULT_HISTORY_PAGE_SIZE)).fetchall()
+
+        def group_by_questions():
+            conn.execute("SELECT lower(trim(question)), count(*) FROM command_history "
+                         "GROUP BY lower(trim(question)) ORDER BY 2 DESC LIMIT 10").fetchall()
+
+        results = {
+            "write_rows_per_s": round(args.rows / write_seconds),
+            "page_first": timed(database.get_command_history, args.repeat),
+            "page_deep": timed(lambda: database.get_command_history(before_id=deep_page), args.repeat),
+            "search_fts": timed(lambda: database.search_command_history("restart nginx"), args.repeat),
+            "search_fts_rare": timed(lambda: database.search_command_history("node-499 large"), args.repeat),
+            "search_like": timed(like_search, args.repeat),
+            "frequent_questions": timed(database.get_frequent_questions, args.repeat),
+            "frequent_questions_group_by": timed(group_by_questions, args.repeat),
+            "cache_hit_rates": timed(database.get_cache_hit_rates, args.repeat),
+            "slowest_commands": timed(database.get_slowest_commands, args.repeat),
+        }
+    database.close_pool()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000, help="History rows written before measuring")
+    parser.add_argument("--repeat", type=int, default=20, help="Times each query is run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory() as workdir:
+        results = {"config": vars(args), **run(args, workdir)}
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
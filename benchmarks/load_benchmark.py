@@ -0,0 +1,288 @@
+"""
+Drives the real request path under scripted load, fully offline.
+
+A ``FakeOllamaServer`` and a ``FakeSSHServer`` (see ``benchmarks/fakes.py``) stand in
+for the model and the remote host. ``--sessions`` concurrent sessions each connect
+over SSH and ask ``--questions`` questions; every question goes through
+``ask_question_to_model`` (caches, streaming generation, history write) and
+``extract_and_execute_commands``, and each session pages through its history
+with ``get_command_history``. With ``--engine async`` the questions and commands
+go through the ``Core.engine`` sync facade instead. A share of the questions (``--repeat-ratio``) are
+repeats of popular questions, so the caches are exercised too.
+
+Throughput, latency percentiles per operation and per internal stage (from
+``Core.metrics``) are printed and, with ``--output``, saved as JSON. Pass a
+previous result as ``--baseline`` to print the change in p50/p95 latency. Before the
+load starts, ``check_shared_disconnect`` makes sure one session disconnecting does not
+break another session connected as the same user, and ``check_semantic_cache`` that a
+near-duplicate question about another path or host never reuses a stored command.
+
+Usage:
+    python benchmarks/load_benchmark.py [--sessions 8] [--questions 10] [--output results.json]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fakes import CannedCommand, FakeOllamaServer, FakeSSHServer  # noqa: E402
+
+TOPICS = (
+    "check disk usage", "show memory usage", "list the busiest processes", "restart the nginx service",
+    "find large log files", "show open network ports", "check system uptime", "inspect failed systemd units",
+)
+POPULAR_QUESTIONS = TOPICS[:4]
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {"count": 0}
+
+    def rank(q):
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    return {
+        "count": len(samples),
+        "mean_ms": round(1000 * sum(samples) / len(samples), 2),
+        "p50_ms": round(1000 * rank(0.50), 2),
+        "p95_ms": round(1000 * rank(0.95), 2),
+        "p99_ms": round(1000 * rank(0.99), 2),
+        "max_ms": round(1000 * samples[-1], 2),
+    }
+
+
+class Recorder:
+    """Thread-safe collection of per-operation latencies and errors."""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.commands = 0
+        self._lock = threading.Lock()
+
+    def timed(self, op, func, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            with self._lock:
+                self.errors[op] = self.errors.get(op, 0) + 1
+            print(f"{op} failed: {e}", file=sys.stderr)
+            return None
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.samples.setdefault(op, []).append(elapsed)
+
+
+def questions_for(session, count, repeat_ratio, seed):
+    rng = random.Random(seed * 1000003 + session)
+    questions = []
+    for i in range(count):
+        if rng.random() < repeat_ratio:
+            questions.append(rng.choice(POPULAR_QUESTIONS))
+        else:
+            questions.append(f"{rng.choice(TOPICS)} on node-{session}-{i}-{rng.getrandbits(32):08x}")
+    return questions
+
+
+def check_shared_disconnect(ssh_port, password):
+    from Core.func import connect_to_server, execute_ssh_command
+    from Core.ssh_pool import ssh_pool
+
+    first = connect_to_server("127.0.0.1", "shared", password, port=ssh_port)
+    second = connect_to_server("127.0.0.1", "shared", password, port=ssh_port)
+    first.close()
+    first.close()
+    result = execute_ssh_command(second, "uptime", refresh=True)
+    if result.get("exit_status") != 0:
+        raise AssertionError(f"Disconnecting one session broke the other: {result}")
+    second.close()
+    if ssh_pool.stats().get(second.key):
+        raise AssertionError("Transports stayed open after the last session disconnected")
+
+
+# (stored question, stored response, new question, hit expected)
+SEMANTIC_CASES = (
+    ("delete old logs in /var/log/app1", "```bash\nfind /var/log/app1 -name '*.log' -mtime +7 -delete\n```",
+     "delete old logs in /var/log/app2", False),
+    ("delete old logs in /var/log/app1", "```bash\nfind /var/log/app1 -name '*.log' -mtime +7 -delete\n```",
+     "Delete the old logs in /var/log/app1?", True),
+    ("restart the nginx service on the server", "```bash\nsudo systemctl restart nginx\n```",
+     "restart the apache service on the server", False),
+    ("show disk usage on web-01", "```bash\ndf -h\n```", "show disk usage on web-02", False),
+    ("show disk usage on web-01", "```bash\ndf -h\n```", "Disk usage on web-01: show?", True),
+)
+
+
+def check_semantic_cache():
+    from Core.semantic_cache import HashingEmbedder, SemanticCache
+
+    cache = SemanticCache(embedder=HashingEmbedder())
+    for case, (stored, response, question, expected) in enumerate(SEMANTIC_CASES):
+        prompt_version = f"check-{case}"  # One group per case, so earlier cases cannot answer
+        cache.add(stored, "check", prompt_version, response)
+        if (cache.lookup(question, "check", prompt_version) is not None) != expected:
+            raise AssertionError(f"Semantic cache {'missed' if expected else 'reused'} {stored!r} for {question!r}")
+
+
+def run_session(session, args, ollama_url, ssh_port, recorder, start_barrier):
+    from Core.func import connect_to_llm, connect_to_server
+    from Core.database import get_command_history
+    if args.engine == "async":
+        from Core.engine import ask_question_to_model, extract_and_execute_commands
+    else:
+        from Core.func import ask_question_to_model, extract_and_execute_commands
+
+    model = connect_to_llm(args.model, ollama_url)
+    ssh = recorder.timed("ssh_connect", connect_to_server, "127.0.0.1", f"bench{session}", args.password,
+                         port=ssh_port)
+    start_barrier.wait()
+    if ssh is None:
+        return
+    for question in questions_for(session, args.questions, args.repeat_ratio, args.seed):
+        start = time.perf_counter()
+        response = recorder.timed("ask_question", ask_question_to_model, model, question)
+        if response:
+            results = recorder.timed("execute_commands", extract_and_execute_commands, response, ssh,
+                                     max_concurrency=args.command_concurrency)
+            with recorder._lock:
+                recorder.commands += len(results or [])
+        recorder.timed("history_page", get_command_history)
+        with recorder._lock:
+            recorder.samples.setdefault("question_end_to_end", []).append(time.perf_counter() - start)
+
+
+def stage_summary():
+    from Core.metrics import metrics
+
+    stages = {}
+    for name, series in metrics.histogram_summaries().items():
+        for labels, summary in series.items():
+            label = name.split("_", 2)[-1].rsplit("_seconds", 1)[0]
+            if labels:
+                label += "[" + ",".join(f"{k}={v}" for k, v in labels) + "]"
+            stages[label] = {
+                "count": int(summary["count"]),
+                "p50_ms": round(1000 * summary["p50"], 2),
+                "p95_ms": round(1000 * summary["p95"], 2),
+            }
+    counters = {}
+    for name, series in metrics.counter_values().items():
+        for labels, value in series.items():
+            label = name.split("_", 2)[-1].rsplit("_total", 1)[0]
+            if labels:
+                label += "[" + ",".join(f"{k}={v}" for k, v in labels) + "]"
+            counters[label] = value
+    return stages, counters
+
+
+def run(args):
+    from Core.database import flush_history
+
+    ollama = FakeOllamaServer(first_token_latency=args.first_token_latency, tokens_per_second=args.token_rate,
+                              models=[args.model]).start()
+    ssh_server = FakeSSHServer(password=args.password,
+                               default=CannedCommand(output_bytes=args.output_bytes, delay=args.command_delay)).start()
+    check_shared_disconnect(ssh_server.port, args.password)
+    check_semantic_cache()
+    recorder = Recorder()
+    start_barrier = threading.Barrier(args.sessions + 1)
+    try:
+        with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+            futures = [executor.submit(run_session, i, args, ollama.url, ssh_server.port, recorder, start_barrier)
+                       for i in range(args.sessions)]
+            start_barrier.wait()
+            start = time.perf_counter()
+            for future in futures:
+                future.result()
+            recorder.timed("history_flush", flush_history)
+            wall = time.perf_counter() - start
+    finally:
+        ollama.stop()
+        ssh_server.stop()
+
+    stages, counters = stage_summary()
+    answered = len(recorder.samples.get("question_end_to_end", []))
+    return {
+        "config": vars(args),
+        "wall_s": round(wall, 3),
+        "questions": answered,
+        "commands": recorder.commands,
+        "throughput_qps": round(answered / wall, 2) if wall else 0.0,
+        "commands_per_s": round(recorder.commands / wall, 2) if wall else 0.0,
+        "errors": recorder.errors,
+        "latency": {op: percentiles(samples) for op, samples in sorted(recorder.samples.items())},
+        "stages": stages,
+        "counters": counters,
+        "stand_ins": {"ollama_requests": ollama.requests, "ssh_connections": ssh_server.connections,
+                      "ssh_commands": ssh_server.executed},
+    }
+
+
+def compare(results, baseline):
+    """Print the relative change of p50/p95 per operation against a previous run."""
+    print(f"throughput: {baseline.get('throughput_qps')} -> {results['throughput_qps']} questions/s")
+    for op, current in results["latency"].items():
+        previous = baseline.get("latency", {}).get(op)
+        if not previous or not previous.get("count"):
+            continue
+        changes = []
+        for key in ("p50_ms", "p95_ms"):
+            before, after = previous[key], current[key]
+            delta = f"{100 * (after - before) / before:+.1f}%" if before else "n/a"
+            changes.append(f"{key} {before} -> {after} ({delta})")
+        print(f"{op}: " + ", ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=8, help="Concurrent sessions")
+    parser.add_argument("--questions", type=int, default=10, help="Questions asked per session")
+    parser.add_argument("--repeat-ratio", type=float, default=0.3, help="Share of questions that repeat popular ones")
+    parser.add_argument("--first-token-latency", type=float, default=0.2, help="Seconds before the fake model answers")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="Tokens per second streamed by the fake model")
+    parser.add_argument("--command-delay", type=float, default=0.05, help="Seconds each fake SSH command takes")
+    parser.add_argument("--output-bytes", type=int, default=4096, help="Output bytes per fake SSH command")
+    parser.add_argument("--command-concurrency", type=int, default=4, help="max_concurrency for command batches")
+    parser.add_argument("--engine", choices=("threads", "async"), default="threads",
+                        help="Run requests on the calling threads or through the shared asyncio engine")
+    parser.add_argument("--model", default="llama3.2")
+    parser.add_argument("--password", default="benchmark")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    parser.add_argument("--baseline", help="Earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)  # Per-command INFO logs would dominate the measurement
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)  # Keep the benchmark's SQLite files out of the repository
+        results = run(args)
+        os.chdir(ROOT)
+
+    print(json.dumps(results, indent=2))
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+    if baseline:
+        compare(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
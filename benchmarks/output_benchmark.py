@@ -0,0 +1,120 @@
+"""
+Memory held for command results by many Streamlit sessions, with and without the bounded result store, fully offline.
+
+Each of ``--sessions`` simulated sessions submits ``--runs`` questions whose
+``--commands`` commands each print ``--output-kb`` KB of log-like lines. Results are
+kept two ways: as plain result dicts in a list per session, and in one
+``SessionOutputs`` per session. The Python heap (``tracemalloc``), the bytes in
+spill files, the bytes rendered per result (whole output vs. preview) and the
+latency of reading a random page of a spilled output are reported.
+
+Usage:
+    python benchmarks/output_benchmark.py [--sessions 10] [--runs 10] [--output-kb 512]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.load_benchmark import percentiles  # noqa: E402
+
+LINE = "2024-01-01T00:00:00 host kernel: [{n:>8}] eth0: link up, 1000 Mbps, full duplex\n"
+
+
+def make_output(size_kb, salt):
+    lines = []
+    total = 0
+    while total < size_kb * 1024:
+        line = LINE.format(n=f"{salt}.{len(lines)}")
+        lines.append(line)
+        total += len(line)
+    return "".join(lines)
+
+
+def fill(args, keep):
+    """Run every session's questions through ``keep(session, question, results)``; return heap bytes held."""
+    tracemalloc.start()
+    sessions = []
+    for s in range(args.sessions):
+        session = keep(None, None, None)
+        for r in range(args.runs):
+            results = [{"output": make_output(args.output_kb, f"{s}.{r}.{c}"), "error": "", "exit_status": 0}
+                       for c in range(args.commands)]
+            keep(session, f"question {r}", results)
+        sessions.append(session)
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return sessions, held
+
+
+def run(args):
+    from Core.output_store import SessionOutputs, DEFAULT_PAGE_LINES
+
+    def keep_plain(session, question, results):
+        if session is None:
+            return []
+        session.append({"question": question, "results": results})
+
+    def keep_bounded(session, question, results):
+        if session is None:
+            return SessionOutputs()
+        current = session.new_run(question)
+        for result in results:
+            session.keep(current, result)
+
+    plain, plain_heap = fill(args, keep_plain)
+    plain_rendered = sum(len(r["output"].encode()) for run in plain[0] for r in run["results"]) / (args.runs * args.commands)
+    del plain
+
+    bounded, bounded_heap = fill(args, keep_bounded)
+    outputs = [r["output"] for run in bounded[0].runs for r in run["results"]]
+    bounded_rendered = sum(len(o.preview().encode()) for o in outputs) / len(outputs)
+    spilled = max(outputs, key=lambda o: o.size)
+    pages = spilled.page_count(DEFAULT_PAGE_LINES)
+    samples = []
+    for _ in range(args.pages):
+        start = time.perf_counter()
+        spilled.page(random.randrange(pages), DEFAULT_PAGE_LINES)
+        samples.append(time.perf_counter() - start)
+    result = {
+        "config": vars(args),
+        "plain": {"heap_mb": round(plain_heap / 1e6, 1), "runs_kept_per_session": args.runs,
+                  "rendered_kb_per_result": round(plain_rendered / 1e3, 1)},
+        "bounded": {"heap_mb": round(bounded_heap / 1e6, 1), "runs_kept_per_session": len(bounded[0].runs),
+                    "disk_mb": round(sum(s.disk_bytes() for s in bounded) / 1e6, 1),
+                    "rendered_kb_per_result": round(bounded_rendered / 1e3, 1)},
+        "page_read": percentiles(samples),
+    }
+    for session in bounded:
+        session.clear()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=10, help="Simulated Streamlit sessions")
+    parser.add_argument("--runs", type=int, default=10, help="Questions submitted per session")
+    parser.add_argument("--commands", type=int, default=2, help="Commands per question")
+    parser.add_argument("--output-kb", type=int, default=512, help="Output size per command")
+    parser.add_argument("--pages", type=int, default=200, help="Random page reads timed")
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    results = run(args)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Micro-benchmark of command extraction and the command safety filter on large model outputs.
+
+Synthetic responses mixing prose, several fenced blocks, heredocs, line continuations,
+loops and comments are generated at each ``--sizes`` value (KB). For each size it times
+``extract_commands`` followed by ``command_filter.match`` on every command, and the
+previous regex pipeline (fence ``findall``, per-line ``re.sub`` of ``$``/``#``, one
+``rm -rf /`` regex per command) for comparison. Throughput should stay flat as the
+size grows; a drop would point at super-linear behaviour. Before timing, the filter is
+checked against ``FILTER_CASES`` and ``ALLOW_CASES`` and the command planner against ``PLANNER_CASES`` and
+``BATCH_CASES``.
+
+Usage:
+    python benchmarks/parser_benchmark.py [--sizes 10 100 1000 10000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from Core.func import extract_commands  # noqa: E402
+from Core.planner import is_read_only_command, plan_command_batches  # noqa: E402
+from Core.safety import CommandFilter, command_filter  # noqa: E402
+
+SAMPLE_BLOCKS = (
+    "df -h\nfree -m\nuptime",
+    "export LOG_DIR=/var/log/$APP_NAME\nls -la \"$LOG_DIR\" # newest first\ndu -sh \"$LOG_DIR\"",
+    "cat <<'EOF' > /etc/motd\nWelcome to $HOSTNAME\n# not a comment inside a heredoc\nEOF",
+    "for f in /var/log/*.log; do\n  echo \"$f: $(wc -l < \"$f\")\"\ndone",
+    "ps aux --sort=-%cpu |\n  head -n 10 |\n  awk '{print $2, $11}'",
+    "docker run --rm \\\n  -v /srv/data:/data \\\n  -e TOKEN=$TOKEN \\\n  alpine:3 ls /data",
+    "if systemctl is-active --quiet nginx; then\n  systemctl reload nginx\nelse\n  systemctl start nginx\nfi",
+    "rm -rf /tmp/build-cache\nfind /var/tmp -name '*.tmp' -mtime +7 -delete",
+)
+PROSE = "Here is how you can do this on the server. The commands below are safe to run.\n"
+# command -> whether the default rules must block it.
+FILTER_CASES = {
+    "rm -rf /": True,
+    'rm -rf "/"': True,
+    "rm -rf '/etc'": True,
+    "rm -f /etc/passwd": True,
+    "rm -r /var/log/app": True,
+    "sudo rm -fr /": True,
+    "/bin/rm -Rf /usr": True,
+    "rm -v --force /srv/data": True,
+    "rm --recursive /home": True,
+    "rm -i -r -- /opt": True,
+    "rm /etc/motd -f": True,
+    "echo done; rm -rf /": True,
+    "farm -rf /": False,
+    "confirm -rf /": False,
+    "rm -rf build/": False,
+    "rm -rf ./dist": False,
+    "rm notes.txt": False,
+    "rm -i /tmp/file": False,
+    "rm -f build.log; ls /etc": False,
+}
+# command -> whether the default rules plus ALLOW_RULES must block it.
+ALLOW_RULES = {"scratch": r"rm -rf /tmp/scratch"}
+ALLOW_CASES = {
+    "rm -rf /tmp/scratch": False,
+    "ls /tmp; rm -rf /tmp/scratch": False,
+    "rm -rf /tmp/scratch; rm -rf /": True,
+    "rm -rf /tmp/scratch && rm -rf /etc": True,
+    "rm -rf /tmp/scratch || rm -rf /": True,
+    "rm -rf /tmp/scratch | rm -rf /home": True,
+    "rm -rf /tmp/scratch/../../etc": True,
+    "sudo rm -rf /tmp/scratch": True,
+}
+# command -> whether the planner may treat it as read-only.
+PLANNER_CASES = {
+    "hostname web02": False,
+    "hostnamectl set-hostname web02": False,
+    "mount /dev/sdb1 /mnt": False,
+    "crontab /tmp/jobs": False,
+    "crontab": False,
+    "route add default gw 10.0.0.1": False,
+    "ifconfig eth0 down": False,
+    "arp -d 10.0.0.2": False,
+    "sysctl vm.swappiness=10": False,
+    "sysctl -w vm.swappiness=10": False,
+    "timedatectl set-timezone UTC": False,
+    "dmesg -C": False,
+    "journalctl --vacuum-time=1d": False,
+    "systemctl try-restart nginx": False,
+    "sort -o out in": False,
+    "uniq in out": False,
+    "date 010100002030": False,
+    "ip link set eth0 down": False,
+    "rpm -i pkg.rpm": False,
+    "env rm -rf build": False,
+    "timeout 5 rm -rf build": False,
+    "find . | xargs sed -i s/a/b/": False,
+    "echo web02 | xargs hostname": False,
+    "find /var/tmp -name '*.tmp' -delete": False,
+    "awk '{print > \"/tmp/out\"}' data": False,
+    "hostname": True,
+    "hostname -I": True,
+    "hostnamectl status": True,
+    "mount": True,
+    "crontab -l": True,
+    "route -n": True,
+    "ifconfig eth0": True,
+    "arp -an": True,
+    "sysctl vm.swappiness": True,
+    "timedatectl": True,
+    "date +%s": True,
+    "dmesg -T": True,
+    "journalctl -u nginx -n 50 --no-pager": True,
+    "systemctl status nginx": True,
+    "ip -br addr show": True,
+    "rpm -qa": True,
+    "ps aux | sort -rn -k3 | head": True,
+    "env LANG=C ls -la": True,
+    "find . -name '*.log' | xargs grep -l error": True,
+    "ss -tulpn": True,
+}
+# commands -> the batches the planner must split them into.
+BATCH_CASES = (
+    (("df -h", "hostname web02", "hostname", "mount /dev/sdb1 /mnt", "ls /mnt"), [[0], [1], [2], [3], [4]]),
+    (("df -h", "free -m", "uptime", "systemctl restart nginx", "systemctl status nginx"), [[0, 1, 2], [3], [4]]),
+)
+
+
+def build_response(size_bytes):
+    parts, total, i = [], 0, 0
+    while total < size_bytes:
+        part = f"{PROSE}```bash\n{SAMPLE_BLOCKS[i % len(SAMPLE_BLOCKS)]}\n```\n"
+        parts.append(part)
+        total += len(part)
+        i += 1
+    return "".join(parts)
+
+
+def legacy_pipeline(response):
+    # The extraction and safety check as they were before the single-pass parser.
+    re.findall(r"```bash\n(.*?)\n```", response, re.DOTALL)
+    blocks = re.findall(r"```(?:bash)?\n(.*?)```", response, re.DOTALL)
+    commands = []
+    for block in blocks:
+        for command in block.strip().split("\n"):
+            if command:
+                clean_command = re.sub(r"[$#]", "", command).strip()
+                if clean_command:
+                    commands.append(clean_command)
+    blocked = [command for command in commands if re.search(r"rm\s+-[rf]\s+/", command)]
+    return commands, blocked
+
+
+def current_pipeline(response):
+    commands = extract_commands(response)
+    blocked = [command for command in commands if command_filter.match(command)]
+    return commands, blocked
+
+
+def check_filter():
+    wrong = {command: expected for command, expected in FILTER_CASES.items()
+             if bool(command_filter.match(command)) != expected}
+    allowing = CommandFilter(allow=ALLOW_RULES)
+    wrong.update({command: expected for command, expected in ALLOW_CASES.items()
+                  if bool(allowing.match(command)) != expected})
+    if wrong:
+        raise AssertionError(f"Command filter got these wrong (expected blocked?): {wrong}")
+
+
+def check_planner():
+    wrong = {command: expected for command, expected in PLANNER_CASES.items()
+             if is_read_only_command(command) != expected}
+    if wrong:
+        raise AssertionError(f"Planner got these wrong (expected read-only?): {wrong}")
+    for commands, expected in BATCH_CASES:
+        batches = plan_command_batches(list(commands))
+        if batches != expected:
+            raise AssertionError(f"Planner split {commands} into {batches}, expected {expected}")
+
+
+def best_time(func, response, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(response)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000], help="Response sizes in KB")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement; the best is reported")
+    args = parser.parse_args()
+
+    check_filter()
+    check_planner()
+    results = []
+    for size_kb in args.sizes:
+        response = build_response(size_kb * 1024)
+        row = {"size_kb": size_kb}
+        for name, func in (("current", current_pipeline), ("legacy", legacy_pipeline)):
+            seconds, (commands, blocked) = best_time(func, response, args.repeat)
+            row[name] = {
+                "ms": round(1000 * seconds, 2),
+                "mb_per_s": round(len(response) / seconds / 1e6, 1),
+                "commands": len(commands),
+                "blocked": len(blocked),
+            }
+        results.append(row)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Latency of generations spread over several Ollama servers by ``LLMRouter``, fully offline.
+
+Three ``FakeOllamaServer`` backends stand in for an Ollama fleet: a healthy one, one
+that takes ``--slow-latency`` seconds to its first token and one that is down.
+``--requests`` prompts are sent from ``--concurrency`` threads three ways: straight
+to the slow server (a single ``OllamaLLM``, as with one configured URL), through the
+router, and through the router with hedging after ``--hedge-after`` seconds.
+Latency percentiles and the failover and hedge counters are printed.
+
+Usage:
+    python benchmarks/router_benchmark.py [--requests 200] [--concurrency 8]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fakes import DEFAULT_MODEL_NAME, FakeOllamaServer  # noqa: E402
+from benchmarks.load_benchmark import TOPICS, percentiles  # noqa: E402
+
+
+def timed_requests(model, args):
+    def one(i):
+        start = time.perf_counter()
+        model.invoke(f"Answer the question.\n{TOPICS[i % len(TOPICS)]} #{i}")
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        samples = list(executor.map(one, range(args.requests)))
+    return {"total_s": round(time.perf_counter() - start, 3), **percentiles(samples)}
+
+
+def llm_counters():
+    from Core.metrics import metrics
+
+    counters = {}
+    for name, series in metrics.counter_values().items():
+        if "_llm_" in name:
+            counters[name.split("_", 2)[-1]] = sum(series.values())
+    return counters
+
+
+def run(args):
+    from langchain_ollama import OllamaLLM
+    from Core.llm_router import LLMRouter
+    from Core.metrics import metrics
+
+    fast = FakeOllamaServer(first_token_latency=args.latency, tokens_per_second=0).start()
+    slow = FakeOllamaServer(first_token_latency=args.slow_latency, tokens_per_second=0).start()
+    down = FakeOllamaServer().start()
+    down_url = down.url
+    down.stop()
+    urls = [down_url, slow.url, fast.url]
+    try:
+        results = {"single_slow_server": timed_requests(OllamaLLM(model=DEFAULT_MODEL_NAME, base_url=slow.url), args)}
+        metrics.reset()
+        results["router"] = {**timed_requests(LLMRouter(DEFAULT_MODEL_NAME, urls), args), **llm_counters()}
+        metrics.reset()
+        hedged = LLMRouter(DEFAULT_MODEL_NAME, urls, hedge_after=args.hedge_after)
+        results["router_hedged"] = {**timed_requests(hedged, args), **llm_counters()}
+        results["requests_per_backend"] = {"fast": fast.requests["generate"], "slow": slow.requests["generate"]}
+    finally:
+        fast.stop()
+        slow.stop()
+    return {"config": vars(args), **results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="Generations per configuration")
+    parser.add_argument("--concurrency", type=int, default=8, help="Threads sending requests at once")
+    parser.add_argument("--latency", type=float, default=0.05, help="First-token latency of the healthy server")
+    parser.add_argument("--slow-latency", type=float, default=0.5, help="First-token latency of the slow server")
+    parser.add_argument("--hedge-after", type=float, default=0.1, help="Hedging threshold in seconds")
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    results = run(args)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
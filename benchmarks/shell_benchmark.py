@@ -0,0 +1,117 @@
+"""
+Per-command overhead of one exec channel per command versus a persistent shell session.
+
+A ``FakeSSHServer`` with ``shell=True`` answers exec requests with canned output
+after ``--exec-delay`` seconds (standing in for the shell a real server starts for
+every exec request) and interactive shell requests with a local ``/bin/sh`` on a PTY.
+The same ``--commands`` short commands are run through ``execute_ssh_command`` and
+through one ``ShellSession``; total time and per-command percentiles are printed.
+Before timing, ``CACHE_CASES`` check that the command result cache serves read-only
+forms and lets mutating ones through to the server, dropping the host's cached results.
+
+Usage:
+    python benchmarks/shell_benchmark.py [--commands 200] [--exec-delay 0.005]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fakes import CannedCommand, FakeSSHServer  # noqa: E402
+from benchmarks.load_benchmark import percentiles  # noqa: E402
+
+# Commands run in this order -> whether each run must reach the server. Mutating forms
+# are never served from the cache and drop the host's cached results.
+CACHE_CASES = (
+    ("hostname", True),
+    ("hostname", False),
+    ("hostname web02", True),
+    ("hostname web02", True),
+    ("hostname", True),
+    ("mount", True),
+    ("mount", False),
+    ("mount /dev/sdb1 /mnt", True),
+    ("mount", True),
+    ("crontab -l", True),
+    ("crontab -l", False),
+    ("crontab /tmp/jobs", True),
+    ("crontab -l", True),
+)
+
+
+def timed_commands(run, commands):
+    samples = []
+    start = time.perf_counter()
+    for command in commands:
+        began = time.perf_counter()
+        run(command)
+        samples.append(time.perf_counter() - began)
+    return {"total_s": round(time.perf_counter() - start, 3), **percentiles(samples)}
+
+
+def check_result_cache(ssh, server):
+    from Core.func import execute_ssh_command
+    from Core.result_cache import result_cache
+
+    result_cache.invalidate()
+    for command, reaches_server in CACHE_CASES:
+        before = server.executed
+        execute_ssh_command(ssh, command)
+        if (server.executed > before) != reaches_server:
+            raise AssertionError(f"Result cache {'served' if reaches_server else 'missed'} {command!r}")
+    result_cache.invalidate()
+
+
+def run(args):
+    from Core.func import connect_to_server, execute_ssh_command
+    from Core.result_cache import result_cache
+    from Core.shell_session import ShellSession
+
+    commands = [f"echo step-{i}" for i in range(args.commands)]
+    server = FakeSSHServer(password=args.password, shell=True,
+                           default=CannedCommand(output_bytes=16, delay=args.exec_delay)).start()
+    try:
+        ssh = connect_to_server("127.0.0.1", "bench", args.password, port=server.port)
+        check_result_cache(ssh, server)
+        results = {"exec_per_command": timed_commands(
+            lambda command: execute_ssh_command(ssh, command, refresh=True), commands)}
+        result_cache.invalidate()
+        started = time.perf_counter()
+        with ShellSession(ssh) as shell:
+            results["shell_start_s"] = round(time.perf_counter() - started, 3)
+            results["persistent_shell"] = timed_commands(shell.run, commands)
+    finally:
+        server.stop()
+    return {"config": vars(args), **results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--commands", type=int, default=200, help="Commands run each way")
+    parser.add_argument("--exec-delay", type=float, default=0.005,
+                        help="Seconds the fake server takes per exec request (remote shell start-up)")
+    parser.add_argument("--password", default="benchmark")
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    output = os.path.abspath(args.output) if args.output else None
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)  # The local shell and any SQLite files stay out of the repository
+        results = run(args)
+        os.chdir(ROOT)
+
+    print(json.dumps(results, indent=2))
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Measures cold-start and per-rerun cost of the Streamlit app.
+
+Cold start is the time to import ``Core.func`` and ``main`` in a fresh interpreter.
+Per-rerun cost drives ``main.py`` through Streamlit's ``AppTest`` with an Ollama URL
+pointing at a local stand-in that answers ``/api/tags`` after ``--tags-latency``
+seconds, then times repeated reruns.
+
+Usage:
+    python benchmarks/startup_benchmark.py [--runs 5] [--reruns 20] [--tags-latency 0.05]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def cold_import(module, runs):
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    samples = []
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        for _ in range(runs):
+            out = subprocess.run([sys.executable, "-c", code], cwd=workdir, env=env,
+                                 capture_output=True, text=True, check=True).stdout
+            samples.append(float(out.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+
+def serve_tags(latency):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            body = json.dumps({"models": [{"name": "llama3.2"}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def rerun_cost(reruns, latency):
+    from streamlit.testing.v1 import AppTest
+
+    server = serve_tags(latency)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    at = AppTest.from_file(os.path.join(ROOT, "main.py"), default_timeout=120)
+    start = time.perf_counter()
+    at.run()
+    first = time.perf_counter() - start
+    at.sidebar.text_input[0].input(url).run()
+    samples = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        at.run()
+        samples.append(time.perf_counter() - start)
+    server.shutdown()
+    samples.sort()
+    return {
+        "first_run_s": round(first, 4),
+        "rerun_median_s": round(statistics.median(samples), 4),
+        "rerun_p95_s": round(samples[int(0.95 * (len(samples) - 1))], 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per cold-import measurement")
+    parser.add_argument("--reruns", type=int, default=20, help="Timed Streamlit reruns")
+    parser.add_argument("--tags-latency", type=float, default=0.05, help="Seconds the fake /api/tags waits")
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    results = {
+        "import_core_func_s": round(cold_import("Core.func", args.runs), 4),
+        "import_main_s": round(cold_import("main", args.runs), 4),
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)  # Keep the benchmark's SQLite files out of the repository
+        results.update(rerun_cost(args.reruns, args.tags_latency))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Cost of answering host health questions from telemetry samples versus one-off commands, fully offline.
+
+A ``FakeSSHServer`` with ``execute=True`` runs commands with the local ``/bin/sh``, so
+``/proc`` of this machine stands in for the remote host. A ``HostTelemetry``
+sampler collects for ``--warmup`` seconds at ``--interval``; then ``--questions``
+health questions are answered from its samples with ``answer_health_question`` and,
+for comparison, by running the commands the model would typically suggest through
+``execute_ssh_command`` (before any model latency). The size of the in-memory ring
+and of the persisted chunks is reported too.
+
+Usage:
+    python benchmarks/telemetry_benchmark.py [--questions 50] [--interval 1]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fakes import FakeSSHServer  # noqa: E402
+from benchmarks.load_benchmark import percentiles  # noqa: E402
+
+QUESTIONS = ("What is the CPU doing?", "How much memory is free?", "Check disk usage", "Is the server healthy?")
+# What the model usually answers with for the questions above.
+COMMANDS = {
+    QUESTIONS[0]: ["top -bn1 | head -n 5", "cat /proc/loadavg"],
+    QUESTIONS[1]: ["free -m"],
+    QUESTIONS[2]: ["df -h"],
+    QUESTIONS[3]: ["uptime", "free -m", "df -h"],
+}
+
+
+def run(args):
+    from Core import database
+    from Core.func import connect_to_server, execute_ssh_command
+    from Core.telemetry import HostTelemetry, answer_health_question
+
+    database.DB_PATH = os.path.join(os.getcwd(), "telemetry.db")
+    server = FakeSSHServer(password=args.password, execute=True, sftp_root="/").start()
+    try:
+        ssh = connect_to_server("127.0.0.1", "bench", args.password, port=server.port)
+        host = HostTelemetry(ssh, f"127.0.0.1:{server.port}", interval=args.interval)
+        host.start()
+        time.sleep(args.warmup)
+        executed_before = server.executed
+
+        telemetry_samples, command_samples = [], []
+        for i in range(args.questions):
+            question = QUESTIONS[i % len(QUESTIONS)]
+            start = time.perf_counter()
+            answer = answer_health_question(question, host)
+            telemetry_samples.append(time.perf_counter() - start)
+            if answer is None:
+                raise RuntimeError(f"No telemetry answer for {question!r}")
+            start = time.perf_counter()
+            for command in COMMANDS[question]:
+                execute_ssh_command(ssh, command, refresh=True)
+            command_samples.append(time.perf_counter() - start)
+        host.stop()
+        time.sleep(args.interval + 0.5)
+        database.flush_history()
+        chunks = database.load_telemetry_chunks(host.key)
+    finally:
+        server.stop()
+    return {
+        "config": vars(args),
+        "telemetry_answer": percentiles(telemetry_samples),
+        "one_off_commands": percentiles(command_samples),
+        "samples": host.samples,
+        "ring_bytes": host.ring.timestamps.nbytes + host.ring.values.nbytes,
+        "persisted_bytes_per_sample": round(sum(len(t) + len(s) for _, t, s in chunks) / max(1, host.samples), 1),
+        # The sampler's command runs from warm-up on; every one-off command is another exec.
+        "exec_requests_for_commands": server.executed - executed_before,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=50, help="Health questions answered each way")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between telemetry samples")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Seconds of sampling before the questions")
+    parser.add_argument("--password", default="benchmark")
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    output = os.path.abspath(args.output) if args.output else None
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)  # The SQLite files stay out of the repository
+        results = run(args)
+        os.chdir(ROOT)
+
+    print(json.dumps(results, indent=2))
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
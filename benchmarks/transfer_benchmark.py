@@ -0,0 +1,153 @@
+"""
+Throughput of SFTP uploads and downloads through ``Core.transfer``, fully offline.
+
+A ``FakeSSHServer`` serves a temporary directory over SFTP and runs exec requests
+(used by compressed transfers) with the local ``/bin/sh``. A ``--size`` MB file of
+compressible text is downloaded and uploaded plain, compressed and, for downloads,
+split into segments over parallel channels; ``--files`` copies are also fetched at
+once with ``transfer_files``. Each run is checked byte for byte. Before timing,
+``check_duplicate_destinations`` makes sure two remote files with the same name are
+not downloaded into one directory at once.
+
+Usage:
+    python benchmarks/transfer_benchmark.py [--size 64] [--files 8]
+"""
+import argparse
+import filecmp
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fakes import FakeSSHServer  # noqa: E402
+
+
+def make_file(path, size_mb):
+    line = b"2024-01-01T00:00:00Z host app[1234]: request served in 12ms status=200 path=/api/v1/items\n"
+    with open(path, "wb") as f:
+        for _ in range(size_mb * 1024 * 1024 // len(line)):
+            f.write(line)
+
+
+def measure(label, func, expected, actual):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    results = result if isinstance(result, list) else [result]
+    errors = [r["error"] for r in results if r["error"]]
+    total = sum(r["bytes"] for r in results)
+    return {
+        "label": label,
+        "seconds": round(elapsed, 3),
+        "mb_per_s": round(total / elapsed / 1e6, 1) if elapsed else 0.0,
+        "identical": not errors and all(filecmp.cmp(expected, path, shallow=False) for path in actual),
+        "errors": errors,
+    }
+
+
+def check_duplicate_destinations(ssh, remote, local):
+    from Core.exceptions import FileTransferError
+    from Core.transfer import transfer_files
+
+    sources = []
+    for app in ("app1", "app2"):
+        os.makedirs(os.path.join(remote, app))
+        sources.append(os.path.join(remote, app, "error.log"))
+        with open(sources[-1], "w") as f:
+            f.write(f"{app}\n")
+    target = os.path.join(local, "duplicates")
+    os.makedirs(target)
+    try:
+        transfer_files(ssh, [{"direction": "download", "source": s, "destination": target} for s in sources])
+    except FileTransferError:
+        pass
+    else:
+        raise AssertionError("Downloads with the same destination file were started")
+    if os.listdir(target):
+        raise AssertionError(f"Rejected downloads wrote {os.listdir(target)}")
+    results = transfer_files(ssh, [{"direction": "download", "source": s,
+                                    "destination": os.path.join(target, f"{i}-error.log")}
+                                   for i, s in enumerate(sources)])
+    for result, source in zip(results, sources):
+        if result["error"] or not filecmp.cmp(source, result["destination"], shallow=False):
+            raise AssertionError(f"Download of {source} to a unique name failed: {result}")
+
+
+def run(args, workdir):
+    from Core import transfer
+    from Core.func import connect_to_server
+
+    remote = os.path.join(workdir, "remote")
+    local = os.path.join(workdir, "local")
+    os.makedirs(remote)
+    os.makedirs(local)
+    source = os.path.join(remote, "source.log")
+    make_file(source, args.size)
+    # A segment size that splits the file into --segments parts regardless of --size.
+    segment_size = max(1, os.path.getsize(source) // args.segments)
+
+    server = FakeSSHServer(password=args.password, execute=True, sftp_root="/").start()
+    try:
+        ssh = connect_to_server("127.0.0.1", "bench", args.password, port=server.port)
+        check_duplicate_destinations(ssh, remote, local)
+        fresh = lambda name: os.path.join(local, name)  # noqa: E731
+        runs = [
+            measure("download", lambda: transfer.download_file(ssh, source, fresh("plain.log"), max_workers=1),
+                    source, [fresh("plain.log")]),
+            measure("download compressed",
+                    lambda: transfer.download_file(ssh, source, fresh("gzip.log"), compress=True),
+                    source, [fresh("gzip.log")]),
+        ]
+        default_segment = transfer.DEFAULT_SEGMENT_SIZE
+        transfer.DEFAULT_SEGMENT_SIZE = segment_size
+        try:
+            runs.append(measure(f"download {args.segments} segments",
+                                lambda: transfer.download_file(ssh, source, fresh("segments.log"),
+                                                               max_workers=args.segments),
+                                source, [fresh("segments.log")]))
+        finally:
+            transfer.DEFAULT_SEGMENT_SIZE = default_segment
+        runs += [
+            measure("upload", lambda: transfer.upload_file(ssh, fresh("plain.log"), os.path.join(remote, "up.log")),
+                    source, [os.path.join(remote, "up.log")]),
+            measure("upload compressed",
+                    lambda: transfer.upload_file(ssh, fresh("plain.log"), os.path.join(remote, "upgz.log"),
+                                                 compress=True),
+                    source, [os.path.join(remote, "upgz.log")]),
+            measure(f"{args.files} files in parallel",
+                    lambda: transfer.transfer_files(ssh, [{"direction": "download", "source": source,
+                                                           "destination": fresh(f"copy{i}.log")}
+                                                          for i in range(args.files)]),
+                    source, [fresh(f"copy{i}.log") for i in range(args.files)]),
+        ]
+    finally:
+        server.stop()
+    return {"config": vars(args), "runs": runs}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=64, help="Size of the test file in MB")
+    parser.add_argument("--segments", type=int, default=4, help="Parallel segments for the segmented download")
+    parser.add_argument("--files", type=int, default=8, help="Files fetched at once with transfer_files")
+    parser.add_argument("--password", default="benchmark")
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory() as workdir:
+        results = run(args, workdir)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,372 @@
+import math
+import os
+import posixpath
+import time
+from collections import deque
+from datetime import datetime
 import streamlit as st
 import requests
 from Core.func import *
-from Core.database import get_command_history
+import Core.engine as engine
+from Core.metrics import metrics, span, trace, start_metrics_server
+from Core.result_cache import result_cache
+from Core.llm_router import backend_status, parse_ollama_urls
+from Core.telemetry import telemetry, answer_health_question, FIELDS, DEFAULT_SAMPLE_INTERVAL
+from Core.shell_session import ShellSession
+from Core.output_store import SessionOutputs, preview_results, DEFAULT_PAGE_LINES, DEFAULT_PREVIEW_BYTES, DEFAULT_PREVIEW_LINES
+from Core.transfer import transfer_files, duplicate_destinations, DEFAULT_TRANSFER_WORKERS
+from Core.database import search_command_history, get_frequent_questions, get_cache_hit_rates, get_slowest_commands
+from Core.exceptions import InvalidHostListError
+from Core.fleet import parse_host_list, iter_fleet_results, summarize_fleet, DEFAULT_FLEET_WORKERS, DEFAULT_HOST_TIMEOUT
+
+LIVE_OUTPUT_LINES = 200  # Lines kept in the live output pane
+MODEL_LIST_TTL = 60  # Seconds the Ollama model list is reused across reruns
+IP_LOOKUP_TTL = 3600  # Seconds the local/public IP lookups are reused
+LLM_CLIENT_TTL = 3600  # Seconds an OllamaLLM client is reused per (model, URL)
+OLLAMA_REQUEST_TIMEOUT = 5  # Seconds before /api/tags is given up on
+METRICS_PORT_ENV = "DEVOPS_ASSISTANT_METRICS_PORT"  # Set to expose /metrics for Prometheus
+HEDGE_AFTER_ENV = "DEVOPS_ASSISTANT_HEDGE_AFTER"  # Seconds before a slow request is also sent to a second Ollama server
+DEFAULT_DOWNLOAD_DIR = "downloads"  # Local directory downloads are saved to; users can only pick subdirectories
+DOWNLOAD_BUTTON_LIMIT = 200 * 1024 * 1024  # Larger downloads are only saved, not offered to the browser
+HISTORY_PAGE_SIZE = 20  # History entries per page
+HISTORY_CHART_HOURS = 7 * 24  # Hours of cache hit rate shown in the history insights
+TELEMETRY_WINDOWS = {"15 minutes": 15 * 60, "1 hour": 60 * 60}  # Time ranges offered for the telemetry charts
+
+# Streamlit reruns this script on every interaction; these wrappers keep network
+# lookups and client construction out of the rerun path.
+@st.cache_data(ttl=MODEL_LIST_TTL, show_spinner=False)
+def _fetch_model_list(ollama_url):
+    # With several servers, list every model any reachable one has; fail only if none answers.
+    models, error = {}, None
+    for url in parse_ollama_urls(ollama_url):
+        try:
+            with span("ollama_tags"):
+                response = requests.get(f"{url}/api/tags", timeout=OLLAMA_REQUEST_TIMEOUT)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            error = e
+            continue
+        for model in response.json()["models"]:
+            models.setdefault(model["name"], model)
+    if not models and error is not None:
+        raise error
+    return list(models.values())
+
+@st.cache_data(ttl=IP_LOOKUP_TTL, show_spinner=False)
+def cached_local_ip():
+    return get_local_ip()
+
+@st.cache_data(ttl=IP_LOOKUP_TTL, show_spinner=False)
+def cached_public_ip():
+    return get_public_ip()
+
+@st.cache_resource(ttl=LLM_CLIENT_TTL, show_spinner=False)
+def cached_llm(model_name, ollama_url):
+    hedge_after = os.environ.get(HEDGE_AFTER_ENV)
+    return connect_to_llm(model_name, ollama_url, hedge_after=float(hedge_after) if hedge_after else None)
+
+@st.cache_resource(show_spinner=False)
+def metrics_exporter(port):
+    # Cached so the exporter is started once per process, not on every rerun.
+    return start_metrics_server(port)
 
 # Function to fetch available models from the Ollama API
 def fetch_models(ollama_url):
     try:
-        response = requests.get(f"{ollama_url}/api/tags")
-        if response.status_code == 200:
-            return response.json()["models"]
-        else:
-            st.error(f"Failed to fetch models. Status code: {response.status_code}")
-            return []
+        return _fetch_model_list(ollama_url)
+    except requests.HTTPError as e:
+        st.error(f"Failed to fetch models. Status code: {e.response.status_code}")
+        return []
     except Exception as e:
         st.error(f"Invali Ollama URL. Error: {e}")
         return []
 
+def render_diagnostics():
+    """Show per-stage latency percentiles, counters and the spans of the last request."""
+    with st.sidebar.expander("📈 Diagnostics"):
+        rows = []
+        for name, series in metrics.histogram_summaries().items():
+            for labels, summary in series.items():
+                label = ", ".join(f"{k}={v}" for k, v in labels)
+                rows.append({
+                    "metric": name.split("_", 2)[-1] + (f" [{label}]" if label else ""),
+                    "count": int(summary["count"]),
+                    "p50 ms": round(1000 * summary["p50"], 1),
+                    "p95 ms": round(1000 * summary["p95"], 1),
+                    "p99 ms": round(1000 * summary["p99"], 1),
+                })
+        engine_stats = engine.default_engine.stats()
+        st.caption(f"Engine: {engine_stats['in_flight']} in flight, {engine_stats['queued']} queued, "
+                   f"{engine_stats['rejected']} rejected, {engine_stats['cancelled']} cancelled")
+        cache_stats = result_cache.stats()
+        st.caption(f"Result cache: {cache_stats['entries']} entries, {cache_stats['hit_rate']:.0%} hit rate, "
+                   f"{cache_stats['invalidations']} invalidations, {cache_stats['saved_seconds']:.1f}s saved")
+        backends = backend_status()
+        if backends:
+            st.dataframe(backends, hide_index=True)
+        if not rows:
+            st.caption("No requests measured yet.")
+            return
+        st.dataframe(rows, hide_index=True)
+        for name, series in metrics.counter_values().items():
+            for labels, value in series.items():
+                label = ", ".join(f"{k}={v}" for k, v in labels)
+                st.caption(f"{name.split('_', 2)[-1]}{f' [{label}]' if label else ''}: {value:g}")
+        if metrics.recent_traces:
+            last = metrics.recent_traces[-1]
+            st.write(f"Last request: {last['duration'] * 1000:.0f} ms")
+            st.dataframe([{"span": s["name"], "ms": round(1000 * s["duration"], 1)} for s in last["spans"]],
+                         hide_index=True)
+
+@st.fragment(run_every=DEFAULT_SAMPLE_INTERVAL)
+def render_telemetry(host):
+    """Live charts of the connected host's samples; reruns on its own every sample interval."""
+    st.header("📊 Host Telemetry")
+    window = st.selectbox("Time range", list(TELEMETRY_WINDOWS), key="telemetry_window")
+    timestamps, rows = host.window(TELEMETRY_WINDOWS[window])
+    if not len(timestamps):
+        st.caption(f"Waiting for the first sample of {host.key}...")
+        return
+    data = []
+    for timestamp, row in zip(timestamps, rows.tolist()):
+        sample = {"time": datetime.fromtimestamp(timestamp)}
+        sample.update((field, None if math.isnan(value) else value) for field, value in zip(FIELDS, row))
+        for field in ("disk_read_bps", "disk_write_bps"):
+            sample[field] = sample[field] / 1e6 if sample[field] is not None else None
+        data.append(sample)
+    usage, load, disk_io = st.columns(3)
+    usage.caption("Usage %")
+    usage.line_chart(data, x="time", y=["cpu_percent", "iowait_percent", "mem_percent", "swap_percent", "disk_percent"])
+    load.caption("Load average")
+    load.line_chart(data, x="time", y=["load1", "load5", "load15"])
+    disk_io.caption("Disk I/O MB/s")
+    disk_io.line_chart(data, x="time", y=["disk_read_bps", "disk_write_bps"])
+    st.caption(f"{host.key}: {host.samples} samples this run, every {host.interval}s.")
+
+def render_cached_age(result):
+    """Note that a command result was served from the result cache, and how old it is."""
+    if result.get("cached"):
+        st.caption(f"♻️ Cached result from {result['age']:.0f}s ago. Tick 'Force refresh' to run it again.")
+
+def session_outputs():
+    """This session's bounded store of command results."""
+    if "outputs" not in st.session_state:
+        st.session_state["outputs"] = SessionOutputs()
+    return st.session_state["outputs"]
+
+@st.fragment
+def render_stored_output(output, key):
+    """Show a stored output as a head/tail preview; the rest is paged or downloaded on request."""
+    if output.closed:
+        st.caption("Output dropped to keep this session within its memory budget.")
+        return
+    if output.line_count <= 2 * DEFAULT_PREVIEW_LINES and output.size <= DEFAULT_PREVIEW_BYTES:
+        st.code(output.text(), language="bash")
+        return
+    st.caption(f"{output.line_count:,} lines, {output.size / 1e6:.2f} MB" + (", kept on disk" if output.spilled else ""))
+    # Widgets inside a fragment only rerun the fragment, so paging does not run the commands again.
+    if st.toggle("Show all lines", key=f"{key}-all"):
+        pages = output.page_count(DEFAULT_PAGE_LINES)
+        page = st.number_input(f"Page (of {pages:,}, {DEFAULT_PAGE_LINES} lines each)", min_value=1,
+                               max_value=pages, key=f"{key}-page") if pages > 1 else 1
+        st.code(output.page(page - 1, DEFAULT_PAGE_LINES), language="bash")
+    else:
+        st.code(output.preview(), language="bash")
+    # The output is only read back when the button is clicked.
+    st.download_button("💾 Full output", output.text, file_name=f"{key}.txt", mime="text/plain",
+                       key=f"{key}-download", on_click="ignore")
+
+def render_result(result, key):
+    """One stored command result: its output plus cache, error, truncation and timeout notes."""
+    render_stored_output(result["output"], key)
+    render_cached_age(result)
+    if result.get("error"):
+        st.error(f"Error: {result.get('error')}")
+    if result.get("truncated"):
+        st.warning("Output truncated.")
+    if result.get("timed_out"):
+        st.warning("Command timed out.")
+
+def render_host_result(host_result, key):
+    """One fleet host's stored results in an expander titled with its status."""
+    icon = {"success": "✅", "failed": "❌", "timeout": "⏱️"}.get(host_result["status"], "•")
+    with st.expander(f"{icon} {host_result['host']} ({host_result['elapsed']:.1f}s)"):
+        if host_result.get("error"):
+            st.error(host_result["error"])
+        for i, result in enumerate(host_result["results"], start=1):
+            st.write(f"**Command {i}:**")
+            render_result(result, f"{key}-{i}")
+
+def render_fleet(response, hosts, password, max_workers, host_timeout, run, refresh=False):
+    """Execute the response on every fleet host and show per-host results as they complete."""
+    st.write(f"🌐 Running on {len(hosts)} host(s)...")
+    progress = st.progress(0.0)
+    counters = st.empty()
+    host_results = []
+    for host_result in iter_fleet_results(hosts, response, password, int(max_workers), float(host_timeout), refresh):
+        host_result = session_outputs().keep(run, host_result)
+        host_results.append(host_result)
+        progress.progress(len(host_results) / len(hosts))
+        counts = summarize_fleet(host_results)
+        counters.write(f"✅ {counts['success']} succeeded · ❌ {counts['failed']} failed · ⏱️ {counts['timeout']} timed out")
+        render_host_result(host_result, f"output-{run['id']}-{len(host_results)}")
+    render_fleet_summary(host_results)
+
+def render_fleet_summary(host_results):
+    counts = summarize_fleet(host_results)
+    st.write("📊 Fleet Summary:")
+    total, succeeded, failed, timed_out = st.columns(4)
+    total.metric("Hosts", counts["total"])
+    succeeded.metric("Succeeded", counts["success"])
+    failed.metric("Failed", counts["failed"])
+    timed_out.metric("Timed out", counts["timeout"])
+    with st.expander("Full summary"):
+        st.text(generate_command_summary(preview_results(host_results)))
+
+def render_command_results(run):
+    """The stored results of one single-host run, with previews in the full summary."""
+    st.write("📊 Command Execution Summary:")
+    for i, result in enumerate(run["results"], start=1):
+        st.write(f"**Command {i}:**")
+        render_result(result, f"output-{run['id']}-{i}")
+    with st.expander("Full summary"):
+        st.text(generate_command_summary(preview_results(run["results"])))
+
+def render_recent_results(exclude=None):
+    """Reopen the results of an earlier question from this session's bounded result store."""
+    outputs = session_outputs()
+    runs = [run for run in reversed(outputs.runs) if run["id"] != exclude]
+    if not runs:
+        return
+    st.header("🗂️ Recent Results")
+    labels = {run["id"]: f"{datetime.fromtimestamp(run['started']):%H:%M:%S} · {run['question']}" for run in runs}
+    run_id = st.selectbox("Question", list(labels), format_func=labels.get, key="recent_run")
+    run = outputs.get(run_id)
+    if run is None:
+        return
+    st.code(run["response"], language="bash")
+    if run["fleet"]:
+        for i, host_result in enumerate(run["results"], start=1):
+            render_host_result(host_result, f"output-{run['id']}-{i}")
+        render_fleet_summary(run["results"])
+    else:
+        render_command_results(run)
+    st.caption(f"This session keeps its last {outputs.max_runs} questions' results: "
+               f"{outputs.memory_bytes() / 1e6:.1f} MB in memory, {outputs.disk_bytes() / 1e6:.1f} MB on disk.")
+
+def download_directory(subdirectory):
+    """
+    Resolve a user-supplied subdirectory of ``DEFAULT_DOWNLOAD_DIR``.
+
+    Returns None for absolute paths, ``..`` components, or paths that leave the
+    download directory through a symlink, so the web UI cannot write elsewhere on this host.
+    """
+    subdirectory = subdirectory.strip()
+    if os.path.isabs(subdirectory) or os.path.splitdrive(subdirectory)[0] \
+            or ".." in subdirectory.replace("\\", "/").split("/"):
+        return None
+    root = os.path.realpath(DEFAULT_DOWNLOAD_DIR)
+    path = os.path.realpath(os.path.join(root, subdirectory))
+    if path != root and not path.startswith(root + os.sep):
+        return None
+    return path
+
+def file_reader(path):
+    """A no-argument callable that reads ``path``, so a download button loads the file only when clicked."""
+    def read():
+        with open(path, "rb") as f:
+            return f.read()
+    return read
+
+def render_transfer_progress(transfers):
+    """Run ``transfer_files`` with one progress bar per file, showing throughput as it goes."""
+    names = [t["source"] if isinstance(t["source"], str) else t["source"].name for t in transfers]
+    bars = [st.progress(0.0, text=name) for name in names]
+    started = {}
+
+    def update(index, done, total):
+        begun, initial = started.setdefault(index, (time.monotonic(), done))
+        elapsed = time.monotonic() - begun
+        rate = (done - initial) / elapsed if elapsed > 0 else 0.0
+        bars[index].progress(done / total if total else 1.0,
+                             text=f"{names[index]}: {done / 1e6:.1f} / {total / 1e6:.1f} MB · {rate / 1e6:.1f} MB/s")
+
+    return transfer_files(st.session_state['ssh'], transfers, max_workers=DEFAULT_TRANSFER_WORKERS,
+                          on_progress=update, resume=st.session_state.get('transfer_resume', True),
+                          compress=st.session_state.get('transfer_compress', False))
+
+def render_transfer_results(results):
+    for result in results:
+        if result["error"]:
+            st.error(result["error"])
+            continue
+        resumed = f", resumed at {result['resumed_from'] / 1e6:.1f} MB" if result["resumed_from"] else ""
+        st.write(f"✅ {result['source']} → {result['destination']}: {result['bytes'] / 1e6:.1f} MB in "
+                 f"{result['elapsed']:.1f}s ({result['throughput'] / 1e6:.1f} MB/s{resumed})")
+
+def render_file_transfer():
+    """Upload files to and download files from the connected server over SFTP."""
+    with st.expander("📁 File Transfer"):
+        st.checkbox("Compress in transit (gzip on the server)", key="transfer_compress")
+        st.checkbox("Resume partial transfers", value=True, key="transfer_resume")
+        upload_tab, download_tab = st.tabs(["⬆️ Upload", "⬇️ Download"])
+        with upload_tab:
+            files = st.file_uploader("Files to upload", accept_multiple_files=True)
+            remote_dir = st.text_input("Remote directory", "/tmp/")
+            destination = remote_dir.rstrip("/") + "/"
+            uploads = [{"direction": "upload", "source": f, "destination": destination, "size": f.size}
+                       for f in files or []]
+            duplicates = duplicate_destinations(uploads)
+            if duplicates:
+                st.error(f"More than one file would be written to {', '.join(duplicates)}")
+            if st.button("Upload", disabled=not files or bool(duplicates)):
+                render_transfer_results(render_transfer_progress(uploads))
+        with download_tab:
+            remote_paths = st.text_area("Remote files", placeholder="One path per line, e.g. /var/log/syslog")
+            subdirectory = st.text_input(f"Save to subdirectory of {DEFAULT_DOWNLOAD_DIR}/", "",
+                                         placeholder="Leave empty to save there directly")
+            paths = [p.strip() for p in remote_paths.splitlines() if p.strip()]
+            local_dir = download_directory(subdirectory)
+            unnamed = [p for p in paths if posixpath.basename(p) in ("", ".", "..")]
+            if local_dir is None:
+                st.error(f"Pick a relative subdirectory without '..', inside {DEFAULT_DOWNLOAD_DIR}/.")
+            if unnamed:
+                st.error(f"Not a file path: {', '.join(unnamed)}")
+            downloads = [{"direction": "download", "source": p,
+                          "destination": os.path.join(local_dir, posixpath.basename(p))}
+                         for p in paths] if local_dir is not None else []
+            duplicates = duplicate_destinations(downloads)
+            if duplicates:
+                st.error(f"More than one remote file would be saved as {', '.join(duplicates)}; "
+                         f"download them into different subdirectories.")
+            if st.button("Download", disabled=not paths or local_dir is None or bool(unnamed) or bool(duplicates)):
+                os.makedirs(local_dir, exist_ok=True)
+                results = render_transfer_progress(downloads)
+                render_transfer_results(results)
+                for result in results:
+                    if not result["error"] and result["bytes"] <= DOWNLOAD_BUTTON_LIMIT:
+                        st.download_button(f"💾 {os.path.basename(result['destination'])}",
+                                           file_reader(result["destination"]),
+                                           file_name=os.path.basename(result["destination"]),
+                                           key=f"download-{result['destination']}", on_click="ignore")
+
 # Define the main function for the Streamlit app
 def main():
     ssh = None
+    model = None
     st.set_page_config(page_title="DevOps Assistant", page_icon="🤖", layout="wide")
     st.title("🤖 DevOps Assistant")
     st.markdown("Welcome to the DevOps Assistant! Connect to your server and LLM model to get started.")
+    if os.environ.get(METRICS_PORT_ENV):
+        metrics_exporter(int(os.environ[METRICS_PORT_ENV]))
     # Sidebar for Ollama server URL and model selection
     st.sidebar.header("🔧 Configuration")
-    server_host = get_local_ip()
+    server_host = cached_local_ip()
     st.sidebar.write(f"Server Host: {server_host}")
-    ip_host = get_public_ip()
+    ip_host = cached_public_ip()
     st.sidebar.write(f"Public IP: {ip_host}")
     # Initialize ollama_url as None or an empty string
-    ollama_url = st.sidebar.text_input("Ollama Server URL", placeholder="Enter Ollama Server URL (e.g., http://your-ollama-server:11434)")
+    ollama_url = st.sidebar.text_input("Ollama Server URL", placeholder="Enter Ollama Server URL (e.g., http://your-ollama-server:11434); separate several with commas")
     if ollama_url:
         models = fetch_models(ollama_url)
     else:
@@ -41,10 +378,15 @@ def main():
         selected_model = None
 
     if selected_model:
-        model = connect_to_llm(selected_model, ollama_url)
+        model = cached_llm(selected_model, ollama_url)
         st.success(f"Connected to {selected_model} on Ollama Server at {ollama_url}")
     else:
         st.warning("No model selected. Please select a model from the dropdown menu.")
+    cache_stats = semantic_cache.stats()
+    st.sidebar.caption(
+        f"Semantic cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses, "
+        f"{cache_stats['avg_lookup_ms']:.1f} ms avg lookup"
+    )
 
    # Sidebar for server connection details
     st.sidebar.header("🔐 Server Connection")
@@ -62,13 +404,20 @@ def main():
                     ssh = connect_to_server(ip, username, password)
                     if ssh:
                         st.sidebar.success("✅ Connected to the server!")
+                        if st.session_state.get('ssh') is not None:
+                            st.session_state['ssh'].close()
                         st.session_state['ssh'] = ssh
                     else:
                         st.sidebar.error("❌ Failed to connect to the server.")
                 except Exception as e:
                     st.sidebar.error(f"❌ An error occurred while connecting to the server: {e}")
+    host_telemetry = None
     if 'ssh' in st.session_state and st.session_state['ssh'] is not None:
         st.sidebar.write(f"Connected to server: {ip}")
+        if st.sidebar.checkbox("📊 Live telemetry", value=True, key="telemetry",
+                               help="Sample CPU, memory and disk in the background, chart them and answer "
+                                    "health questions from the samples without asking the model"):
+            host_telemetry = telemetry.watch(st.session_state['ssh'])
     else:
         st.sidebar.write("Not connected to the server.")
 
@@ -82,72 +431,199 @@ def main():
     #             except Exception as e:
     #                 st.error(f"Failed to switch to root user: {e}")
 
-    # Button to switch to root user
+    # Persistent shell: one PTY shell per connection keeps cd, variables and root across commands
+    interactive = False
     if 'ssh' in st.session_state and st.session_state['ssh'] is not None:
         st.sidebar.header("🛠️ Root Access")
-        if st.sidebar.button("🔑 Switch to Root User"):
+        interactive = st.sidebar.checkbox("🐚 Persistent shell", key="interactive_shell",
+                                          help="Run commands in one long-lived shell so cd, exported variables "
+                                               "and root access carry over between commands")
+        shell = st.session_state.get('shell')
+        if interactive and (shell is None or shell.ssh is not st.session_state['ssh']):
+            st.session_state['shell'] = ShellSession(st.session_state['ssh'])
+        elif not interactive and shell is not None:
+            shell.close()
+            st.session_state['shell'] = None
+        if st.session_state.get('shell') is not None and st.session_state['shell'].root:
+            st.sidebar.write("Running as root.")
+        if st.sidebar.button("🔑 Switch to Root User", disabled=not interactive,
+                             help="Needs a persistent shell, otherwise the root shell exits right away"):
             with st.spinner("Switching to root user..."):
                 try:
-                    if st.session_state['ssh'] is None:
-                        st.error("SSH connection is not established. Please connect to the server first.")
-                    else:
-                        become_root_user(st.session_state['ssh'], password)
-                        st.success("Successfully switched to root user!")
+                    become_root_user(st.session_state['shell'], password)
+                    st.success("Successfully switched to root user!")
                 except Exception as e:
                     st.error(f"Failed to switch to root user: {e}")
 
     # Disconnect from the server
     if st.sidebar.button("🚫 Disconnect from Server"):
         if 'ssh' in st.session_state and st.session_state['ssh'] is not None:
+            if st.session_state.get('shell') is not None:
+                st.session_state['shell'].close()
+                st.session_state['shell'] = None
             st.session_state['ssh'].close()
             st.session_state['ssh'] = None
             st.sidebar.success("Disconnected from the server.")
         else:
             st.sidebar.warning("Not connected to the server.")
+    # Sidebar for fleet mode
+    st.sidebar.header("🌐 Fleet Mode")
+    fleet_mode = st.sidebar.checkbox("Run on a fleet of hosts")
+    fleet_hosts = []
+    if fleet_mode:
+        host_text = st.sidebar.text_area("Hosts", placeholder="One [user@]host[:port] per line")
+        inventory = st.sidebar.file_uploader("Inventory file", type=["ini", "txt", "cfg", "hosts"])
+        if inventory is not None:
+            host_text = f"{host_text}\n{inventory.getvalue().decode()}"
+        try:
+            fleet_hosts = parse_host_list(host_text, default_username=username)
+        except InvalidHostListError as e:
+            st.sidebar.error(str(e))
+        fleet_workers = st.sidebar.number_input("Parallel hosts", min_value=1, max_value=256, value=DEFAULT_FLEET_WORKERS)
+        fleet_timeout = st.sidebar.number_input("Per-host timeout (s)", min_value=5, max_value=3600, value=DEFAULT_HOST_TIMEOUT)
+        st.sidebar.write(f"{len(fleet_hosts)} host(s) in fleet.")
+
     # Main content area
     st.header("💬 Ask a Question")
     question = st.text_input("Enter your question:", placeholder="e.g., How do I check disk usage on Linux?")
+    refresh = st.checkbox("🔄 Force refresh", help="Run read-only commands again instead of reusing cached results")
 
+    current_run = None
     if st.button("🚀 Submit"):
+        health_answer = None if fleet_mode else answer_health_question(question, host_telemetry)
         if not question:
             st.error("Please enter a question.")
+        elif health_answer is not None:
+            st.markdown(health_answer)
+            st.caption("Answered from live telemetry. Untick '📊 Live telemetry' to ask the model instead.")
         # elif 'ssh' not in st.session_state or 'model' not in st.session_state:
         elif model is None:
             st.error("Please connect to both the server and the LLM model first.")
         else:
-            with st.spinner("Processing your question..."):
+            with st.spinner("Processing your question..."), trace("question", fleet=fleet_mode):
                 try:
-                    response = ask_question_to_model(model, question)
+                    partial_commands = st.empty()
+                    response = engine.ask_question_to_model(
+                        model, question,
+                        on_partial=lambda commands: partial_commands.code(commands, language="bash"),
+                    )
+                    partial_commands.empty()
                     if response:
                         st.write("📝 Response from the model:")
                         st.code(response, language="bash")
-                        try:
-                            results = extract_and_execute_commands(response, st.session_state['ssh'])
-                            st.success("✅ Command execution completed.")
-                            st.write("📊 Command Execution Summary:")
-                            for i, result in enumerate(results, start=1):
-                                st.write(f"**Command {i}:**")
-                                st.code(result.get("output", "No output"), language="bash")
-                                if result.get("error"):
-                                    st.error(f"Error: {result.get('error')}")
-                        except Exception as e:
-                            st.error(f"❌ An error occurred while executing commands: {e}")
+                        if fleet_mode:
+                            if not fleet_hosts or not password:
+                                st.error("Please provide fleet hosts and a password.")
+                            else:
+                                current_run = session_outputs().new_run(question, response, fleet=True)
+                                render_fleet(response, fleet_hosts, password, fleet_workers, fleet_timeout,
+                                             current_run, refresh)
+                        else:
+                            try:
+                                st.write("📡 Live output:")
+                                live_output = st.empty()
+                                live_lines = deque(maxlen=LIVE_OUTPUT_LINES)
+                                pending = {}
+
+                                def render_output(command, stream, data):
+                                    # Render complete lines as they arrive; keep each command's partial tail for its next chunk.
+                                    lines = (pending.get(command, "") + data).split("\n")
+                                    pending[command] = lines.pop()
+                                    if lines:
+                                        live_lines.extend(lines)
+                                        live_output.code("\n".join(live_lines), language="bash")
+
+                                results = engine.extract_and_execute_commands(response, st.session_state['ssh'], on_output=render_output,
+                                                                     refresh=refresh,
+                                                                     shell=st.session_state.get('shell') if interactive else None)
+                                live_lines.extend(tail for tail in pending.values() if tail)
+                                if live_lines:
+                                    live_output.code("\n".join(live_lines), language="bash")
+                                st.success("✅ Command execution completed.")
+                                # Outputs move into the session's bounded store; only previews are rendered.
+                                current_run = session_outputs().new_run(question, response)
+                                for result in results:
+                                    session_outputs().keep(current_run, result)
+                                render_command_results(current_run)
+                            except Exception as e:
+                                st.error(f"❌ An error occurred while executing commands: {e}")
                     else:
                         st.error("❌ No response from the model.")
                 except Exception as e:
                     st.error(f"❌ An error occurred while asking the question: {e}")
 
-    # # Display command history
-    # st.header("📜 Command History")
-    # history = get_command_history()
-    # if history:
-    #     for entry in history:
-    #         st.write(f"**Question:** {entry[1]}")
-    #         st.code(entry[2], language="bash")
-    #         st.write(f"**Timestamp:** {entry[3]}")
-    #         st.write("---")
-    # else:
-    #     st.write("No command history available.")
+    if not fleet_mode and host_telemetry is not None:
+        render_telemetry(host_telemetry)
+
+    if not fleet_mode and st.session_state.get('ssh') is not None:
+        render_file_transfer()
+
+    render_recent_results(exclude=current_run["id"] if current_run else None)
+
+    render_diagnostics()
+
+    render_history()
+
+def render_history_insights():
+    """Most frequent questions, cache hit rate per hour and slowest commands, read from the summary tables."""
+    st.subheader("Most frequent questions")
+    questions = get_frequent_questions()
+    if questions:
+        st.dataframe([{"question": q, "asked": asks, "last asked": last} for q, asks, last in questions],
+                     hide_index=True)
+    else:
+        st.caption("No questions asked yet.")
+
+    st.subheader("Cache hit rate")
+    rates = {}
+    for bucket, tier, hits, misses in get_cache_hit_rates(since=time.time() - HISTORY_CHART_HOURS * 3600):
+        hour = rates.setdefault(bucket, {"hour": datetime.fromtimestamp(bucket)})
+        hour[tier] = hits / (hits + misses) if hits + misses else None
+    if rates:
+        st.line_chart(list(rates.values()), x="hour")
+    else:
+        st.caption("No cache lookups recorded yet.")
+
+    st.subheader("Slowest commands")
+    commands = get_slowest_commands()
+    if commands:
+        st.dataframe([{"command": command, "runs": runs, "failures": failures,
+                       "mean s": round(mean, 2), "max s": round(longest, 2),
+                       "last run": datetime.fromtimestamp(last_run)}
+                      for command, runs, failures, mean, longest, last_run in commands], hide_index=True)
+    else:
+        st.caption("No commands run yet.")
+
+def render_history():
+    """Searchable command history, one page at a time, plus insights from the summary tables."""
+    st.header("📜 Command History")
+    history_tab, insights_tab = st.tabs(["History", "Insights"])
+    with history_tab:
+        query = st.text_input("Search questions and responses", key="history_query")
+        # Ids where each page visited so far starts; the last one is the current page.
+        if st.session_state.get("history_search") != query:
+            st.session_state["history_search"] = query
+            st.session_state["history_pages"] = [None]
+        pages = st.session_state["history_pages"]
+        # One row more than a page tells whether there is an older page.
+        rows = search_command_history(query, limit=HISTORY_PAGE_SIZE + 1, before_id=pages[-1])
+        entries = rows[:HISTORY_PAGE_SIZE]
+        if not entries:
+            st.write("No matching history." if query else "No command history available.")
+        for entry_id, question, response, timestamp in entries:
+            with st.expander(f"{timestamp} · {question}"):
+                st.code(response, language="bash")
+
+        newer, page_label, older = st.columns([1, 2, 1])
+        if newer.button("◀ Newer", disabled=len(pages) == 1, key="history_newer"):
+            pages.pop()
+            st.rerun()
+        page_label.caption(f"Page {len(pages)}")
+        if older.button("Older ▶", disabled=len(rows) <= HISTORY_PAGE_SIZE, key="history_older"):
+            pages.append(entries[-1][0])
+            st.rerun()
+    with insights_tab:
+        render_history_insights()
 
 # Run the Streamlit app
 if __name__ == "__main__":